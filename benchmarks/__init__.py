@@ -0,0 +1 @@
+'''Benchmarks for scanning and serving include graphs.'''
@@ -0,0 +1,285 @@
+'''Generates synthetic C++ trees to benchmark ig on.'''
+
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import os
+import random
+
+log = logging.getLogger(__name__)
+
+# Written into the root of every generated tree, so it can be reused
+MANIFEST = 'manifest.json'
+
+# Headers every file may include that are not part of the tree
+SYSTEM_HEADERS = ('vector', 'string', 'memory', 'map', 'algorithm', 'cstdint')
+
+# The share of files that are headers (the rest are sources)
+HEADER_SHARE = 0.6
+
+# The (average) number of files per directory
+FILES_PER_DIRECTORY = 16
+
+
+def add_arguments(parser):
+    '''
+    Adds the options describing the shape of a tree to a parser.
+
+    Args:
+        parser: The `argparse.ArgumentParser` to extend
+    '''
+    parser.add_argument('--files',
+                        type=int,
+                        default=2000,
+                        help='The number of files (headers and sources)')
+    parser.add_argument('--fan-out',
+                        type=int,
+                        default=8,
+                        help='The number of files of the tree every file '
+                             'includes (at most)')
+    parser.add_argument('--depth',
+                        type=int,
+                        default=3,
+                        help='The depth of the directories under every '
+                             'prefix')
+    parser.add_argument('--prefixes',
+                        type=int,
+                        default=4,
+                        help='The number of libraries, each with its own '
+                             'include path')
+    parser.add_argument('--cycles',
+                        type=int,
+                        default=10,
+                        help='The number of back edges between headers, each '
+                             'closing an include cycle')
+    parser.add_argument('--lines',
+                        type=int,
+                        default=40,
+                        help='The number of lines of code after the includes '
+                             'of every file')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0,
+                        help='The seed of the random generator, to make the '
+                             'tree reproducible')
+
+
+def parameters(args):
+    '''
+    Returns:
+        The parameters of a tree from parsed arguments, as a dictionary.
+    '''
+    return dict(files=args.files,
+                fan_out=args.fan_out,
+                depth=args.depth,
+                prefixes=args.prefixes,
+                cycles=args.cycles,
+                lines=args.lines,
+                seed=args.seed)
+
+
+def directory_path(index, count, depth):
+    '''
+    Spreads directories evenly over a tree of a given depth.
+
+    Args:
+        index: The index of the directory
+        count: The total number of directories
+        depth: The depth of the tree
+
+    Returns:
+        The list of path components of the directory.
+    '''
+    if depth <= 0:
+        return []
+    branching = 2
+    while branching ** depth < count:
+        branching += 1
+    components = []
+    for _ in range(depth):
+        index, digit = divmod(index, branching)
+        components.append('d{0}'.format(digit))
+    return list(reversed(components))
+
+
+def write_file(path, includes, lines, guard=None):
+    '''
+    Writes a C++ file with some includes and some filler code.
+
+    Args:
+        path: The path of the file
+        includes: A list of include directives, e.g. '<vector>' or '"a.hpp"'
+        lines: The number of lines of code after the includes
+        guard: The name of an include guard to wrap the file in, if any
+    '''
+    text = ['// Generated by benchmarks.generate']
+    if guard is not None:
+        text.extend(['#ifndef ' + guard, '#define ' + guard, ''])
+    text.extend('#include ' + include for include in includes)
+    text.extend(['', 'namespace bench {', ''])
+    for line in range(lines):
+        text.append('int f{0}(int x) {{ return x * {0} + 1; }}'.format(line))
+    text.extend(['', '}  // namespace bench'])
+    if guard is not None:
+        text.extend(['', '#endif  // ' + guard])
+    text.append('')
+
+    with open(path, 'w') as destination:
+        destination.write('\n'.join(text))
+
+
+def generate(root,
+             files=2000,
+             fan_out=8,
+             depth=3,
+             prefixes=4,
+             cycles=10,
+             lines=40,
+             seed=0):
+    '''
+    Generates a synthetic C++ tree.
+
+    The tree consists of `prefixes` libraries, each with headers under
+    `libN/include/libN/` (so `libN/include` is its include path) and sources
+    under `libN/src/`, spread over directories `depth` levels deep. Headers
+    only include headers generated before them, so that the graph is acyclic
+    except for `cycles` deliberate back edges. Includes are a mix of angle
+    includes resolved via the include paths, quoted includes relative to the
+    including file and system headers that are not found.
+
+    The same arguments always produce the same tree.
+
+    Args:
+        root: The directory to generate the tree in (created if necessary)
+        files: The number of files (headers and sources)
+        fan_out: The number of files of the tree every file includes (at most)
+        depth: The depth of the directories under every prefix
+        prefixes: The number of libraries, each with its own include path
+        cycles: The number of back edges closing include cycles
+        lines: The number of lines of code after the includes of every file
+        seed: The seed of the random generator
+
+    Returns:
+        The manifest of the tree, a dictionary of the parameters, the root,
+        the include paths and the number of headers and sources.
+    '''
+    generator = random.Random(seed)
+    root = os.path.realpath(root)
+    prefixes = max(1, prefixes)
+    header_count = max(1, int(files * HEADER_SHARE))
+    source_count = max(0, files - header_count)
+    directory_count = max(1, files // (FILES_PER_DIRECTORY * prefixes))
+
+    def place(index, kind):
+        library = index % prefixes
+        directory = directory_path(generator.randrange(directory_count),
+                                   directory_count,
+                                   depth)
+        name = 'lib{0}'.format(library)
+        if kind == 'header':
+            base = [name, 'include', name]
+            filename = 'h{0}.hpp'.format(index)
+        else:
+            base = [name, 'src']
+            filename = 's{0}.cpp'.format(index)
+        return os.path.join(*(base + directory + [filename]))
+
+    headers = [place(index, 'header') for index in range(header_count)]
+    sources = [place(index, 'source') for index in range(source_count)]
+
+    def spelling(header, includer):
+        # Headers in the same directory are included with quotes
+        if os.path.dirname(header) == os.path.dirname(includer):
+            return '"{0}"'.format(os.path.basename(header))
+        # Strip libN/include/, which is the include path
+        return '<{0}>'.format(header.split(os.sep, 2)[2].replace(os.sep, '/'))
+
+    def pick(candidates):
+        count = min(fan_out, candidates)
+        return generator.sample(range(candidates), count)
+
+    edges = dict((index, pick(index)) for index in range(header_count))
+    # Back edges from early to later headers close cycles
+    for _ in range(cycles if header_count > 1 else 0):
+        target = generator.randrange(1, header_count)
+        source = generator.randrange(target)
+        if target not in edges[source]:
+            edges[source].append(target)
+
+    for index, path in enumerate(headers):
+        includes = [spelling(headers[h], path) for h in edges[index]]
+        includes.append('<{0}>'.format(generator.choice(SYSTEM_HEADERS)))
+        full_path = os.path.join(root, path)
+        if not os.path.isdir(os.path.dirname(full_path)):
+            os.makedirs(os.path.dirname(full_path))
+        write_file(full_path,
+                   includes,
+                   lines,
+                   guard='BENCH_H{0}_HPP'.format(index))
+
+    for path in sources:
+        includes = [spelling(headers[h], path) for h in pick(header_count)]
+        includes.append('<{0}>'.format(generator.choice(SYSTEM_HEADERS)))
+        full_path = os.path.join(root, path)
+        if not os.path.isdir(os.path.dirname(full_path)):
+            os.makedirs(os.path.dirname(full_path))
+        write_file(full_path, includes, lines)
+
+    manifest = dict(parameters=dict(files=files,
+                                    fan_out=fan_out,
+                                    depth=depth,
+                                    prefixes=prefixes,
+                                    cycles=cycles,
+                                    lines=lines,
+                                    seed=seed),
+                    root=root,
+                    include_paths=[os.path.join(root,
+                                                'lib{0}'.format(library),
+                                                'include')
+                                   for library in range(prefixes)],
+                    headers=header_count,
+                    sources=source_count)
+    with open(os.path.join(root, MANIFEST), 'w') as destination:
+        json.dump(manifest, destination, indent=2, sort_keys=True)
+
+    log.debug('Generated %d headers and %d sources under %s',
+              header_count, source_count, root)
+
+    return manifest
+
+
+def load_manifest(root):
+    '''
+    Reads the manifest of a generated tree.
+
+    Args:
+        root: The root of the tree
+
+    Returns:
+        The manifest written by `generate()`, or None if there is none.
+    '''
+    try:
+        with open(os.path.join(root, MANIFEST)) as source:
+            return json.load(source)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate a synthetic C++ tree to benchmark ig on')
+    parser.add_argument('directory',
+                        help='The directory to generate the tree in')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    manifest = generate(args.directory, **parameters(args))
+    print('Generated {0} headers and {1} sources under {2}'.format(
+        manifest['headers'], manifest['sources'], manifest['root']))
+    print('Include paths: {0}'.format(' '.join(manifest['include_paths'])))
+
+
+if __name__ == '__main__':
+    main()
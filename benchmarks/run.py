@@ -0,0 +1,404 @@
+'''
+Benchmarks every stage of ig on a synthetic tree.
+
+The stages are run one after the other on the output of the previous one:
+
+    traversal      Finding the files to scan (`walk.glob`)
+    parsing        Reading files and extracting include directives
+    resolution     Resolving includes against the include paths
+    graph          Building the graph (`Graph.add`)
+    serialization  Turning the graph into JSON (`output.write_graph`)
+    write          Writing (and compressing) the served files
+    walk           The whole scan end to end (`walk.walk`), as ig runs it
+    cli            The command line end to end (`ig --json`), in a subprocess
+
+Every stage is timed several times and the fastest and median wall times are
+reported, followed by one more run that measures the peak memory allocated
+during the stage (with `tracemalloc`, where available, and not for the cli
+stage). Results are written as JSON and can be compared with --compare.
+
+All stages but the cli stage call into the internals of this version of ig, so
+they can only be compared between runs of this version and later ones. The cli
+stage only relies on the command line, so it can be run against any version of
+ig (with --ig) to compare across versions.
+'''
+
+from __future__ import print_function
+
+import argparse
+import collections
+import gc
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import ig
+from ig import api, graph, main as ig_main, output, serve, stats, walk
+
+from benchmarks import generate
+
+log = logging.getLogger(__name__)
+
+STAGES = ('traversal',
+          'parsing',
+          'resolution',
+          'graph',
+          'serialization',
+          'write',
+          'walk',
+          'cli')
+
+# The stages that run on the output of the one before, in this order
+PIPELINE = STAGES[:STAGES.index('write') + 1]
+
+# The root of the checkout of this version of ig
+IG_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(ig.__file__)))
+
+
+class Sink(object):
+    '''A file object that only counts what is written to it.'''
+
+    def __init__(self):
+        '''Constructor.'''
+        self.length = 0
+
+    def write(self, text):
+        self.length += len(text)
+
+
+class Benchmark(object):
+    '''
+    Runs the stages of ig on a generated tree.
+
+    Every stage is a method taking the result of the previous stage and
+    returning its own result, so that stages can be timed in isolation.
+    '''
+
+    def __init__(self, manifest, jobs=1, ig_root=IG_ROOT):
+        '''
+        Constructor.
+
+        Args:
+            manifest: The manifest of the tree, see `generate.generate()`
+            jobs: The number of processes to scan with in the walk stage
+            ig_root: The checkout of ig to run in the cli stage
+        '''
+        self.root = manifest['root']
+        arguments = [self.root]
+        for include_path in manifest['include_paths']:
+            arguments.extend(['-I', include_path])
+        # Only options every version of ig understands (so no --jobs)
+        self.command = [sys.executable, '-m', 'ig.main', '--json'] + arguments
+        self.environment = dict(os.environ, PYTHONPATH=ig_root)
+        self.args = ig_main.parse_arguments(arguments +
+                                            ['--jobs', str(jobs)])
+        self.settings = next(walk.sources(self.args))[0]
+
+    def traversal(self, _):
+        pattern = walk.compile_patterns(self.args.patterns)
+        return list(walk.glob(self.root, pattern))
+
+    def parsing(self, filenames):
+        results = []
+        for filename in filenames:
+            with open(filename, 'rb') as source:
+                contents = source.read()
+            results.append((filename, walk.extract_includes(contents)))
+        return results
+
+    def resolution(self, parsed):
+        # A fresh resolver, so that every run starts with empty memos
+        resolver = walk.Resolver()
+        prefixes = self.settings.prefixes
+        quote_prefixes = self.settings.quote_prefixes + prefixes
+        results = []
+        for filename, includes in parsed:
+            directory = os.path.dirname(filename)
+            resolved = set()
+            for quoted, path in includes:
+                if quoted:
+                    resolved.add(resolver.resolve(path,
+                                                  quote_prefixes,
+                                                  directory))
+                else:
+                    resolved.add(resolver.resolve(path, prefixes))
+            results.append((filename, sorted(resolved)))
+        return results
+
+    def graph(self, resolved):
+        include_graph = api.new_graph(self.args)
+        for filename, includes in resolved:
+            include_graph.add(filename, includes)
+        return include_graph
+
+    def serialization(self, include_graph):
+        sink = Sink()
+        output.write_graph(sink, include_graph)
+        return include_graph
+
+    def write(self, include_graph):
+        directory = tempfile.mkdtemp(prefix='ig-benchmark-')
+        try:
+            server = serve.Server(directory)
+            server.write(ig_main.make_settings(self.args), include_graph)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        return include_graph
+
+    def walk(self, _):
+        return api.build(self.args)
+
+    def cli(self, _):
+        with open(os.devnull, 'w') as sink:
+            subprocess.check_call(self.command,
+                                  stdout=sink,
+                                  env=self.environment)
+
+
+def measure(function, argument, repeat, traced=True):
+    '''
+    Times a stage and measures its peak memory.
+
+    Args:
+        function: The stage to run
+        argument: The input of the stage
+        repeat: The number of timed runs
+        traced: Whether to measure the peak memory, which is only possible
+                for stages that run in this process
+
+    Returns:
+        The result of the stage, along with a dictionary of the timings (in
+        seconds) and the peak memory (in bytes, or None if unavailable).
+    '''
+    times = []
+    result = None
+    for _ in range(max(1, repeat)):
+        gc.collect()
+        start = timeit.default_timer()
+        result = function(argument)
+        times.append(timeit.default_timer() - start)
+
+    peak = None
+    if traced and tracemalloc is not None:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            function(argument)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    times.sort()
+    return result, dict(min=times[0],
+                        median=times[len(times) // 2],
+                        runs=len(times),
+                        peak_memory=peak)
+
+
+def run(manifest, stages=STAGES, repeat=3, jobs=1, ig_root=IG_ROOT):
+    '''
+    Benchmarks the stages of ig on a generated tree.
+
+    Args:
+        manifest: The manifest of the tree, see `generate.generate()`
+        stages: The names of the stages to report (earlier stages of the
+                pipeline they depend on always run)
+        repeat: The number of timed runs of every stage
+        jobs: The number of processes to scan with in the walk stage
+        ig_root: The checkout of ig to run in the cli stage
+
+    Returns:
+        An ordered dictionary of the results of every stage.
+    '''
+    benchmark = Benchmark(manifest, jobs, ig_root)
+    results = collections.OrderedDict()
+    last = max([PIPELINE.index(s) for s in stages if s in PIPELINE] or [-1])
+    value = None
+    for stage in STAGES:
+        if stage not in stages:
+            if stage in PIPELINE and PIPELINE.index(stage) < last:
+                value = getattr(benchmark, stage)(value)
+            continue
+        log.info('Running %s', stage)
+        value, results[stage] = measure(getattr(benchmark, stage),
+                                        value,
+                                        repeat,
+                                        traced=stage != 'cli')
+        if isinstance(value, graph.Graph):
+            results[stage]['nodes'] = value.node_count
+            results[stage]['edges'] = value.edge_count
+        elif isinstance(value, list):
+            results[stage]['items'] = len(value)
+    return results
+
+
+def environment(ig_root=IG_ROOT):
+    '''
+    Args:
+        ig_root: The checkout of ig run in the cli stage
+
+    Returns:
+        A dictionary describing the versions the benchmark was run with.
+    '''
+    return dict(ig=ig.__version__,
+                ig_root=ig_root,
+                python=platform.python_version(),
+                implementation=platform.python_implementation(),
+                platform=platform.platform(),
+                cpus=os.cpu_count() if hasattr(os, 'cpu_count') else None)
+
+
+def print_table(stream, results, baseline=None):
+    '''
+    Prints the results as a table, optionally relative to a baseline.
+
+    Args:
+        stream: The file object to print to
+        results: The results of `run()`
+        baseline: The results of an earlier run to compare against, if any
+    '''
+    header = '{0:<14} {1:>10} {2:>10} {3:>12}'.format('stage',
+                                                      'min (s)',
+                                                      'median (s)',
+                                                      'peak memory')
+    if baseline is not None:
+        header += ' {0:>10} {1:>10}'.format('time', 'memory')
+    print(header, file=stream)
+    print('-' * len(header), file=stream)
+
+    for stage, result in results.items():
+        line = '{0:<14} {1:>10.4f} {2:>10.4f} {3:>12}'.format(
+            stage,
+            result['min'],
+            result['median'],
+            stats.format_bytes(result['peak_memory']))
+        old = (baseline or {}).get(stage)
+        if old is not None:
+            line += ' {0:>10} {1:>10}'.format(
+                ratio(result['min'], old['min']),
+                ratio(result['peak_memory'], old['peak_memory']))
+        print(line, file=stream)
+
+
+def ratio(new, old):
+    '''
+    Returns:
+        The ratio of a new to an old measurement, formatted (e.g. "0.85x").
+    '''
+    if not new or not old:
+        return '-'
+    return '{0:.2f}x'.format(float(new) / old)
+
+
+def parse_arguments(args):
+    '''
+    Parses the command line arguments of the benchmark.
+
+    Args:
+        args: The list of arguments passed to the command line
+
+    Returns:
+        The parsed arguments.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Benchmark the stages of ig on a synthetic C++ tree')
+    parser.add_argument('--tree',
+                        help='The directory of the tree. It is generated '
+                             'there unless it already holds a tree of the '
+                             'same shape. If not supplied, a temporary tree '
+                             'is generated and deleted afterwards.')
+    generate.add_arguments(parser)
+    parser.add_argument('--stage',
+                        action='append',
+                        dest='stages',
+                        choices=STAGES,
+                        help='A stage to benchmark (default: all)')
+    parser.add_argument('--repeat',
+                        type=int,
+                        default=3,
+                        help='The number of timed runs of every stage')
+    parser.add_argument('--jobs',
+                        type=int,
+                        default=1,
+                        help='The number of processes of the walk stage')
+    parser.add_argument('--output',
+                        help='A file to write the results (JSON) to')
+    parser.add_argument('--compare',
+                        metavar='PATH',
+                        help='The results of an earlier run (--output) to '
+                             'compare against. Only the cli stage is '
+                             'comparable with versions of ig before this '
+                             'benchmark; the others need this version or a '
+                             'later one')
+    parser.add_argument('--ig',
+                        metavar='CHECKOUT',
+                        default=IG_ROOT,
+                        dest='ig_root',
+                        help='A checkout of (any version of) ig to run in '
+                             'the cli stage, instead of this one')
+    parser.add_argument('-v', '--verbose',
+                        action='store_true',
+                        help='Turn on verbose output')
+    return parser.parse_args(args)
+
+
+def main():
+    args = parse_arguments(sys.argv[1:])
+    logging.basicConfig(format='[%(levelname)s] %(message)s',
+                        level=logging.DEBUG if args.verbose else logging.INFO)
+
+    shape = generate.parameters(args)
+    root = args.tree or tempfile.mkdtemp(prefix='ig-tree-')
+    try:
+        manifest = generate.load_manifest(root)
+        if manifest is None or manifest['parameters'] != shape:
+            log.info('Generating a tree of %d files under %s',
+                     args.files, root)
+            if manifest is not None:
+                shutil.rmtree(root)
+            manifest = generate.generate(root, **shape)
+        else:
+            log.info('Reusing the tree under %s', root)
+
+        results = run(manifest,
+                      args.stages or STAGES,
+                      args.repeat,
+                      args.jobs,
+                      os.path.abspath(args.ig_root))
+    finally:
+        if args.tree is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as source:
+            baseline = json.load(source)['stages']
+
+    print_table(sys.stdout, results, baseline)
+
+    if args.output is not None:
+        with open(args.output, 'w') as destination:
+            json.dump(dict(environment=environment(
+                               os.path.abspath(args.ig_root)),
+                           tree=shape,
+                           repeat=args.repeat,
+                           jobs=args.jobs,
+                           stages=results),
+                      destination,
+                      indent=2)
+        log.info('Wrote results to %s', args.output)
+
+
+if __name__ == '__main__':
+    main()
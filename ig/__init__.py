@@ -6,3 +6,14 @@ __version__ = '0.1.9'
 __author__ = 'Peter Goldsborough'
 __license__ = 'MIT'
 __copyright__ = 'Copyright {0} Peter Goldsborough'.format(date.today().year)
+
+
+def scan(directories=(), **options):
+    '''
+    Scans directories for includes and returns the graph.
+
+    See `ig.api.scan()`, which is only imported when called, so that importing
+    `ig` stays cheap.
+    '''
+    from ig import api
+    return api.scan(directories, **options)
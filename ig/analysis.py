@@ -0,0 +1,341 @@
+'''Algorithms to analyze the structure of include graphs.'''
+
+import array
+import binascii
+import logging
+
+log = logging.getLogger(__name__)
+
+try:
+    popcount = int.bit_count
+except AttributeError:
+    def popcount(bits):
+        '''Returns the number of bits set in an integer.'''
+        return bin(bits).count('1')
+
+
+def successors(graph):
+    '''
+    Collects the adjacency lists of a graph (in the "includes" direction).
+
+    Args:
+        graph: The graph
+
+    Returns:
+        A list mapping every node ID to a list of the IDs of the nodes it
+        includes (empty for dropped or unscanned nodes).
+    '''
+    adjacency = [()] * len(graph.nodes)
+    for node_id in graph.node_ids():
+        edges = graph.nodes[node_id].edges
+        if edges:
+            adjacency[node_id] = [graph.targets[e] for e in edges]
+    return adjacency
+
+
+def strongly_connected_components(graph, adjacency=None):
+    '''
+    Finds the strongly connected components of a graph.
+
+    This is Tarjan's algorithm, made iterative so that deep include chains
+    cannot exceed the recursion limit. It runs in O(nodes + edges).
+
+    Args:
+        graph: The graph
+        adjacency: The result of `successors(graph)`, if already computed
+
+    Returns:
+        A list of components (each a list of node IDs) in reverse topological
+        order, i.e. every component only includes components before it.
+    '''
+    if adjacency is None:
+        adjacency = successors(graph)
+
+    count = len(graph.nodes)
+    indices = array.array('l', [-1]) * count
+    lowlinks = array.array('l', [0]) * count
+    on_stack = bytearray(count)
+    stack = []
+    components = []
+    counter = 0
+
+    for root in graph.node_ids():
+        if indices[root] >= 0:
+            continue
+
+        indices[root] = lowlinks[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = 1
+        work = [(root, iter(adjacency[root]))]
+
+        while work:
+            node, neighbors = work[-1]
+            for neighbor in neighbors:
+                if indices[neighbor] < 0:
+                    indices[neighbor] = lowlinks[neighbor] = counter
+                    counter += 1
+                    stack.append(neighbor)
+                    on_stack[neighbor] = 1
+                    work.append((neighbor, iter(adjacency[neighbor])))
+                    break
+                elif on_stack[neighbor]:
+                    lowlinks[node] = min(lowlinks[node], indices[neighbor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlinks[parent] = min(lowlinks[parent], lowlinks[node])
+                if lowlinks[node] == indices[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = 0
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+
+    return components
+
+
+def condense(graph, components, adjacency):
+    '''
+    Builds the DAG of strongly connected components.
+
+    Args:
+        graph: The graph
+        components: The result of `strongly_connected_components(graph)`
+        adjacency: The result of `successors(graph)`
+
+    Returns:
+        A tuple (component_of, edges), where `component_of` maps node IDs to
+        the index of their component and `edges` holds, for every component,
+        the set of indices of the (other) components it includes.
+    '''
+    component_of = array.array('l', [-1]) * len(graph.nodes)
+    for index, component in enumerate(components):
+        for node in component:
+            component_of[node] = index
+
+    edges = []
+    for index, component in enumerate(components):
+        targets = set()
+        for node in component:
+            for neighbor in adjacency[node]:
+                targets.add(component_of[neighbor])
+        targets.discard(index)
+        edges.append(targets)
+
+    return component_of, edges
+
+
+def cycles(graph):
+    '''
+    Finds all include cycles in a graph.
+
+    Every cycle is reported as the strongly connected component containing it,
+    i.e. a maximal set of files that (transitively) include each other. A file
+    including itself is a cycle of its own.
+
+    Args:
+        graph: The graph
+
+    Returns:
+        A list of cycles (lists of node IDs), sorted by decreasing size.
+    '''
+    adjacency = successors(graph)
+    found = []
+    for component in strongly_connected_components(graph, adjacency):
+        node = component[0]
+        if len(component) > 1 or node in adjacency[node]:
+            found.append(sorted(component))
+    found.sort(key=lambda c: (-len(c), c))
+    return found
+
+
+def weight_masks(weights):
+    '''
+    Decomposes integer weights into one bitset per binary digit.
+
+    The sum of the weights of the elements of a bitset `bits` is then the sum
+    of `popcount(bits & mask) << k` over all masks (the k-th mask holding all
+    elements whose weight has bit k set), which only takes a handful of
+    big-integer operations instead of one per element.
+
+    Args:
+        weights: A list of non-negative integer weights
+
+    Returns:
+        A list of bitsets, one for each binary digit of the weights.
+    '''
+    masks = []
+    digit = 0
+    while any(w >> digit for w in weights):
+        mask = bytearray((len(weights) + 7) // 8)
+        for index, weight in enumerate(weights):
+            if (weight >> digit) & 1:
+                mask[index >> 3] |= 1 << (index & 7)
+        masks.append(int_from_bytes(mask))
+        digit += 1
+    return masks
+
+
+def int_from_bytes(data):
+    '''
+    Returns:
+        The (little-endian) integer represented by some bytes.
+    '''
+    return int(binascii.hexlify(bytes(bytearray(reversed(data)))) or b'0', 16)
+
+
+def weighted_popcount(bits, masks):
+    '''
+    Sums the weights of all elements in a bitset.
+
+    Args:
+        bits: The bitset
+        masks: The result of `weight_masks()` for the weights
+
+    Returns:
+        The total weight.
+    '''
+    return sum(popcount(bits & mask) << digit
+               for digit, mask in enumerate(masks))
+
+
+def invert(edges):
+    '''
+    Args:
+        edges: For every component, the components it includes
+
+    Returns:
+        For every component, the list of components including it.
+    '''
+    predecessors = [[] for _ in edges]
+    for index, targets in enumerate(edges):
+        for target in targets:
+            predecessors[target].append(index)
+    return predecessors
+
+
+def closure_weights(edges, predecessors, mask_sets):
+    '''
+    Sums weights over the transitive closure of every component.
+
+    Components must be ordered such that dependencies come first (as returned
+    by `strongly_connected_components()`). Closures are bitsets, which are
+    released as soon as all components including them were processed.
+
+    Args:
+        edges: For every component, the set of components it includes
+        predecessors: The result of `invert(edges)`
+        mask_sets: A list of results of `weight_masks()`
+
+    Returns:
+        For every set of masks, a list of the total weight of every component
+        and everything it transitively includes.
+    '''
+    totals = [[0] * len(edges) for _ in mask_sets]
+    reach = [None] * len(edges)
+    pending = [len(p) for p in predecessors]
+    for index, targets in enumerate(edges):
+        bits = 1 << index
+        for target in targets:
+            bits |= reach[target]
+            pending[target] -= 1
+            if pending[target] == 0:
+                reach[target] = None
+        for weights, masks in zip(totals, mask_sets):
+            weights[index] = weighted_popcount(bits, masks)
+        if pending[index] > 0:
+            reach[index] = bits
+    return totals
+
+
+def include_counts(graph):
+    '''
+    Counts the files every file transitively includes.
+
+    Args:
+        graph: The graph
+
+    Returns:
+        A list mapping node IDs to the number of other files they include
+        (directly or not), or to None for dropped nodes.
+    '''
+    adjacency = successors(graph)
+    components = strongly_connected_components(graph, adjacency)
+    component_of, edges = condense(graph, components, adjacency)
+    count_masks = weight_masks([len(c) for c in components])
+    included, = closure_weights(edges, invert(edges), [count_masks])
+
+    counts = [None] * len(graph.nodes)
+    for node_id in graph.node_ids():
+        counts[node_id] = included[component_of[node_id]] - 1
+    return counts
+
+
+def costs(graph):
+    '''
+    Computes the transitive preprocessing cost of every file.
+
+    For every node, this is the number of files it transitively includes and
+    the total number of bytes the preprocessor has to read for it (its own
+    size plus that of everything it transitively includes, as recorded by the
+    scan). Additionally, we
+    compute how many translation units (files no other file includes)
+    transitively include each node.
+
+    Transitive closures are computed as bitsets over the DAG of strongly
+    connected components, processed in topological order, so each closure
+    costs a few big-integer operations (see `closure_weights()`).
+
+    Args:
+        graph: The graph
+
+    Returns:
+        A list of dictionaries with the keys "file", "includes", "bytes" and
+        "includers", one for every node.
+    '''
+    adjacency = successors(graph)
+    components = strongly_connected_components(graph, adjacency)
+    component_of, edges = condense(graph, components, adjacency)
+    log.debug('Condensed %d nodes into %d components',
+              graph.node_count, len(components))
+
+    counts = [len(c) for c in components]
+    count_masks = weight_masks(counts)
+    byte_masks = weight_masks([sum(graph.sizes[n] for n in c)
+                               for c in components])
+    roots = [int(graph.in_degrees[c[0]] == 0) for c in components]
+    root_masks = weight_masks(roots)
+
+    predecessors = invert(edges)
+    included, bytes_included = closure_weights(edges,
+                                               predecessors,
+                                               [count_masks, byte_masks])
+
+    # Reverse closures, to count the translation units including a component
+    includers = [0] * len(components)
+    reach = [None] * len(components)
+    pending = [len(t) for t in edges]
+    for index in reversed(range(len(components))):
+        bits = 1 << index
+        for source in predecessors[index]:
+            bits |= reach[source]
+            pending[source] -= 1
+            if pending[source] == 0:
+                reach[source] = None
+        includers[index] = weighted_popcount(bits & ~(1 << index), root_masks)
+        if pending[index] > 0:
+            reach[index] = bits
+
+    results = []
+    for node_id in graph.node_ids():
+        component = component_of[node_id]
+        results.append(dict(file=graph.names[node_id],
+                            includes=included[component] - 1,
+                            bytes=bytes_included[component],
+                            includers=includers[component]))
+    return results
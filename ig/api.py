@@ -0,0 +1,218 @@
+'''
+A programmatic interface for scanning include graphs.
+
+    import ig
+    graph = ig.scan(['include'], prefixes=['include'])
+
+This only imports what scanning needs (not the server or the layout), never
+exits the process and never writes anything, so it can be called many times
+from long-running processes. The command line is a thin wrapper around it.
+'''
+
+import argparse
+import logging
+
+from ig import colors, graph, walk
+
+log = logging.getLogger(__name__)
+
+# The file (glob) patterns scanned by default
+PATTERNS = ('*.[ch]pp', '*.[ch]')
+
+# The options of `scan()` and their defaults, which are those of the command
+# line (see `ig --help`), except that no include paths are implied
+DEFAULTS = dict(directories=(),
+                compdb=None,
+                rev=None,
+                patterns=PATTERNS,
+                prefixes=(),
+                preamble_only=False,
+                defines=(),
+                undefines=(),
+                conditionals=False,
+                excludes=(),
+                exclude_regexes=(),
+                gitignore=False,
+                jobs=1,
+                cache=None,
+                cache_hash=False,
+                relation='included-by',
+                full_path=False,
+                group_granularity=2,
+                colors=None)
+
+# The options that hold lists
+LISTS = ('directories',
+         'patterns',
+         'prefixes',
+         'defines',
+         'undefines',
+         'excludes',
+         'exclude_regexes')
+
+
+def make_colors(base=(234, 82, 77), variation=200, alpha_min=0.7):
+    '''
+    Creates the color scheme of nodes.
+
+    Args:
+        base: The base RGB color
+        variation: The variation in RGB around the base color
+        alpha_min: The minimum alpha value of colors
+
+    Returns:
+        A `colors.Colors` object.
+    '''
+    scheme = colors.Colors(base)
+    scheme.variation = variation
+    scheme.alpha_min = alpha_min
+    return scheme
+
+
+def make_options(**options):
+    '''
+    Creates the options of a scan, as the command line would.
+
+    Args:
+        options: Any of the options in `DEFAULTS`
+
+    Returns:
+        An `argparse.Namespace` of all options.
+
+    Raises:
+        TypeError: For unknown options.
+        ValueError: For options that cannot be combined.
+    '''
+    unknown = sorted(set(options) - set(DEFAULTS))
+    if unknown:
+        raise TypeError('Unknown options: {0}'.format(', '.join(unknown)))
+
+    values = dict(DEFAULTS)
+    values.update(options)
+    for name in LISTS:
+        value = values[name]
+        # A single string is a single item, not a list of characters
+        values[name] = [value] if hasattr(value, 'lower') else list(value)
+    # Necessary for standard includes
+    values['prefixes'].append('')
+    if values['colors'] is None:
+        values['colors'] = make_colors()
+
+    options = argparse.Namespace(**values)
+    walk.check_arguments(options)
+    return options
+
+
+def new_graph(options):
+    '''
+    Creates an empty graph.
+
+    Args:
+        options: The options of `make_options()` or the command line
+
+    Returns:
+        The new graph.
+    '''
+    return graph.Graph(options.relation,
+                       options.full_path,
+                       options.colors,
+                       options.group_granularity)
+
+
+def build(options, counters=None, resolver=None):
+    '''
+    Scans the files selected by options into a new graph.
+
+    Args:
+        options: The options of `make_options()` or the command line
+        counters: An optional `collections.Counter` to accumulate statistics
+                  of the scan into (see `walk.walk()`)
+        resolver: An optional `walk.Resolver` to resolve includes with, which
+                  keeps what it learns about the file system. By default, a
+                  fresh one is used, so that files added or removed since
+                  earlier scans are seen.
+
+    Returns:
+        The graph, which may be empty.
+
+    Raises:
+        ValueError: For options that cannot be combined.
+    '''
+    include_graph = new_graph(options)
+    if resolver is None and options.rev is None:
+        resolver = walk.Resolver()
+    walk.walk(include_graph, options, counters, resolver)
+    return include_graph
+
+
+def scan(directories=(), **options):
+    '''
+    Scans directories (or a compilation database) for includes.
+
+    Args:
+        directories: The directories to scan
+        options: Any of the options in `DEFAULTS`, e.g. `prefixes` (the
+                 include paths), `patterns`, `compdb`, `rev`, `excludes` or
+                 `jobs`
+
+    Returns:
+        The `graph.Graph` of the includes, which may be empty.
+
+    Raises:
+        TypeError: For unknown options.
+        ValueError: For options that cannot be combined, e.g. `rev` with
+                    `cache` or more than one job.
+    '''
+    return build(make_options(directories=directories, **options))
+
+
+class Scanner(object):
+    '''
+    Scans repeatedly, remembering directory listings and resolved includes
+    between scans.
+
+    This makes repeated scans of the same trees cheaper, but means files added
+    or removed since are missed until `invalidate()` is called. Only scans in
+    this process (i.e. with one job) profit. To also skip parsing unchanged
+    files, pass a `cache` path, which is safe to reuse since its entries are
+    checked against the files. Revisions (`rev`) are always scanned afresh,
+    with `scan()`.
+    '''
+
+    def __init__(self):
+        '''Constructor.'''
+        self.resolver = walk.Resolver()
+
+    def scan(self, directories=(), counters=None, **options):
+        '''
+        Scans directories (or a compilation database) for includes.
+
+        Args:
+            directories: The directories to scan
+            counters: An optional `collections.Counter` to accumulate
+                      statistics of the scan into
+            options: Any of the options in `DEFAULTS`
+
+        Returns:
+            The `graph.Graph` of the includes, which may be empty.
+
+        Raises:
+            TypeError: For unknown options.
+            ValueError: For options that cannot be combined, including `rev`.
+        '''
+        return build(make_options(directories=directories, **options),
+                     counters,
+                     self.resolver)
+
+    def invalidate(self, directories=None):
+        '''
+        Forgets what is known about directories whose contents changed.
+
+        Args:
+            directories: The directories in which files were added or removed,
+                         or None to forget everything
+        '''
+        if directories is None:
+            self.resolver = walk.Resolver()
+        else:
+            self.resolver.invalidate(directories)
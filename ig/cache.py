@@ -0,0 +1,221 @@
+'''A persistent cache of the include directives found in each file.'''
+
+import hashlib
+import logging
+import os
+import sqlite3
+
+log = logging.getLogger(__name__)
+
+
+def default_path():
+    '''
+    Returns:
+        The default location of the cache (under the user's cache directory).
+    '''
+    root = os.environ.get('XDG_CACHE_HOME')
+    if not root:
+        root = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(root, 'ig', 'scan.db')
+
+
+def file_digest(filename):
+    '''
+    Hashes the contents of a file.
+
+    Args:
+        filename: The file to hash
+
+    Returns:
+        The hex digest of the file's contents.
+    '''
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as source:
+        for block in iter(lambda: source.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def encode_directives(directives):
+    '''
+    Args:
+        directives: A list of (quoted, path) include directives
+
+    Returns:
+        The directives as a single string, for the database.
+    '''
+    return '\0'.join(('"' if quoted else '<') + path
+                     for quoted, path in directives)
+
+
+def decode_directives(text):
+    '''
+    Args:
+        text: The result of `encode_directives()`
+
+    Returns:
+        The list of (quoted, path) include directives.
+    '''
+    if not text:
+        return []
+    return [(entry[0] == '"', entry[1:]) for entry in text.split('\0')]
+
+
+def modification_time(stat):
+    '''
+    Returns:
+        The modification time of a `stat` result, in integer nanoseconds.
+    '''
+    mtime = getattr(stat, 'st_mtime_ns', None)
+    if mtime is None:
+        mtime = int(stat.st_mtime * 1e9)
+    return mtime
+
+
+class Cache(object):
+    '''
+    Stores the include directives of every scanned file in an SQLite database.
+
+    Directives are stored as written (e.g. `<vector>`), not resolved, since
+    where they resolve to depends on files other than the one scanned, which
+    may have been added or removed since.
+
+    Entries are keyed by the path of the file and are only considered valid if
+    the file's modification time and size (and optionally its content hash)
+    are unchanged, and if it was parsed with the same settings (e.g. macros).
+    There is a single entry per path, so an entry for stale settings
+    is simply replaced the next time the file is scanned.
+    '''
+
+    # Bumped whenever the schema or the meaning of entries changes
+    VERSION = 4
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            settings TEXT NOT NULL,
+            mtime INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            digest TEXT,
+            directives TEXT NOT NULL
+        )
+    '''
+
+    def __init__(self, path, verify_hash=False):
+        '''
+        Constructor.
+
+        Args:
+            path: The path of the database file (created if it does not exist)
+            verify_hash: Whether to compare content hashes when the
+                         modification time of a file changed but its size did
+                         not, before declaring the entry stale
+        '''
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.verify_hash = verify_hash
+        self.hits = 0
+        self.misses = 0
+        self.pending = {}
+        self.connection = sqlite3.connect(path)
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        if version != Cache.VERSION:
+            log.debug('Discarding scan cache with version %d', version)
+            self.connection.execute('DROP TABLE IF EXISTS files')
+            self.connection.execute(
+                'PRAGMA user_version = {0}'.format(Cache.VERSION))
+        self.connection.execute(Cache.SCHEMA)
+        log.debug('Opened scan cache at %s', path)
+
+    @staticmethod
+    def key(settings):
+        '''
+        Returns:
+            A compact key identifying the settings a file was scanned with.
+        '''
+        text = repr(tuple(settings)).encode('utf-8', 'surrogateescape')
+        return hashlib.sha1(text).hexdigest()
+
+    def lookup(self, filename, settings):
+        '''
+        Looks up the include directives of a file.
+
+        Args:
+            filename: The file to look up
+            settings: The settings (e.g. macros) the file would be parsed with
+
+        Returns:
+            The list of (quoted, path) include directives of the file, or None
+            if there is no valid cache entry for it.
+        '''
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            self.misses += 1
+            return None
+        # Remember the state of the file *before* it is scanned, so that a
+        # modification during the scan invalidates the entry we store.
+        self.pending[filename] = stat
+
+        row = self.connection.execute(
+            'SELECT settings, mtime, size, digest, directives '
+            'FROM files WHERE path = ?', (filename, )).fetchone()
+        if row is None or row[0] != Cache.key(settings):
+            self.misses += 1
+            return None
+
+        _, mtime, size, digest, directives = row
+        if stat.st_size != size:
+            self.misses += 1
+            return None
+        if modification_time(stat) != mtime:
+            if not (self.verify_hash and digest == file_digest(filename)):
+                self.misses += 1
+                return None
+            # Only touched, so refresh the timestamp to skip hashing next time
+            self.connection.execute('UPDATE files SET mtime = ? WHERE path = ?',
+                                    (modification_time(stat), filename))
+
+        del self.pending[filename]
+        self.hits += 1
+        return decode_directives(directives)
+
+    def store(self, filename, settings, directives):
+        '''
+        Stores the include directives of a file.
+
+        Args:
+            filename: The file whose directives to store
+            settings: The settings (e.g. macros) the file was parsed with
+            directives: The list of (quoted, path) include directives
+        '''
+        stat = self.pending.pop(filename, None)
+        if stat is None:
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                return
+        digest = file_digest(filename) if self.verify_hash else None
+        self.connection.execute(
+            'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)',
+            (filename,
+             Cache.key(settings),
+             modification_time(stat),
+             stat.st_size,
+             digest,
+             encode_directives(directives)))
+
+    def close(self):
+        '''Commits all new entries and closes the database.'''
+        self.connection.commit()
+        self.connection.close()
+        log.debug('Scan cache: %d hits, %d misses', self.hits, self.misses)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error_value, traceback):
+        self.close()
@@ -0,0 +1,281 @@
+'''Collapses files into clusters of directories, for a level-of-detail view.'''
+
+import array
+import collections
+import logging
+import os
+import random
+
+log = logging.getLogger(__name__)
+
+# The parent of all top-level directories (and of files without directory)
+ROOT = ''
+
+# Prefixes the IDs of cluster nodes, to tell them apart from node IDs
+CLUSTER_PREFIX = 'cluster:'
+
+
+def parent_directory(directory):
+    '''
+    Returns:
+        The parent of a directory, or `ROOT` for top-level directories.
+    '''
+    parent = os.path.dirname(directory)
+    return ROOT if parent == directory else parent
+
+
+def cluster_id(cluster):
+    '''
+    Returns:
+        The ID of the node representing a cluster.
+    '''
+    return CLUSTER_PREFIX + cluster
+
+
+class Hierarchy(object):
+    '''
+    The tree of directories of a graph, with edges aggregated between them.
+
+    Every directory is a cluster of the files and directories under it.
+    Chains of directories without files and with a single subdirectory are
+    collapsed into their last directory, so every level of the tree branches.
+    The edges between files are counted per pair of their directories once,
+    so that the edges between any set of clusters can be aggregated without
+    visiting all edges of the graph again.
+    '''
+
+    def __init__(self, graph, successors, predecessors):
+        '''
+        Constructor.
+
+        Args:
+            graph: The graph
+            successors: The adjacency lists of the graph (see
+                        `analysis.successors()`)
+            predecessors: The inverted adjacency lists of the graph
+        '''
+        self.graph = graph
+        self.successors = successors
+        self.predecessors = predecessors
+
+        # The directory every node is in, and the index of that directory
+        self.directories = [None] * len(graph.nodes)
+        numbers = array.array('i', [-1]) * len(graph.nodes)
+        files = collections.OrderedDict()
+        heads = {}
+        for node_id in graph.node_ids():
+            name = graph.names[node_id]
+            # Cheaper than (but equivalent to) calling dirname for every file
+            head = name[:name.rfind(os.sep) + 1]
+            directory = heads.get(head)
+            if directory is None:
+                directory = heads[head] = os.path.dirname(name)
+                files[directory] = []
+            self.directories[node_id] = directory
+            files[directory].append(node_id)
+        directories = list(files)
+        for number, directory in enumerate(directories):
+            for node_id in files[directory]:
+                numbers[node_id] = number
+
+        subdirectories = collections.defaultdict(set)
+        for directory in list(files):
+            while directory != ROOT:
+                parent = parent_directory(directory)
+                if directory in subdirectories[parent]:
+                    break  # The rest of the chain is linked already
+                subdirectories[parent].add(directory)
+                directory = parent
+
+        def skip(directory):
+            while not files.get(directory) and \
+                  len(subdirectories.get(directory, ())) == 1:
+                directory = next(iter(subdirectories[directory]))
+            return directory
+
+        self.top = skip(ROOT)
+        self.parents = {}
+        self.children = {}
+        self.files = {}
+        # Clusters in pre-order, i.e. every cluster before its children
+        order = []
+        stack = [self.top]
+        while stack:
+            cluster = stack.pop()
+            order.append(cluster)
+            self.files[cluster] = files.get(cluster, [])
+            children = sorted(skip(d) for d in subdirectories.get(cluster, ()))
+            self.children[cluster] = children
+            for child in children:
+                self.parents[child] = cluster
+            stack.extend(children)
+
+        # The number of files and their centroid, per cluster
+        self.sizes = dict((c, len(self.files[c])) for c in order)
+        self.xs = dict((c, sum(graph.xs[n] for n in self.files[c]))
+                       for c in order)
+        self.ys = dict((c, sum(graph.ys[n] for n in self.files[c]))
+                       for c in order)
+        for cluster in reversed(order):
+            parent = self.parents.get(cluster)
+            if parent is not None:
+                self.sizes[parent] += self.sizes[cluster]
+                self.xs[parent] += self.xs[cluster]
+                self.ys[parent] += self.ys[cluster]
+
+        # The number of edges between files of every pair of directories,
+        # counted over pairs of directory numbers packed into one integer
+        width = len(directories)
+        keys = collections.Counter(
+            numbers[source] * width + numbers[target]
+            for source, target in zip(graph.sources, graph.targets)
+            if source >= 0)
+        self.edges = collections.Counter()
+        for key, count in keys.items():
+            source, target = divmod(key, width)
+            if source != target:
+                self.edges[directories[source], directories[target]] = count
+
+        self.colors = {}
+
+        log.debug('Built hierarchy of %d clusters, with %d directory edges',
+                  len(order), len(self.edges))
+
+    def view(self, expanded, limit=None):
+        '''
+        Collapses the graph into clusters, except for expanded clusters.
+
+        The top-level cluster is always expanded. Expanded clusters are
+        replaced by their children (clusters) and the files directly in them.
+        Clusters inside collapsed clusters are not shown, even if they are
+        expanded themselves.
+
+        Args:
+            expanded: An iterable of the clusters (directories) to expand.
+                      Unknown clusters are ignored.
+            limit: The maximum number of nodes to show, if any
+
+        Returns:
+            The JSON of the clusters and files shown, with the number of edges
+            between them as the weight of every edge.
+
+        Raises:
+            ValueError: If more than `limit` nodes would be shown.
+        '''
+        expanded = set(expanded)
+        expanded.add(self.top)
+
+        clusters = []
+        files = []
+        stack = [self.top]
+        while stack:
+            cluster = stack.pop()
+            files.extend(self.files[cluster])
+            for child in self.children[cluster]:
+                if child in expanded:
+                    stack.append(child)
+                else:
+                    clusters.append(child)
+            if limit is not None and len(clusters) + len(files) > limit:
+                raise ValueError('The view has more than {0} nodes'
+                                 .format(limit))
+
+        # Maps every directory to the cluster shown for its files, or None if
+        # the files are shown themselves
+        shown = dict((c, c) for c in clusters)
+        shown[self.top] = None
+
+        def visible(directory):
+            chain = []
+            while directory not in shown:
+                chain.append(directory)
+                directory = self.parents[directory]
+            representative = shown[directory]
+            for directory in reversed(chain):
+                if representative is None and directory not in expanded:
+                    representative = directory
+                shown[directory] = representative
+            return representative
+
+        def node(node_id):
+            cluster = visible(self.directories[node_id])
+            return node_id if cluster is None else cluster_id(cluster)
+
+        weights = collections.Counter()
+        for (source, target), count in self.edges.items():
+            source, target = visible(source), visible(target)
+            if source is not None and target is not None and source != target:
+                weights[cluster_id(source), cluster_id(target)] += count
+        for node_id in files:
+            for target in self.successors[node_id]:
+                weights[node_id, node(target)] += 1
+            for source in self.predecessors[node_id]:
+                # Edges between shown files were counted above
+                if visible(self.directories[source]) is not None:
+                    weights[node(source), node_id] += 1
+
+        nodes = [self.cluster_json(c) for c in clusters]
+        for node_id in files:
+            result = self.graph.node_json(node_id)
+            result['parent'] = self.directories[node_id]
+            nodes.append(result)
+        edges = [self.edge_json(source, target, weight)
+                 for (source, target), weight in sorted(weights.items(),
+                                                        key=str)]
+        return dict(nodes=nodes, edges=edges)
+
+    def cluster_json(self, cluster):
+        '''
+        Materializes the dictionary sigma.js expects for a cluster.
+
+        Args:
+            cluster: The cluster (directory)
+
+        Returns:
+            The node object, with the cluster, its parent and its number of
+            files.
+        '''
+        parent = self.parents.get(cluster, ROOT)
+        if self.graph.use_full_path or not parent:
+            label = cluster
+        else:
+            label = cluster[len(parent):].lstrip(os.sep)
+        label = label.rstrip(os.sep) + os.sep
+
+        color = self.colors.get(cluster)
+        if color is None:
+            color = self.colors[cluster] = self.graph.colors.generate()
+
+        size = self.sizes[cluster]
+        return dict(id=cluster_id(cluster),
+                    label=label,
+                    size=size,
+                    color=color,
+                    group=cluster,
+                    cluster=cluster,
+                    parent=parent,
+                    files=size,
+                    x=self.xs[cluster] / size + random.random() * 0.01,
+                    y=self.ys[cluster] / size + random.random() * 0.01)
+
+    def edge_json(self, source, target, weight):
+        '''
+        Materializes the dictionary sigma.js expects for an aggregated edge.
+
+        Args:
+            source: The ID of the including node (or cluster node)
+            target: The ID of the included node (or cluster node)
+            weight: The number of includes between the two
+
+        Returns:
+            The edge object.
+        '''
+        # The natural direction is "includes", so swap if we want "included-by"
+        if self.graph.is_included_by_relation:
+            source, target = target, source
+        return dict(id='{0}>{1}'.format(source, target),
+                    size=10,
+                    type='curvedArrow',
+                    source=source,
+                    target=target,
+                    weight=weight)
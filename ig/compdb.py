@@ -0,0 +1,134 @@
+'''Reads the translation units to scan from a compilation database.'''
+
+import collections
+import json
+import logging
+import os
+import shlex
+
+log = logging.getLogger(__name__)
+
+# A translation unit, along with the directories its includes are searched in
+# and the macros it is compiled with (the arguments of -D and -U)
+Command = collections.namedtuple('Command', ['filename',
+                                             'quote_paths',
+                                             'include_paths',
+                                             'defines',
+                                             'undefines'])
+
+# Flags adding a directory to the search path for quoted includes only
+QUOTE_FLAGS = ('-iquote', )
+
+# Flags adding a directory to the search path for all includes, in the order
+# in which the compiler searches them (independent of their position)
+INCLUDE_FLAGS = ('-I', '-isystem', '-idirafter')
+
+
+def get_arguments(entry):
+    '''
+    Returns:
+        The list of arguments of an entry of the compilation database.
+    '''
+    if 'arguments' in entry:
+        return entry['arguments']
+    return shlex.split(entry['command'])
+
+
+def search_paths(arguments, directory):
+    '''
+    Collects the include search paths from the arguments of a compiler call.
+
+    Both the joined ("-Ifoo") and the separate ("-I foo") spelling of every
+    flag are recognized. Relative paths are relative to the directory the
+    compiler was invoked in.
+
+    Args:
+        arguments: The arguments of the compiler call
+        directory: The working directory of the call
+
+    Returns:
+        A tuple (quote_paths, include_paths) of lists of absolute paths.
+    '''
+    found = dict((flag, []) for flag in QUOTE_FLAGS + INCLUDE_FLAGS)
+    arguments = iter(arguments)
+    for argument in arguments:
+        # Longer flags first, so that -isystem is not taken for -I
+        for flag in sorted(found, key=len, reverse=True):
+            if argument == flag:
+                path = next(arguments, None)
+            elif argument.startswith(flag):
+                path = argument[len(flag):]
+            else:
+                continue
+            if path:
+                path = os.path.normpath(os.path.join(directory, path))
+                found[flag].append(path)
+            break
+
+    quote_paths = [p for flag in QUOTE_FLAGS for p in found[flag]]
+    include_paths = [p for flag in INCLUDE_FLAGS for p in found[flag]]
+    return quote_paths, include_paths
+
+
+def macros(arguments):
+    '''
+    Collects the macros defined and undefined on the command line of a call.
+
+    Args:
+        arguments: The arguments of the compiler call
+
+    Returns:
+        A tuple (defines, undefines) of lists of the arguments of all -D
+        (NAME or NAME=VALUE) and -U (NAME) flags, in order.
+    '''
+    found = dict(D=[], U=[])
+    arguments = iter(arguments)
+    for argument in arguments:
+        if argument in ('-D', '-U'):
+            value = next(arguments, None)
+        elif argument[:2] in ('-D', '-U'):
+            value = argument[2:]
+        else:
+            continue
+        if value:
+            found[argument[1]].append(value)
+    return found['D'], found['U']
+
+
+def load(path):
+    '''
+    Reads a compilation database (`compile_commands.json`).
+
+    Files compiled several times (e.g. for different configurations) are only
+    reported once, with the search paths of their first entry.
+
+    Args:
+        path: The path of the compilation database
+
+    Returns:
+        A list of `Command`s, in the order of the database.
+    '''
+    with open(path) as database:
+        entries = json.load(database)
+
+    commands = []
+    seen = set()
+    for entry in entries:
+        directory = entry.get('directory', os.path.dirname(path))
+        filename = os.path.realpath(os.path.join(directory, entry['file']))
+        if filename in seen:
+            log.debug('%s is compiled more than once, skipping', filename)
+            continue
+        seen.add(filename)
+        arguments = get_arguments(entry)
+        quote_paths, include_paths = search_paths(arguments, directory)
+        defines, undefines = macros(arguments)
+        commands.append(Command(filename,
+                                quote_paths,
+                                include_paths,
+                                defines,
+                                undefines))
+
+    log.debug('Read %d translation units from %s', len(commands), path)
+
+    return commands
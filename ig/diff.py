@@ -0,0 +1,170 @@
+'''Compares two include graphs, e.g. to catch include bloat in CI.'''
+
+import logging
+import os
+
+from ig import analysis, graph
+
+log = logging.getLogger(__name__)
+
+
+def relative_names(include_graph, roots):
+    '''
+    Names the nodes of a graph relative to the roots of its scan.
+
+    This makes graphs of different checkouts of the same tree comparable.
+    Files outside of all roots (e.g. system headers) keep their names.
+
+    Args:
+        include_graph: The graph
+        roots: The directories the graph was scanned from. If empty, the
+               common directory of all scanned files is used.
+
+    Returns:
+        A list mapping node IDs to names (None for dropped nodes).
+    '''
+    if not roots:
+        scanned = [include_graph.names[n] for n in include_graph.node_ids()
+                   if include_graph.nodes[n].edges is not None]
+        if scanned:
+            roots = [os.path.dirname(os.path.commonprefix(scanned))]
+    roots = [os.path.join(r, '') for r in roots]
+
+    names = [None] * len(include_graph.nodes)
+    for node_id in include_graph.node_ids():
+        name = include_graph.names[node_id]
+        for root in roots:
+            if name.startswith(root):
+                name = name[len(root):]
+                break
+        names[node_id] = name
+    return names
+
+
+def intern_edges(include_graph, names, table):
+    '''
+    Collects the edges of a graph as integers over a shared table of names.
+
+    Args:
+        include_graph: The graph
+        names: The result of `relative_names()` for the graph
+        table: A map from names to shared IDs, extended in place
+
+    Returns:
+        The set of `graph.edge_key()`s of all edges, in shared IDs.
+    '''
+    shared = [None] * len(names)
+    for node_id, name in enumerate(names):
+        if name is not None:
+            shared[node_id] = table.setdefault(name, len(table))
+
+    sources, targets = include_graph.sources, include_graph.targets
+    return set(graph.edge_key(shared[sources[e]], shared[targets[e]])
+               for e in include_graph.edge_ids())
+
+
+def compare(old, old_roots, new, new_roots, limit=None):
+    '''
+    Compares two graphs.
+
+    Edges are compared as sets of integers, after both graphs' names were
+    interned into one table, so this is linear in the size of the graphs.
+
+    Args:
+        old: The old graph
+        old_roots: The directories the old graph was scanned from
+        new: The new graph
+        new_roots: The directories the new graph was scanned from
+        limit: The maximum number of entries of every list, if any
+
+    Returns:
+        A dictionary (JSON) of the sizes of both graphs, the added and removed
+        edges and nodes, the files whose transitive include count grew (most
+        growth first) and the cycles in the new graph that are not in the old.
+        The counts (and the file that grew most) are those of the whole
+        lists, before they are limited.
+    '''
+    old_names = relative_names(old, old_roots)
+    new_names = relative_names(new, new_roots)
+
+    table = {}
+    old_edges = intern_edges(old, old_names, table)
+    new_edges = intern_edges(new, new_names, table)
+    names = [None] * len(table)
+    for name, shared_id in table.items():
+        names[shared_id] = name
+
+    def edge_names(keys):
+        return sorted((names[k >> 32], names[k & 0xffffffff]) for k in keys)
+
+    old_nodes = set(n for n in old_names if n is not None)
+    new_nodes = set(n for n in new_names if n is not None)
+
+    old_counts = dict(zip(old_names, analysis.include_counts(old)))
+    growth = []
+    for name, count in zip(new_names, analysis.include_counts(new)):
+        before = old_counts.get(name)
+        if name is not None and before is not None and count > before:
+            growth.append(dict(file=name,
+                               old=before,
+                               new=count,
+                               delta=count - before))
+    growth.sort(key=lambda g: (-g['delta'], g['file']))
+
+    old_cycles = set(frozenset(old_names[n] for n in cycle)
+                     for cycle in analysis.cycles(old))
+    new_cycles = [sorted(new_names[n] for n in cycle)
+                  for cycle in analysis.cycles(new)]
+    new_cycles = [c for c in new_cycles if frozenset(c) not in old_cycles]
+
+    added_edges = new_edges - old_edges
+    removed_edges = old_edges - new_edges
+    log.debug('%d edges added, %d removed',
+              len(added_edges), len(removed_edges))
+
+    return dict(old=dict(nodes=old.node_count, edges=old.edge_count),
+                new=dict(nodes=new.node_count, edges=new.edge_count),
+                addedNodes=sorted(new_nodes - old_nodes)[:limit],
+                removedNodes=sorted(old_nodes - new_nodes)[:limit],
+                addedEdges=edge_names(added_edges)[:limit],
+                removedEdges=edge_names(removed_edges)[:limit],
+                addedEdgeCount=len(added_edges),
+                removedEdgeCount=len(removed_edges),
+                growth=growth[:limit],
+                growthCount=len(growth),
+                maxGrowth=growth[0] if growth else None,
+                newCycles=new_cycles[:limit],
+                newCycleCount=len(new_cycles))
+
+
+def check(result, max_added_edges=None, max_growth=None, max_new_cycles=None):
+    '''
+    Checks the result of `compare()` against thresholds.
+
+    Args:
+        result: The result of `compare()`
+        max_added_edges: The maximum number of edges that may be added
+        max_growth: The maximum number of files the transitive includes of
+                    any one file may grow by
+        max_new_cycles: The maximum number of new cycles
+
+    Returns:
+        A list of messages, one for every threshold that was exceeded.
+    '''
+    violations = []
+    added = result['addedEdgeCount']
+    if max_added_edges is not None and added > max_added_edges:
+        violations.append('{0} edges were added (at most {1} allowed)'
+                          .format(added, max_added_edges))
+    worst = result['maxGrowth']
+    if max_growth is not None and worst is not None:
+        if worst['delta'] > max_growth:
+            violations.append('{0} transitively includes {1} more files (at '
+                              'most {2} allowed)'.format(worst['file'],
+                                                         worst['delta'],
+                                                         max_growth))
+    cycles = result['newCycleCount']
+    if max_new_cycles is not None and cycles > max_new_cycles:
+        violations.append('{0} new include cycles (at most {1} allowed)'
+                          .format(cycles, max_new_cycles))
+    return violations
@@ -0,0 +1,199 @@
+'''Reads the files of a git revision straight from the object store.'''
+
+import collections
+import errno
+import logging
+import os
+import subprocess
+
+log = logging.getLogger(__name__)
+
+# The mode of symbolic links in trees (see git-ls-tree)
+SYMLINK_MODE = b'120000'
+
+
+class GitError(Exception):
+    '''Raised when git fails, e.g. for unknown revisions.'''
+    pass
+
+
+def run(arguments, directory):
+    '''
+    Runs a git command and returns its output.
+
+    Args:
+        arguments: The arguments to pass to git
+        directory: The directory to run git in
+
+    Returns:
+        The standard output of the command (as bytes).
+
+    Raises:
+        GitError: If git could not be run or failed.
+    '''
+    try:
+        process = subprocess.Popen(['git'] + arguments,
+                                   cwd=directory,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+    except OSError as error:
+        raise GitError('Could not run git: {0}'.format(error))
+    output, error = process.communicate()
+    if process.returncode != 0:
+        raise GitError('git {0} failed: {1}'.format(
+            ' '.join(arguments), error.decode('utf-8', 'replace').strip()))
+    return output
+
+
+class Revision(object):
+    '''
+    The tree of a commit, as a source of files to scan.
+
+    Files are named by the path they would have in the working tree, so that
+    graphs of revisions look like graphs of checkouts. The tree is listed once
+    (`git ls-tree`), which answers all questions about which files and
+    directories exist and how large they are, and contents are streamed
+    through a single long-lived `git cat-file --batch` process. Symbolic links
+    and submodules are skipped.
+
+    Provides the same interface as `walk.FileSystem`.
+    '''
+
+    def __init__(self, directory, revision):
+        '''
+        Constructor.
+
+        Args:
+            directory: Any directory inside the repository
+            revision: The revision to read (anything git rev-parse accepts)
+
+        Raises:
+            GitError: If the directory is not in a repository or the revision
+                      does not exist.
+        '''
+        self.root = os.path.realpath(run(['rev-parse', '--show-toplevel'],
+                                         directory).decode('utf-8').strip())
+        try:
+            self.commit = run(['rev-parse', '--verify', '--quiet',
+                               revision + '^{commit}'],
+                              self.root).decode('utf-8').strip()
+        except GitError:
+            raise GitError('Unknown revision: {0}'.format(revision))
+
+        # Maps the (working tree) paths of files to the IDs of their blobs
+        self.blobs = {}
+        # Maps the (working tree) paths of files to the sizes of their blobs
+        self.sizes = {}
+        # Maps directories to the entries in them (see `list()`)
+        self.directories = collections.defaultdict(list)
+        output = run(['ls-tree', '-r', '-t', '-z', '--long', '--full-tree',
+                      self.commit],
+                     self.root)
+        for line in output.split(b'\0'):
+            if not line:
+                continue
+            info, path = line.split(b'\t', 1)
+            # The size is padded with spaces (and "-" for trees)
+            mode, kind, blob, size = info.split()
+            path = os.path.join(self.root,
+                                *path.decode('utf-8').split('/'))
+            directory, name = os.path.split(path)
+            if kind == b'tree':
+                self.directories[directory].append((name, path, True, False))
+            elif kind == b'blob':
+                is_symlink = mode == SYMLINK_MODE
+                self.directories[directory].append((name,
+                                                    path,
+                                                    False,
+                                                    is_symlink))
+                if not is_symlink:
+                    self.blobs[path] = blob
+                    self.sizes[path] = int(size)
+
+        self.process = None
+
+        log.debug('Listed %d files of %s at %s',
+                  len(self.blobs), revision, self.commit)
+
+    def list(self, directory):
+        '''
+        Lists a directory of the revision.
+
+        Args:
+            directory: The directory to list
+
+        Returns:
+            A list of (name, path, is_directory, is_symlink) tuples.
+
+        Raises:
+            OSError: If the directory does not exist in the revision.
+        '''
+        if directory not in self.directories and directory != self.root:
+            raise OSError(errno.ENOENT, 'Not in the revision', directory)
+        return self.directories.get(directory, [])
+
+    def listdir(self, directory):
+        '''
+        Returns:
+            The names of the entries of a directory of the revision (empty if
+            it does not exist).
+        '''
+        return [entry[0] for entry in self.directories.get(directory, ())]
+
+    def is_file(self, path):
+        '''
+        Returns:
+            True if the path is a file in the revision, else False.
+        '''
+        return path in self.blobs
+
+    def size(self, path):
+        '''
+        Returns:
+            The size of a file of the revision in bytes, or zero if it does
+            not exist in the revision.
+        '''
+        return self.sizes.get(path, 0)
+
+    def read(self, path):
+        '''
+        Reads the contents of a file of the revision.
+
+        Args:
+            path: The (working tree) path of the file
+
+        Returns:
+            The contents of the file (as bytes).
+
+        Raises:
+            IOError: If the file does not exist in the revision.
+        '''
+        blob = self.blobs.get(path)
+        if blob is None:
+            raise IOError(errno.ENOENT, 'Not in the revision', path)
+
+        if self.process is None:
+            self.process = subprocess.Popen(['git', 'cat-file', '--batch'],
+                                            cwd=self.root,
+                                            stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE)
+        self.process.stdin.write(blob + b'\n')
+        self.process.stdin.flush()
+
+        # The header is "<blob> blob <size>", followed by the contents and a
+        # newline
+        header = self.process.stdout.readline().split()
+        if len(header) != 3:
+            raise GitError('Could not read {0} from git'.format(path))
+        contents = self.process.stdout.read(int(header[2]))
+        self.process.stdout.read(1)
+
+        return contents
+
+    def close(self):
+        '''Stops the `git cat-file` process.'''
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process.stdout.close()
+            self.process = None
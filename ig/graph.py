@@ -1,22 +1,161 @@
 ''' Defines the graph structure that stores the include relationships. '''
 
+import array
+import collections
 import logging
 import os
 import random
+import sys
 
 
 log = logging.getLogger(__name__)
 
+try:
+    intern = sys.intern
+except AttributeError:
+    pass  # Python 2 has `intern` as a builtin
+
+
+def edge_key(source, target):
+    '''
+    Packs the endpoints of an edge into a single integer key.
+
+    Args:
+        source: The ID of the source node
+        target: The ID of the target node
+
+    Returns:
+        A key that is unique for the (ordered) pair of nodes.
+    '''
+    return (source << 32) | target
+
+
+class Node(object):
+    '''
+    The record stored for every node (file) in the graph.
+
+    The edges of a node are the IDs of the edges to the files it includes, or
+    None if the file itself was never scanned (e.g. a system header).
+    '''
+    __slots__ = ('group', 'color', 'edges')
+
+    def __init__(self, group, color):
+        '''
+        Constructor.
+
+        Args:
+            group: The (interned) group of the node
+            color: The color of the node, or None to pick one once needed
+        '''
+        self.group = group
+        self.color = color
+        self.edges = None
+
+
+class Delta(object):
+    '''
+    Records changes made to a graph, so that views of it can be patched.
+
+    Nodes and edges that were added or changed are stored by ID and
+    materialized with their latest contents (the only thing that can change
+    about an edge is its weight).
+    '''
+
+    def __init__(self, graph):
+        '''
+        Constructor.
+
+        Args:
+            graph: The graph whose changes to record
+        '''
+        self.graph = graph
+        self.nodes = set()
+        self.edges = set()
+        self.dropped_nodes = set()
+        self.dropped_edges = set()
+
+    def add_node(self, node_id):
+        '''
+        Records that a node was added or changed.
+
+        Args:
+            node_id: The ID of the node
+        '''
+        self.nodes.add(node_id)
+        self.dropped_nodes.discard(node_id)
+
+    def drop_node(self, node_id):
+        '''
+        Records that a node was removed.
+
+        Args:
+            node_id: The ID of the node
+        '''
+        self.nodes.discard(node_id)
+        self.dropped_nodes.add(node_id)
+
+    def add_edge(self, edge_id):
+        '''
+        Records that an edge was added or changed.
+
+        Args:
+            edge_id: The ID of the edge
+        '''
+        self.edges.add(edge_id)
+
+    def drop_edge(self, edge_id):
+        '''
+        Records that an edge was removed.
+
+        Args:
+            edge_id: The ID of the edge
+        '''
+        # An edge that is added and dropped again never has to be sent
+        if edge_id in self.edges:
+            self.edges.remove(edge_id)
+        else:
+            self.dropped_edges.add(edge_id)
+
+    def to_json(self):
+        '''
+        Returns:
+            A JSON (dictionary) representation of the changes.
+        '''
+        nodes = [self.graph.node_json(i) for i in sorted(self.nodes)]
+        edges = [self.graph.edge_json(i) for i in sorted(self.edges)]
+        return dict(nodes=nodes,
+                    edges=edges,
+                    droppedNodes=sorted(self.dropped_nodes),
+                    droppedEdges=sorted(self.dropped_edges))
+
+    @property
+    def is_empty(self):
+        '''
+        Returns:
+            True if no changes were recorded, else False.
+        '''
+        return not (self.nodes or self.edges or
+                    self.dropped_nodes or self.dropped_edges)
+
 
 class Graph(object):
     '''
     Stores nodes (files) and edges (includes).
 
-    Nodes are stored in a map from absolute filename to a dictionary, which
-    holds all the information required by sigma.js (e.g. ID and label). Edges
-    are stored as a list of (id, source, target) objects, along with some
-    additional information. The representation is not very compact or optimal,
-    but processing even very large projects still seems instant.
+    Every file path is interned into a table once and referred to by its
+    integer ID everywhere else. Per node, we store a small `Node` record along
+    with its coordinates in flat arrays. Edges always point in the "includes"
+    direction and are stored as flat arrays of source and target IDs and
+    weights (multiplicities), indexed by edge ID, while every scanned node
+    holds an array of the IDs of its outgoing edges. An index from (source,
+    target) pairs to edge IDs ensures there is at most one edge between any
+    two nodes. Removed nodes and edges leave a hole (a None record or a
+    negative source), so that IDs stay stable for views of the graph. IDs,
+    degrees and weights are stored as 32-bit integers.
+
+    The dictionaries required by sigma.js (e.g. with ID and label) are only
+    materialized when the graph is turned into JSON, and node sizes (degrees)
+    are computed from the adjacency structure at that point.
     '''
     def __init__(self,
                  relation,
@@ -35,8 +174,31 @@ class Graph(object):
         '''
         assert relation in ('includes', 'included-by')
 
-        self.edges = []
-        self.nodes = {}
+        self.names = []
+        self.ids = {}
+        self.nodes = []
+        self.xs = array.array('d')
+        self.ys = array.array('d')
+        self.in_degrees = array.array('i')
+        # The size of every file in bytes, recorded when it was scanned (zero
+        # for files that do not exist)
+        self.sizes = array.array('I')
+
+        self.sources = array.array('i')
+        self.targets = array.array('i')
+        self.weights = array.array('i')
+        self._edge_index = {}
+
+        self.node_count = 0
+        self.edge_count = 0
+
+        # Maps the IDs of nodes in include cycles to the index of their cycle
+        self.cycles = {}
+
+        # Maps directories (with a trailing separator) to the group of the
+        # files in them
+        self.groups = {}
+
         self.is_included_by_relation = (relation == 'included-by')
         self.use_full_path = full_path
         self.colors = colors
@@ -46,20 +208,160 @@ class Graph(object):
         '''
         Adds a new node to the graph, along with its adjacent neighbors.
 
+        If the node was already added before, its neighbors are replaced.
+
         Args:
             node_name: The name of the node (i.e. current file)
             neighbors: A list of names of neighbors (included files)
         '''
-        node = self._get_or_add_node(node_name)
+        self.update(node_name, neighbors, Delta(self))
+
+    def update(self, node_name, neighbors, delta):
+        '''
+        Replaces the neighbors of a (possibly new) node.
 
-        if not self.is_included_by_relation:
-            node['size'] = len(neighbors)
+        There is at most one edge between any two nodes. If a neighbor appears
+        several times, the multiplicity is stored as the weight of the edge.
+        Edges to neighbors that are kept are left in place, so that their IDs
+        remain stable.
 
+        Args:
+            node_name: The name of the node (i.e. current file)
+            neighbors: A list of names of neighbors (included files)
+            delta: A `Delta` to record the changes in
+        '''
+        node_id = self._get_or_add_node(node_name)
+        node = self.nodes[node_id]
+        if node.edges is None:
+            node.edges = array.array('i')
+
+        weights = collections.OrderedDict()
         for neighbor_name in neighbors:
-            neighbor = self._get_or_add_node(neighbor_name)
-            if self.is_included_by_relation:
-                neighbor['size'] += 1
-            self._add_edge(node, neighbor)
+            neighbor_id = self._get_or_add_node(neighbor_name)
+            weights[neighbor_id] = weights.get(neighbor_id, 0) + 1
+
+        kept = array.array('i')
+        for edge_id in node.edges:
+            weight = weights.pop(self.targets[edge_id], None)
+            if weight is None:
+                self._remove_edge(edge_id, delta)
+                continue
+            kept.append(edge_id)
+            if self.weights[edge_id] != weight:
+                self.weights[edge_id] = weight
+                delta.add_edge(edge_id)
+        node.edges = kept
+
+        for neighbor_id, weight in weights.items():
+            edge_id = self._add_edge(node_id, neighbor_id, weight)
+            node.edges.append(edge_id)
+            delta.add_node(neighbor_id)
+            delta.add_edge(edge_id)
+
+        delta.add_node(node_id)
+
+    def extend(self,
+               names,
+               scanned,
+               offsets,
+               targets,
+               weights,
+               in_degrees,
+               sizes,
+               xs,
+               ys):
+        '''
+        Adds many nodes and their edges to an empty graph at once.
+
+        The edges are given in compressed sparse row form: the edges of the
+        i-th node are those in [offsets[i], offsets[i + 1]), and become the
+        edges with these IDs. The index of edges is only built once it is
+        needed, since that is by far the most expensive part of loading.
+
+        Args:
+            names: The names of the nodes
+            scanned: For every node, whether it was scanned (has edges)
+            offsets: The offsets of the edges of every node (plus the end)
+            targets: An `array.array('i')` of the target of every edge
+            weights: An `array.array('i')` of the weight of every edge
+            in_degrees: An `array.array('i')` of the in-degree of every node
+            sizes: An `array.array('I')` of the size of every node in bytes
+            xs: An `array.array('d')` of the x position of every node
+            ys: An `array.array('d')` of the y position of every node
+        '''
+        assert self.is_empty and len(offsets) == len(names) + 1
+
+        self.names = list(names)
+        self.ids = dict(zip(self.names, range(len(self.names))))
+        self.nodes = [Node(self._group(name), None) for name in self.names]
+        self.xs = xs
+        self.ys = ys
+        self.node_count = len(self.names)
+
+        edge_ids = array.array('i', range(len(targets)))
+        self.sources = array.array('i')
+        for node_id, node in enumerate(self.nodes):
+            begin, end = offsets[node_id], offsets[node_id + 1]
+            if scanned[node_id]:
+                node.edges = edge_ids[begin:end]
+            if end > begin:
+                self.sources.extend(array.array('i', [node_id]) * (end - begin))
+        self.targets = targets
+        self.weights = weights
+        self.edge_count = len(targets)
+        self._edge_index = None
+        self.in_degrees = in_degrees
+        self.sizes = sizes
+
+    @property
+    def edge_index(self):
+        '''
+        Returns:
+            A map from `edge_key()`s to the IDs of the edges between them.
+        '''
+        if self._edge_index is None:
+            self._edge_index = dict(
+                (edge_key(source, target), edge_id)
+                for edge_id, (source, target)
+                in enumerate(zip(self.sources, self.targets))
+                if source >= 0)
+        return self._edge_index
+
+    def edge(self, source, target):
+        '''
+        Looks up the edge between two nodes.
+
+        Args:
+            source: The ID of the source (including) node
+            target: The ID of the target (included) node
+
+        Returns:
+            The ID of the edge, or None if there is no such edge.
+        '''
+        return self.edge_index.get(edge_key(source, target))
+
+    def remove(self, node_name, delta):
+        '''
+        Removes the includes of a node, e.g. because its file was deleted.
+
+        The node itself is only dropped if no other file includes it anymore.
+
+        Args:
+            node_name: The name of the node to remove
+            delta: A `Delta` to record the changes in
+        '''
+        node_id = self.ids.get(node_name)
+        if node_id is None or self.nodes[node_id].edges is None:
+            return
+
+        node = self.nodes[node_id]
+        edges, node.edges = node.edges, None
+        for edge_id in edges:
+            self._remove_edge(edge_id, delta)
+
+        if self.nodes[node_id] is not None:
+            if not self._maybe_drop_node(node_id, delta):
+                delta.add_node(node_id)
 
     def to_json(self):
         '''
@@ -71,8 +373,131 @@ class Graph(object):
         Returns:
             A JSON (dictionary) representation of the graph.
         '''
-        nodes = list(self.nodes.values())
-        return dict(nodes=nodes, edges=self.edges)
+        return dict(nodes=list(self.iter_nodes()), edges=list(self.iter_edges()))
+
+    def iter_nodes(self):
+        '''
+        Yields:
+            The JSON (dictionary) representation of every node, one at a time.
+        '''
+        for node_id in self.node_ids():
+            yield self.node_json(node_id)
+
+    def iter_edges(self):
+        '''
+        Yields:
+            The JSON (dictionary) representation of every edge, one at a time.
+        '''
+        for edge_id in self.edge_ids():
+            yield self.edge_json(edge_id)
+
+    def node_ids(self):
+        '''
+        Yields:
+            The IDs of all nodes in the graph.
+        '''
+        for node_id, node in enumerate(self.nodes):
+            if node is not None:
+                yield node_id
+
+    def edge_ids(self):
+        '''
+        Yields:
+            The IDs of all edges in the graph.
+        '''
+        for edge_id, source in enumerate(self.sources):
+            if source >= 0:
+                yield edge_id
+
+    def tag_cycles(self, cycles, delta=None):
+        '''
+        Marks nodes as members of include cycles in the JSON representation.
+
+        Args:
+            cycles: A list of cycles (lists of node IDs)
+            delta: An optional `Delta` to record the nodes whose tag changed
+                   in, e.g. all members of a cycle that was broken up
+        '''
+        previous, self.cycles = self.cycles, {}
+        for index, cycle in enumerate(cycles):
+            for node_id in cycle:
+                self.cycles[node_id] = index
+        if delta is not None:
+            for node_id in set(previous) | set(self.cycles):
+                if previous.get(node_id) != self.cycles.get(node_id) and \
+                   self.nodes[node_id] is not None:
+                    delta.add_node(node_id)
+
+    def size(self, node_id):
+        '''
+        Computes the size of a node, which is its degree in the relation.
+
+        Args:
+            node_id: The ID of the node
+
+        Returns:
+            The number of includes of the node (for "includes") or one more
+            than the number of files that include it (for "included-by").
+        '''
+        if self.is_included_by_relation:
+            return 1 + self.in_degrees[node_id]
+        edges = self.nodes[node_id].edges
+        return 1 if edges is None else len(edges)
+
+    def node_json(self, node_id):
+        '''
+        Materializes the dictionary sigma.js expects for a node.
+
+        Args:
+            node_id: The ID of the node
+
+        Returns:
+            The node object.
+        '''
+        node = self.nodes[node_id]
+        name = self.names[node_id]
+        if node.color is None:
+            node.color = self.colors.generate()
+        result = dict(id=node_id,
+                      size=self.size(node_id),
+                      color=node.color,
+                      label=name if self.use_full_path
+                      else os.path.basename(name),
+                      group=node.group,
+                      x=self.xs[node_id],
+                      y=self.ys[node_id])
+        cycle = self.cycles.get(node_id)
+        if cycle is not None:
+            result['cycle'] = cycle
+
+        return result
+
+    def edge_json(self, edge_id):
+        '''
+        Materializes the dictionary sigma.js expects for an edge.
+
+        Args:
+            edge_id: The ID of the edge
+
+        Returns:
+            The edge object.
+        '''
+        source = self.sources[edge_id]
+        target = self.targets[edge_id]
+
+        # The natural direction is "includes", so swap if we want "included-by"
+        if self.is_included_by_relation:
+            source, target = target, source
+
+        edge = dict(id=edge_id,
+                    size=10,  # Make the arrows larger?
+                    type='curvedArrow',
+                    source=source,
+                    target=target)
+        if self.weights[edge_id] != 1:
+            edge['weight'] = self.weights[edge_id]
+
+        return edge
 
     @property
     def is_empty(self):
@@ -80,22 +505,22 @@ class Graph(object):
         Returns:
             True if the graph has no nodes at all, else False.
         '''
-        return len(self.nodes) == 0
+        return self.node_count == 0
 
     def _get_or_add_node(self, node_name):
         '''
-        Returns a node and possibly adds it to the graph.
+        Returns the ID of a node and possibly adds it to the graph.
 
         Args:
             node_name: The name of the node to fetch
 
         Returns:
-            The node entry for the given name.
+            The node ID for the given name.
         '''
-        node = self.nodes.get(node_name)
-        if node is None:
-            node = self._add_node(node_name)
-        return node
+        node_id = self.ids.get(node_name)
+        if node_id is None or self.nodes[node_id] is None:
+            node_id = self._add_node(node_name)
+        return node_id
 
     def _add_node(self, node_name):
         '''
@@ -105,65 +530,117 @@ class Graph(object):
             node_name: The name of the node to add
 
         Returns:
-            The newly created node object.
+            The ID of the newly created node.
         '''
-        assert node_name not in self.nodes
-
-        node = {}
-        node['id'] = len(self.nodes)
-        node['size'] = 1
-        node['color'] = self.colors.generate()
-
-        if self.use_full_path:
-            node['label'] = node_name
-        else:
-            node['label'] = os.path.basename(node_name)
-
-        # Take up to the last two directory names as the group
-        directories = os.path.dirname(node_name).split(os.sep)
-        begin = len(directories) - self.group_granularity
-        node['group'] = os.sep.join(directories[begin:begin + 2])
+        node_id = len(self.nodes)
+        self.names.append(node_name)
+        self.ids[node_name] = node_id
+        self.nodes.append(Node(self._group(node_name), None))
+        self.in_degrees.append(0)
+        self.sizes.append(0)
 
         # Make the initial starting point random, but very small, so we get
         # an "explosion"/"expansion" effect.
-        node['x'] = random.random() * 0.01
-        node['y'] = random.random() * 0.01
+        self.xs.append(random.random() * 0.01)
+        self.ys.append(random.random() * 0.01)
+
+        self.node_count += 1
 
-        self.nodes[node_name] = node
+        return node_id
+
+    def _group(self, node_name):
+        '''
+        Determines the group of a node from its directory.
 
-        return node
+        Args:
+            node_name: The name of the node
 
-    def _add_edge(self, source, target):
+        Returns:
+            The (interned) group name.
+        '''
+        # Cheaper than (but equivalent to) keying on the dirname
+        head = node_name[:node_name.rfind(os.sep) + 1]
+        group = self.groups.get(head)
+        if group is None:
+            # Take up to the last two directory names as the group
+            directories = os.path.dirname(node_name).split(os.sep)
+            begin = len(directories) - self.group_granularity
+            group = intern(os.sep.join(directories[begin:begin + 2]))
+            self.groups[head] = group
+        return group
+
+    def _add_edge(self, source, target, weight=1):
         '''
         Adds an edge to the graph.
 
         Args:
-            source: The entry of the source node
-            target: The entry of the target node
+            source: The ID of the source (including) node
+            target: The ID of the target (included) node
+            weight: The multiplicity of the edge
 
         Returns:
-            The newly created edge object
+            The ID of the newly created edge.
         '''
-        edge = {}
-        edge['id'] = len(self.edges)
-        edge['size'] = 10  # Make the arrows larger?
-        edge['type'] = 'curvedArrow'
+        key = edge_key(source, target)
+        assert key not in self.edge_index
 
-        # The natural direction is "includes", so swap if we want "included-by"
-        if self.is_included_by_relation:
-            source, target = target, source
-        edge['source'] = source['id']
-        edge['target'] = target['id']
+        edge_id = len(self.sources)
+        self.sources.append(source)
+        self.targets.append(target)
+        self.weights.append(weight)
+        self.edge_index[key] = edge_id
+        self.in_degrees[target] += 1
+        self.edge_count += 1
 
-        self.edges.append(edge)
+        return edge_id
 
-        return edge
+    def _remove_edge(self, edge_id, delta):
+        '''
+        Removes an edge from the graph (and possibly its target with it).
+
+        The edge must already have been taken out of the edges of its source.
+
+        Args:
+            edge_id: The ID of the edge
+            delta: A `Delta` to record the changes in
+        '''
+        target = self.targets[edge_id]
+        del self.edge_index[edge_key(self.sources[edge_id], target)]
+        self.sources[edge_id] = -1
+        self.in_degrees[target] -= 1
+        self.edge_count -= 1
+        delta.drop_edge(edge_id)
+
+        if not self._maybe_drop_node(target, delta):
+            delta.add_node(target)
+
+    def _maybe_drop_node(self, node_id, delta):
+        '''
+        Drops a node if it was not scanned and is not included by any file.
+
+        Args:
+            node_id: The ID of the node
+            delta: A `Delta` to record the changes in
+
+        Returns:
+            True if the node was dropped, else False.
+        '''
+        node = self.nodes[node_id]
+        if node is None:
+            return True
+        if node.edges is not None or self.in_degrees[node_id] > 0:
+            return False
+        self.nodes[node_id] = None
+        del self.ids[self.names[node_id]]
+        self.node_count -= 1
+        delta.drop_node(node_id)
+        return True
 
     def __repr__(self):
         '''
         Returns:
             A string representation of the graph.
         '''
-        nodes = len(self.nodes)
-        edges = len(self.edges)
+        nodes = self.node_count
+        edges = self.edge_count
         return '<Graph: nodes = {0}, edges = {1}>'.format(nodes, edges)
@@ -0,0 +1,221 @@
+'''Decides which files and directories to skip while traversing a tree.'''
+
+import logging
+import os
+import re
+
+log = logging.getLogger(__name__)
+
+# The files (relative to a directory) whose rules apply under that directory
+GITIGNORE = '.gitignore'
+GIT_EXCLUDE = os.path.join('.git', 'info', 'exclude')
+
+
+def translate(pattern):
+    '''
+    Translates a glob pattern into a regular expression, the way git does.
+
+    Unlike `fnmatch.translate()`, wildcards never match a slash, except for
+    "**", which matches any number of directories.
+
+    Args:
+        pattern: The glob pattern
+
+    Returns:
+        The (unanchored) regular expression, as a string.
+    '''
+    parts = []
+    index = 0
+    while index < len(pattern):
+        if pattern.startswith('**/', index):
+            parts.append('(?:.*/)?')
+            index += 3
+        elif pattern.startswith('/**', index) and index + 3 == len(pattern):
+            parts.append('/.+')
+            index += 3
+        elif pattern.startswith('**', index):
+            parts.append('.*')
+            index += 2
+        elif pattern[index] == '*':
+            parts.append('[^/]*')
+            index += 1
+        elif pattern[index] == '?':
+            parts.append('[^/]')
+            index += 1
+        elif pattern[index] == '[':
+            # A closing bracket right after the opening one is literal
+            end = pattern.find(']', index + 2)
+            if end < 0:
+                parts.append(re.escape('['))
+                index += 1
+                continue
+            characters = pattern[index + 1:end].replace('\\', '\\\\')
+            if characters.startswith('!'):
+                characters = '^' + characters[1:]
+            parts.append('[{0}]'.format(characters))
+            index = end + 1
+        elif pattern[index] == '\\' and index + 1 < len(pattern):
+            parts.append(re.escape(pattern[index + 1]))
+            index += 2
+        else:
+            parts.append(re.escape(pattern[index]))
+            index += 1
+    return ''.join(parts)
+
+
+def parse_rule(line):
+    '''
+    Parses a line of a .gitignore file.
+
+    Args:
+        line: The line
+
+    Returns:
+        A tuple (regex, negated) of the regular expression matching the paths
+        the rule applies to (relative to the directory of the rule, with a
+        trailing slash for directories), and whether the rule re-includes
+        them. None for blank lines and comments.
+    '''
+    line = line.rstrip('\r\n')
+    if not line.endswith('\\ '):
+        line = line.rstrip()
+    if not line or line.startswith('#'):
+        return None
+
+    negated = line.startswith('!')
+    if negated:
+        line = line[1:]
+    directory_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+
+    # Patterns with a slash are relative to the directory of the rule, others
+    # match a name at any depth
+    anchored = '/' in line
+    regex = translate(line.lstrip('/'))
+    if not anchored:
+        regex = '(?:.*/)?' + regex
+    regex += '/' if directory_only else '/?'
+    return regex, negated
+
+
+class Rules(object):
+    '''
+    A set of ignore rules relative to a directory, e.g. one .gitignore file.
+
+    All glob rules are combined into a single regular expression, so every
+    path is matched once per set of rules. The alternatives are in reverse
+    order, so the one that matches first is the last rule in the file, which
+    is the one that decides (as in git).
+    '''
+
+    def __init__(self, directory, lines, regexes=()):
+        '''
+        Constructor.
+
+        Args:
+            directory: The directory the rules are relative to
+            lines: The glob rules, in .gitignore syntax
+            regexes: Additional regular expressions, searched for in relative
+                     paths (with a trailing slash for directories)
+        '''
+        self.prefix = os.path.join(directory, '')
+        rules = [r for r in map(parse_rule, lines) if r is not None]
+        rules.reverse()
+
+        self.globs = None
+        if rules:
+            self.globs = re.compile('|'.join(
+                r'({0}\Z)'.format(regex) for regex, _ in rules))
+        # Indexed by the number of the group that matched
+        self.negated = [None] + [negated for _, negated in rules]
+        self.regexes = re.compile('|'.join(regexes)) if regexes else None
+
+    @property
+    def is_empty(self):
+        '''
+        Returns:
+            True if there are no rules at all, else False.
+        '''
+        return self.globs is None and self.regexes is None
+
+    def match(self, path, is_directory):
+        '''
+        Matches a path against the rules.
+
+        Args:
+            path: The path (under the directory of the rules)
+            is_directory: Whether the path is a directory
+
+        Returns:
+            True if the path is ignored, False if it is explicitly included
+            again and None if no rule applies.
+        '''
+        relative = path[len(self.prefix):]
+        if os.sep != '/':
+            relative = relative.replace(os.sep, '/')
+        if is_directory:
+            relative += '/'
+        if self.globs is not None:
+            match = self.globs.match(relative)
+            if match is not None:
+                return not self.negated[match.lastindex]
+        if self.regexes is not None and self.regexes.search(relative):
+            return True
+        return None
+
+
+def read_file(path):
+    '''
+    Returns:
+        The contents of a file (as bytes).
+    '''
+    with open(path, 'rb') as source:
+        return source.read()
+
+
+def read_rules(directory, filenames, read=read_file):
+    '''
+    Reads the rules of ignore files in a directory.
+
+    Args:
+        directory: The directory
+        filenames: The names of ignore files to look for (relative to it)
+        read: The function to read a file with, which raises an `IOError` or
+              `OSError` for files that do not exist
+
+    Returns:
+        The `Rules` of all files that exist, or None if there are none.
+    '''
+    lines = []
+    for filename in filenames:
+        path = os.path.join(directory, filename)
+        try:
+            contents = read(path)
+        except (IOError, OSError):
+            continue
+        lines.extend(contents.decode('utf-8', 'replace').splitlines())
+        log.debug('Read ignore rules from %s', path)
+    rules = Rules(directory, lines)
+    return None if rules.is_empty else rules
+
+
+def is_ignored(rules, path, is_directory):
+    '''
+    Decides whether to skip a path.
+
+    Args:
+        rules: A sequence of `Rules`, from the outermost to the innermost
+               directory, so that inner rules take precedence
+        path: The path to decide on
+        is_directory: Whether the path is a directory
+
+    Returns:
+        True if the path should be skipped, else False.
+    '''
+    for rule_set in reversed(rules):
+        result = rule_set.match(path, is_directory)
+        if result is not None:
+            return result
+    return False
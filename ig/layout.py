@@ -0,0 +1,218 @@
+'''Computes node positions on the server, so the page can skip its layout.'''
+
+import logging
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+log = logging.getLogger(__name__)
+
+# Above this many nodes, repulsion is estimated from a random sample of nodes
+SAMPLE_SIZE = 1024
+
+# The number of nodes whose repulsion is computed in one vectorized step
+CHUNK_SIZE = 1024
+
+
+def force_directed(positions, edges, masses, iterations, random):
+    '''
+    Runs a (Fruchterman-Reingold) force-directed layout.
+
+    All nodes repel each other, proportionally to their mass, while edges
+    pull their endpoints together, proportionally to their weight. For large
+    inputs, the repulsion on every node is estimated from a random sample of
+    the other nodes, which keeps every iteration linear in the number of
+    nodes.
+
+    Args:
+        positions: An (n, 2) array of initial positions, updated in place
+        edges: A tuple of (sources, targets, weights) arrays
+        masses: An array of the masses of the n nodes
+        iterations: The number of iterations to run
+        random: The `numpy.random.RandomState` to sample with
+
+    Returns:
+        The positions.
+    '''
+    count = len(positions)
+    if count < 2:
+        return positions
+
+    sources, targets, weights = edges
+    ideal = math.sqrt(1.0 / count)
+    temperature = 0.1
+    cooling = temperature / (iterations + 1)
+
+    for _ in range(iterations):
+        displacement = np.zeros_like(positions)
+
+        if count > SAMPLE_SIZE:
+            sample = random.choice(count, SAMPLE_SIZE, replace=False)
+            others, other_masses = positions[sample], masses[sample]
+            scale = count / float(SAMPLE_SIZE)
+        else:
+            others, other_masses, scale = positions, masses, 1.0
+
+        for begin in range(0, count, CHUNK_SIZE):
+            chunk = positions[begin:begin + CHUNK_SIZE]
+            dx = chunk[:, 0, None] - others[None, :, 0]
+            dy = chunk[:, 1, None] - others[None, :, 1]
+            force = np.maximum(dx * dx + dy * dy, 1e-9)
+            np.divide(ideal * ideal * other_masses[None, :], force, out=force)
+            # sum_j (p_i - p_j) * f_ij == p_i * sum_j f_ij - sum_j f_ij * p_j
+            displacement[begin:begin + CHUNK_SIZE] += scale * (
+                chunk * force.sum(axis=1)[:, None] - force.dot(others))
+
+        if len(sources) > 0:
+            delta = positions[sources] - positions[targets]
+            distance = np.sqrt((delta ** 2).sum(axis=-1))
+            force = delta * (distance * weights / ideal)[:, None]
+            for axis in range(2):
+                displacement[:, axis] += (
+                    np.bincount(targets, force[:, axis], count) -
+                    np.bincount(sources, force[:, axis], count))
+
+        length = np.maximum(np.sqrt((displacement ** 2).sum(axis=-1)), 1e-9)
+        positions += displacement * (np.minimum(length, temperature) /
+                                     length)[:, None]
+        temperature -= cooling
+
+    return positions
+
+
+def normalize(positions):
+    '''
+    Centers positions around the origin and scales them into the unit disk.
+
+    Args:
+        positions: An (n, 2) array of positions, updated in place
+
+    Returns:
+        The positions.
+    '''
+    positions -= positions.mean(axis=0)
+    radius = np.sqrt((positions ** 2).sum(axis=-1)).max()
+    if radius > 0:
+        positions /= radius
+    return positions
+
+
+def separate(centers, radii):
+    '''
+    Scales the distances between circles so that none of them overlap.
+
+    Args:
+        centers: A (g, 2) array of circle centers, updated in place
+        radii: The radii of the g circles
+
+    Returns:
+        The centers.
+    '''
+    factor = 1.0
+    for begin in range(0, len(centers), CHUNK_SIZE):
+        chunk = centers[begin:begin + CHUNK_SIZE]
+        distance = np.sqrt(((chunk[:, None, :] - centers[None, :, :]) ** 2)
+                           .sum(axis=-1))
+        required = radii[begin:begin + CHUNK_SIZE, None] + radii[None, :]
+        for row in range(len(chunk)):
+            distance[row, begin + row] = np.inf  # Ignore the circle itself
+        factor = max(factor, (required / np.maximum(distance, 1e-9)).max())
+    centers *= factor
+    return centers
+
+
+def layout(graph, iterations=50, seed=None):
+    '''
+    Computes the positions of all nodes in a graph.
+
+    This is a two-level layout: first, the groups of the graph are laid out,
+    with one node per group (weighted by the number of files in it) and edges
+    aggregated between groups. Then, the files of every group are laid out
+    among themselves, and placed inside a disk around the group's position
+    whose area is proportional to the size of the group.
+
+    Args:
+        graph: The graph whose positions to set
+        iterations: The number of iterations of each force-directed layout
+        seed: An optional seed, to make the layout reproducible
+
+    Raises:
+        RuntimeError: If NumPy is not available.
+    '''
+    if np is None:
+        raise RuntimeError('Computing layouts requires NumPy '
+                           '(pip install numpy)')
+
+    random = np.random.RandomState(seed)
+
+    node_ids = np.array(list(graph.node_ids()), dtype=np.int64)
+    if len(node_ids) == 0:
+        return
+    index = np.full(len(graph.nodes), -1, dtype=np.int64)
+    index[node_ids] = np.arange(len(node_ids))
+
+    group_names = sorted(set(graph.nodes[i].group for i in node_ids))
+    group_index = dict((name, i) for i, name in enumerate(group_names))
+    groups = np.array([group_index[graph.nodes[i].group] for i in node_ids])
+
+    all_sources = np.asarray(graph.sources, dtype=np.int64)
+    alive = all_sources >= 0
+    sources = index[all_sources[alive]]
+    targets = index[np.asarray(graph.targets, dtype=np.int64)[alive]]
+
+    # Coarse level: one node per group
+    sizes = np.bincount(groups, minlength=len(group_names)).astype(float)
+    between = groups[sources] != groups[targets]
+    pairs = (groups[sources[between]] * len(group_names) +
+             groups[targets[between]])
+    pairs, counts = np.unique(pairs, return_counts=True)
+    group_edges = (pairs // len(group_names),
+                   pairs % len(group_names),
+                   counts / float(max(1, counts.max(initial=0))))
+    centers = random.uniform(-1, 1, (len(group_names), 2))
+    force_directed(centers, group_edges, sizes, iterations, random)
+    radii = np.sqrt(sizes / sizes.sum())
+    separate(normalize(centers), radii)
+    log.debug('Laid out %d groups', len(group_names))
+
+    # Fine level: the files of every group around their group's center
+    node_order = np.argsort(groups, kind='stable')
+    node_bounds = np.searchsorted(groups[node_order],
+                                  np.arange(len(group_names) + 1))
+    local = np.empty(len(node_ids), dtype=np.int64)
+    for group in range(len(group_names)):
+        members = node_order[node_bounds[group]:node_bounds[group + 1]]
+        local[members] = np.arange(len(members))
+
+    inner_sources = sources[~between]
+    inner_targets = targets[~between]
+    inner_groups = groups[inner_sources]
+    edge_order = np.argsort(inner_groups, kind='stable')
+    edge_bounds = np.searchsorted(inner_groups[edge_order],
+                                  np.arange(len(group_names) + 1))
+
+    positions = np.zeros((len(node_ids), 2))
+    for group in range(len(group_names)):
+        members = node_order[node_bounds[group]:node_bounds[group + 1]]
+        edges = edge_order[edge_bounds[group]:edge_bounds[group + 1]]
+        local_edges = (local[inner_sources[edges]],
+                       local[inner_targets[edges]],
+                       np.ones(len(edges)))
+        points = random.uniform(-1, 1, (len(members), 2))
+        force_directed(points,
+                       local_edges,
+                       np.ones(len(members)),
+                       iterations,
+                       random)
+        if len(members) > 1:
+            normalize(points)
+        positions[members] = centers[group] + points * radii[group]
+
+    for (x, y), node_id in zip(positions.tolist(), node_ids.tolist()):
+        graph.xs[node_id] = x
+        graph.ys[node_id] = y
+
+    log.debug('Laid out %d nodes', len(node_ids))
@@ -3,11 +3,15 @@
 from __future__ import print_function
 
 import argparse
+import errno
+import json
 import logging
 import os
 import sys
+import threading
 
-from ig import colors, graph, serve, walk
+from ig import analysis, api, cache, colors, diff, output, report, stats, store
+from ig import git, walk
 
 
 def setup_logging():
@@ -33,38 +37,172 @@ def parse_arguments(args):
     Returns:
         The parsed arguments.
     '''
-    parser = argparse.ArgumentParser(description='Visualize C++ include graphs')
+    parser = argparse.ArgumentParser(
+        description='Visualize C++ include graphs',
+        epilog='Run "ig diff -h" to see how to compare two graphs.')
     parser.add_argument('directories',
-                        nargs='+',
+                        nargs='*',
                         help='The directories to inspect')
+    parser.add_argument('--compdb',
+                        help='A compilation database (compile_commands.json) '
+                             'whose translation units to scan, following '
+                             'includes with their -I/-iquote/-isystem paths')
+    parser.add_argument('--rev',
+                        metavar='REVISION',
+                        help='Scan the files of a git revision (e.g. a branch '
+                             'or commit) of the repository the directories '
+                             'are in, straight from git, without checking it '
+                             'out')
     parser.add_argument('--pattern',
                         action='append',
-                        default=['*.[ch]pp', '*.[ch]'],
+                        default=list(api.PATTERNS),
                         dest='patterns',
                         help='The file (glob) patterns to look for')
+    parser.add_argument('--exclude',
+                        action='append',
+                        dest='excludes',
+                        default=[],
+                        metavar='GLOB',
+                        help='Skip files and directories matching a pattern '
+                             'in .gitignore syntax, e.g. "build/" or '
+                             '"third_party/**/*.h". Excluded directories are '
+                             'not traversed at all')
+    parser.add_argument('--exclude-regex',
+                        action='append',
+                        dest='exclude_regexes',
+                        default=[],
+                        metavar='REGEX',
+                        help='Skip files and directories whose path relative '
+                             'to the scanned directory (with a trailing slash '
+                             'for directories) contains a match')
+    parser.add_argument('--gitignore',
+                        action='store_true',
+                        help='Skip what the .gitignore files in the tree '
+                             'ignore, along with .git')
     parser.add_argument('-i', '-I', '--prefix',
                         action='append',
                         dest='prefixes',
                         default=[os.getcwd()],
                         help='An include path for headers to recognize')
+    parser.add_argument('--preamble-only',
+                        action='store_true',
+                        help='Stop looking for includes after the first line '
+                             'of code in every file')
+    parser.add_argument('-D', '--define',
+                        action='append',
+                        dest='defines',
+                        default=[],
+                        metavar='NAME[=VALUE]',
+                        help='A macro to consider defined when evaluating '
+                             'conditionals (implies --conditionals)')
+    parser.add_argument('-U', '--undefine',
+                        action='append',
+                        dest='undefines',
+                        default=[],
+                        metavar='NAME',
+                        help='A macro to consider undefined when evaluating '
+                             'conditionals (implies --conditionals)')
+    parser.add_argument('--conditionals',
+                        action='store_true',
+                        help='Skip includes in #if/#ifdef branches that are '
+                             'known not to be compiled. Macros that are '
+                             'neither defined nor undefined are unknown, and '
+                             'both branches depending on them are kept')
+    parser.add_argument('--jobs',
+                        type=int,
+                        default=1,
+                        help='The number of processes to scan files with '
+                             '(0 means one per CPU)')
+    parser.add_argument('--cache',
+                        nargs='?',
+                        const=cache.default_path(),
+                        help='Cache the includes of every file in an SQLite '
+                             'database and only re-scan files that changed. '
+                             'Defaults to {0}'.format(cache.default_path()))
+    parser.add_argument('--cache-hash',
+                        action='store_true',
+                        help='Compare content hashes before invalidating '
+                             'cache entries of files that were only touched')
     parser.add_argument('-v', '--verbose',
                         action='store_true',
                         help='Turn on verbose output')
+    parser.add_argument('--stats',
+                        action='store_true',
+                        help='Print the time and memory every stage took, '
+                             'along with statistics of the scan, to stderr')
+    parser.add_argument('--stats-json',
+                        metavar='PATH',
+                        help='Write the statistics of --stats to a JSON file')
+    parser.add_argument('--profile',
+                        metavar='PATH',
+                        help='Profile the scan with cProfile and dump the '
+                             'profile to a file (only the main process is '
+                             'profiled, so combine it with --jobs 1)')
 
     parser.add_argument('-p', '--port',
                         type=int,
                         default=8080,
                         help='The port to serve the visualization on')
+    parser.add_argument('--host',
+                        default='',
+                        help='The host (address) to serve the visualization '
+                             'on. Defaults to all interfaces.')
     parser.add_argument('-o', '--open',
                         action='store_true',
                         help='Open the webpage immediately')
+    parser.add_argument('--save',
+                        metavar='PATH',
+                        help='Save the graph to a binary (.igb) file instead '
+                             'of serving it')
+    parser.add_argument('--load',
+                        metavar='PATH',
+                        help='Load the graph from a binary (.igb) file saved '
+                             'with --save instead of scanning directories')
     parser.add_argument('-j', '--json',
                         action='store_true',
                         help='Print the graph JSON instead of serving it')
+    parser.add_argument('--ndjson',
+                        action='store_true',
+                        help='With --json, print one node or edge per line')
+    parser.add_argument('--report',
+                        choices=sorted(report.REPORTS),
+                        help='Print a report about the graph instead of '
+                             'serving it')
+    parser.add_argument('--report-format',
+                        choices=['table', 'json'],
+                        default='table',
+                        help='The output format of the report')
+    parser.add_argument('--report-limit',
+                        type=int,
+                        help='The maximum number of rows in the report')
+    parser.add_argument('--api',
+                        action='store_true',
+                        help='Let the page query parts of the graph from the '
+                             'server instead of loading all of it')
+    parser.add_argument('--api-limit',
+                        type=int,
+                        default=5000,
+                        help='The maximum number of nodes the query API '
+                             'returns at once')
+    parser.add_argument('--clusters',
+                        action='store_true',
+                        help='Start with the graph collapsed into clusters of '
+                             'directories, which expand on click and collapse '
+                             'on right click (implies --api)')
+    parser.add_argument('-w', '--watch',
+                        action='store_true',
+                        help='Keep watching the directories for changes and '
+                             'update the visualization live')
+    parser.add_argument('--watch-interval',
+                        type=float,
+                        default=1.0,
+                        help='The number of seconds between checks for '
+                             'changes in watch mode')
     parser.add_argument('-d', '--dir',
                         dest='directory',
-                        help='The directory to store the served files in. If '
-                             'not supplied, a temporary directory is created.')
+                        help='The directory to store the generated files in. '
+                             'If not supplied, a temporary directory is '
+                             'created.')
 
     parser.add_argument('--relation',
                         choices=['includes', 'included-by'],
@@ -75,6 +213,21 @@ def parse_arguments(args):
                         default=0.1,
                         help='The initial minimum degree nodes should have to '
                              'be displayed')
+    parser.add_argument('--tag-cycles',
+                        action='store_true',
+                        help='Mark files in include cycles, so they can be '
+                             'highlighted')
+    parser.add_argument('--layout',
+                        action='store_true',
+                        help='Compute the layout of the graph up front (this '
+                             'requires NumPy), instead of in the browser')
+    parser.add_argument('--layout-iterations',
+                        type=int,
+                        default=50,
+                        help='The number of iterations of the layout')
+    parser.add_argument('--layout-seed',
+                        type=int,
+                        help='A seed to make the layout reproducible')
     parser.add_argument('--group-granularity',
                         type=int,
                         default=2,
@@ -97,9 +250,26 @@ def parse_arguments(args):
 
     args = parser.parse_args(args)
 
+    if args.load is None:
+        if not args.directories and args.compdb is None:
+            parser.error('Give at least one directory or a --compdb')
+    elif args.directories or args.compdb is not None:
+        parser.error('--load cannot be combined with directories or --compdb')
+    elif args.watch:
+        parser.error('--load cannot be combined with --watch')
+    if args.rev is not None and (args.load is not None or args.watch):
+        parser.error('--rev cannot be combined with --load or --watch')
+    try:
+        walk.check_arguments(args)
+    except ValueError as error:
+        parser.error(str(error))
+
     # Necessary for standard includes
     args.prefixes.append('')
 
+    if args.clusters:
+        args.api = True
+
     if not (0 <= args.color_alpha_min <= 1):
         raise RuntimeError('--color-alpha-min must be in interval [0, 1]')
 
@@ -109,52 +279,279 @@ def parse_arguments(args):
     return args
 
 
-def make_json(args, graph_json):
+def parse_diff_arguments(args):
+    '''
+    Parses the arguments of `ig diff`.
+
+    Args:
+        args: The list of arguments after "diff"
+
+    Returns:
+        The parsed arguments, along with a list of the remaining arguments,
+        which configure the scan of directories.
+    '''
+    parser = argparse.ArgumentParser(
+        prog='ig diff',
+        description='Compare two include graphs and report the changes as '
+                    'JSON. Any other options configure the scan of '
+                    'directories, as for ig itself.')
+    parser.add_argument('old',
+                        help='The old graph: a file saved with --save, a '
+                             'directory to scan or a git revision of the '
+                             'current directory')
+    parser.add_argument('new',
+                        help='The new graph: a file saved with --save, a '
+                             'directory to scan or a git revision of the '
+                             'current directory')
+    parser.add_argument('--max-added-edges',
+                        type=int,
+                        help='Fail if more edges than this were added')
+    parser.add_argument('--max-growth',
+                        type=int,
+                        help='Fail if the number of files any file '
+                             'transitively includes grew by more than this')
+    parser.add_argument('--max-new-cycles',
+                        type=int,
+                        help='Fail if more include cycles than this appeared')
+    parser.add_argument('--limit',
+                        type=int,
+                        help='The maximum number of entries of every list in '
+                             'the report')
+    return parser.parse_known_args(args)
+
+
+def read_graph(path, scan_arguments):
     '''
-    Creates the JSON payload for the visualization.
+    Loads a saved graph or scans a directory or revision, for `ig diff`.
+
+    Args:
+        path: A file saved with --save, a directory or a git revision
+        scan_arguments: Further arguments for scanning a directory
+
+    Returns:
+        The graph, along with the directories it was scanned from.
+
+    Raises:
+        IOError: If the path is neither a file nor a revision.
+    '''
+    if os.path.isdir(path):
+        args = parse_arguments(scan_arguments + [path])
+        return api.build(args), [os.path.realpath(path)]
+
+    if not os.path.exists(path):
+        args = parse_arguments(scan_arguments + ['--rev', path, os.curdir])
+        try:
+            return api.build(args), [os.path.realpath(os.curdir)]
+        except git.GitError as error:
+            logging.getLogger(__package__).debug('%s', error)
+            raise IOError(errno.ENOENT, 'No such file or revision', path)
+
+    args = parse_arguments(scan_arguments + ['--load', path])
+    include_graph = api.new_graph(args)
+    metadata = store.load(include_graph, path)
+    return include_graph, metadata.get('directories', [])
+
+
+def run_diff(args):
+    '''
+    Runs `ig diff`, printing the report to stdout.
+
+    Args:
+        args: The list of arguments after "diff"
+
+    Returns:
+        The exit code: 1 if any threshold was exceeded, 2 if a graph could not
+        be read, else 0.
+    '''
+    args, scan_arguments = parse_diff_arguments(args)
+    try:
+        old, old_roots = read_graph(args.old, scan_arguments)
+        new, new_roots = read_graph(args.new, scan_arguments)
+    except (IOError, OSError, store.FormatError) as error:
+        logging.getLogger(__package__).error('Could not read a graph: %s',
+                                             error)
+        return 2
+
+    result = diff.compare(old, old_roots, new, new_roots, args.limit)
+    result['violations'] = diff.check(result,
+                                      args.max_added_edges,
+                                      args.max_growth,
+                                      args.max_new_cycles)
+
+    json.dump(result, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+
+    for violation in result['violations']:
+        logging.getLogger(__package__).error(violation)
+
+    return 1 if result['violations'] else 0
+
+
+def make_metadata(args):
+    '''
+    Creates the metadata to save along with a graph.
 
     Args:
         args: The command line arguments.
-        graph_json: The JSON dict from the graph.
 
     Returns:
-        The payload.
+        A dictionary of the roots of the scan and the revision scanned, if
+        any.
     '''
-    if args.json:
-        print(graph_json)
-        sys.exit(0)
+    compdb = args.compdb and os.path.realpath(args.compdb)
+    return dict(directories=[os.path.realpath(d) for d in args.directories],
+                compdb=compdb,
+                rev=args.rev)
 
-    # Additional settings to configure the visualization
-    settings = dict(initialDegree=args.min_degree)
 
-    return dict(settings=settings, graph=graph_json)
+def make_settings(args):
+    '''
+    Creates the settings to configure the visualization with.
+
+    Args:
+        args: The command line arguments.
+
+    Returns:
+        The settings.
+    '''
+    return dict(initialDegree=args.min_degree,
+                watch=args.watch,
+                layout=args.layout,
+                api=args.api,
+                clusters=args.clusters,
+                cycles=args.tag_cycles)
+
+
+def write_stats(args, run_stats):
+    '''
+    Emits the statistics of a run, if requested.
+
+    Args:
+        args: The command line arguments.
+        run_stats: The `stats.Stats` of the run
+    '''
+    if args.stats:
+        run_stats.write_summary(sys.stderr)
+    if args.stats_json is not None:
+        run_stats.write(args.stats_json)
 
 
 def main():
     log = setup_logging()
 
+    if sys.argv[1:2] == ['diff']:
+        sys.exit(run_diff(sys.argv[2:]))
+
     args = parse_arguments(sys.argv[1:])
     if args.verbose:
         log.setLevel(logging.DEBUG)
     log.debug('Received arguments: %s', args)
 
-    include_graph = graph.Graph(args.relation,
-                                args.full_path,
-                                args.colors,
-                                args.group_granularity)
-    walk.walk(include_graph, args)
+    run_stats = stats.Stats()
+    if args.load is not None:
+        with run_stats.stage('load'), stats.profile(args.profile):
+            include_graph = api.new_graph(args)
+            try:
+                store.load(include_graph, args.load)
+            except (IOError, OSError, store.FormatError) as error:
+                log.error('Could not load the graph: %s', error)
+                sys.exit(1)
+    else:
+        with run_stats.stage('walk'), stats.profile(args.profile):
+            try:
+                include_graph = api.build(args, run_stats.counters)
+            except git.GitError as error:
+                log.error('Could not read the revision: %s', error)
+                sys.exit(1)
 
     if include_graph.is_empty:
         log.debug('Could not find a single node, exiting')
         sys.exit(-1)
 
-    json = make_json(args, include_graph.to_json())
+    if args.tag_cycles:
+        with run_stats.stage('cycles'):
+            include_graph.tag_cycles(analysis.cycles(include_graph))
+
+    if args.layout:
+        # Imported here since numpy is slow to import and unused otherwise
+        from ig import layout
+        with run_stats.stage('layout'):
+            layout.layout(include_graph,
+                          args.layout_iterations,
+                          args.layout_seed)
+
+    if args.save is not None:
+        with run_stats.stage('save'):
+            store.save(include_graph, args.save, make_metadata(args))
+        write_stats(args, run_stats)
+        return
+
+    if args.json:
+        with run_stats.stage('json'):
+            output.write_graph(sys.stdout, include_graph, args.ndjson)
+        write_stats(args, run_stats)
+        return
+
+    if args.report:
+        with run_stats.stage('report'):
+            report.write(sys.stdout,
+                         include_graph,
+                         args.report,
+                         args.report_format,
+                         args.report_limit)
+        write_stats(args, run_stats)
+        return
+
+    # Only needed to serve the visualization
+    from ig import query, serve, watch
+
+    settings = make_settings(args)
+
+    # Guards the graph once other threads (watcher, queries) get to it
+    lock = threading.Lock()
+
+    queries = None
+    served_graph = include_graph
+    if args.api:
+        queries = query.Query(include_graph, lock, args.api_limit)
+        served_graph = None
 
     with serve.Server(args.directory) as server:
-        server.write(json)
-        server.run(args.open, args.port)
+        with run_stats.stage('write'):
+            server.write(settings, served_graph)
+        write_stats(args, run_stats)
+
+        events = None
+        if args.watch:
+            events = serve.EventStream()
+
+            def on_change(delta):
+                with lock:
+                    if args.tag_cycles:
+                        include_graph.tag_cycles(
+                            analysis.cycles(include_graph), delta)
+                    payload = delta.to_json()
+                if queries is not None:
+                    queries.invalidate()
+                events.publish(payload)
+                with lock:
+                    server.write(settings, served_graph, compressed=False)
+                # Compressing a large payload takes a while, so do it without
+                # holding up queries (or the watcher) on the graph
+                server.compress()
+
+            watcher = watch.Watcher(include_graph,
+                                    args,
+                                    on_change,
+                                    args.watch_interval,
+                                    lock)
+            watcher.start()
+            server.watcher = watcher
+
+        server.run(args.open, args.port, events, queries, args.host)
 
     log.info('Shutting down')
 
+
 if __name__ == '__main__':
     main()
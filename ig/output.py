@@ -0,0 +1,73 @@
+'''Serializes graphs to JSON incrementally.'''
+
+import json
+
+# Compact separators, since nobody reads megabytes of JSON by hand
+ENCODER = json.JSONEncoder(separators=(',', ':'))
+
+
+def write_array(stream, items):
+    '''
+    Writes a JSON array, one item at a time.
+
+    Args:
+        stream: The (text) file object to write to
+        items: An iterable of JSON-serializable items
+    '''
+    stream.write('[')
+    for index, item in enumerate(items):
+        if index > 0:
+            stream.write(',')
+        stream.write(ENCODER.encode(item))
+    stream.write(']')
+
+
+def write_graph(stream, graph, ndjson=False):
+    '''
+    Writes a graph as JSON, without ever building the whole document in memory.
+
+    The format is the same as that of `Graph.to_json()`, i.e. {"nodes": [...],
+    "edges": [...]}. With `ndjson`, every node is instead written as a line
+    {"node": {...}} and every edge as a line {"edge": {...}}.
+
+    Args:
+        stream: The (text) file object to write to
+        graph: The graph to write
+        ndjson: Whether to write newline-delimited JSON
+    '''
+    if ndjson:
+        for node in graph.iter_nodes():
+            stream.write(ENCODER.encode(dict(node=node)))
+            stream.write('\n')
+        for edge in graph.iter_edges():
+            stream.write(ENCODER.encode(dict(edge=edge)))
+            stream.write('\n')
+        return
+
+    stream.write('{"nodes":')
+    write_array(stream, graph.iter_nodes())
+    stream.write(',"edges":')
+    write_array(stream, graph.iter_edges())
+    stream.write('}')
+
+
+def write_payload(stream, settings, graph):
+    '''
+    Writes the payload for the visualization.
+
+    The format is {"settings": {...}, "graph": {"nodes": [...], "edges":
+    [...]}}.
+
+    Args:
+        stream: The (text) file object to write to
+        settings: The settings of the visualization
+        graph: The graph to write, or None to write an empty graph
+    '''
+    stream.write('{"settings":')
+    stream.write(ENCODER.encode(settings))
+    stream.write(',"graph":')
+    if graph is None:
+        stream.write('{"nodes":[],"edges":[]}')
+    else:
+        write_graph(stream, graph)
+    stream.write('}')
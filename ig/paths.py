@@ -1,8 +1,7 @@
-'''Handles searching for the WWW path and copying operations.'''
+'''Handles searching for the WWW path and creating the served directory.'''
 
 import logging
 import os
-import shutil
 import tempfile
 
 log = logging.getLogger(__name__)
@@ -12,17 +11,28 @@ WWW = os.path.join(os.path.dirname(os.path.realpath(__file__)),
                    os.pardir,
                    'www')
 
-if not os.path.exists(WWW):
-    message = 'Could not find www directory for ig: {0}'
-    raise EnvironmentError(message.format(WWW))
+
+def check_www():
+    '''
+    Makes sure the static files of the visualization exist.
+
+    Raises:
+        EnvironmentError: If the www directory is missing.
+    '''
+    if not os.path.exists(WWW):
+        message = 'Could not find www directory for ig: {0}'
+        raise EnvironmentError(message.format(WWW))
 
 
 def create_directory(directory):
     '''
-    (Maybe) creates a directory and copies the `www` folder to it.
+    (Maybe) creates a directory for the generated files (e.g. `graph.json`).
+
+    The static files of the `www` folder are served straight from the package
+    (see `serve.Handler`), so nothing is copied here.
 
     Args:
-        directory: Optionally, an existing directory to copy to.
+        directory: Optionally, the directory to use (created if missing).
 
     Returns:
         The path of the possibly created directory.
@@ -30,13 +40,8 @@ def create_directory(directory):
     if directory is None:
         directory = tempfile.mkdtemp(prefix='ig-')
         log.debug('Created temporary directory %s', directory)
+    elif not os.path.exists(directory):
+        os.makedirs(directory)
+        log.debug('Created directory %s', directory)
 
-    # Has to not exist for copytree
-    if os.path.exists(directory):
-        shutil.rmtree(directory)
-
-    shutil.copytree(WWW, directory)
-
-    log.debug('Copied contents of www folder to %s', directory)
-
-    return directory
+    return os.path.abspath(directory)
@@ -0,0 +1,441 @@
+'''Evaluates preprocessor conditionals, to skip includes in dead branches.'''
+
+import re
+
+# Matches the directives we care about, with the rest of their line
+DIRECTIVE_PATTERN = re.compile(
+    br'^[ \t]*#[ \t]*(if|ifdef|ifndef|elif|elifdef|elifndef|else|endif|'
+    br'define|undef|include)\b([^\r\n]*)', re.M)
+
+INCLUDE_PATTERN = re.compile(br'^[ \t]*([<"])([^>"\r\n]*)[>"]')
+
+IDENTIFIER_PATTERN = re.compile(br'[ \t]*([A-Za-z_]\w*)')
+
+TOKEN_PATTERN = re.compile(r'\s*(?:(\d[\w\']*|\'[^\']*\')|([A-Za-z_]\w*)|'
+                           r'(&&|\|\||==|!=|<=|>=|<<|>>|[-+*/%<>!~()?:&|^,]))')
+
+COMMENT_PATTERN = re.compile(r'/\*.*?\*/|//.*$')
+
+# The same conditions appear in many files, so their tokens are cached (up to
+# this many conditions)
+CACHE_SIZE = 1 << 16
+tokens_cache = {}
+
+# Binary operators by precedence (higher binds tighter)
+PRECEDENCE = {
+    '||': 1, '&&': 2, '|': 3, '^': 4, '&': 5, '==': 6, '!=': 6,
+    '<': 7, '>': 7, '<=': 7, '>=': 7, '<<': 8, '>>': 8,
+    '+': 9, '-': 9, '*': 10, '/': 10, '%': 10
+}
+
+
+class ParseError(Exception):
+    '''Raised for conditions we cannot parse.'''
+    pass
+
+
+def make_macros(defines, undefines, inherited=()):
+    '''
+    Builds the table of known macros from -D and -U style arguments.
+
+    Args:
+        defines: Definitions of the form NAME or NAME=VALUE (as for -D)
+        undefines: Names of macros known to be undefined (as for -U)
+        inherited: Macros (as returned by this function) to start from
+
+    Returns:
+        A sorted tuple of (name, definition) pairs, where the definition is
+        None for macros that are known to be undefined. Macros missing from
+        the table are unknown.
+    '''
+    macros = dict(inherited)
+    for define in defines:
+        name, equals, value = define.partition('=')
+        macros[name.strip()] = value.strip() if equals else '1'
+    for name in undefines:
+        macros[name.strip()] = None
+    return tuple(sorted(macros.items()))
+
+
+def to_int(literal):
+    '''
+    Returns:
+        The value of an integer literal, or None if it is not one.
+    '''
+    literal = literal.replace("'", '').rstrip('uUlL')
+    try:
+        if literal[:2] in ('0x', '0X', '0b', '0B'):
+            return int(literal, 0)
+        if len(literal) > 1 and literal.startswith('0'):
+            return int(literal, 8)
+        return int(literal)
+    except ValueError:
+        return None
+
+
+def divide(left, right):
+    '''Integer division truncating towards zero, as in C.'''
+    quotient = abs(left) // abs(right)
+    return quotient if (left < 0) == (right < 0) else -quotient
+
+
+def binary(operator, left, right):
+    '''
+    Applies a binary operator to values that may be unknown (None).
+
+    Logical operators yield a known result whenever one known operand decides
+    it, e.g. `0 && unknown` is 0.
+    '''
+    if operator == '&&':
+        if left == 0 or right == 0:
+            return 0
+        return None if left is None or right is None else 1
+    if operator == '||':
+        if (left is not None and left != 0) or \
+           (right is not None and right != 0):
+            return 1
+        return None if left is None or right is None else 0
+    if left is None or right is None:
+        return None
+    if operator in ('/', '%') and right == 0:
+        return None
+    if operator in ('<<', '>>') and not 0 <= right < 64:
+        return None
+    return int({
+        '|': lambda: left | right,
+        '^': lambda: left ^ right,
+        '&': lambda: left & right,
+        '==': lambda: left == right,
+        '!=': lambda: left != right,
+        '<': lambda: left < right,
+        '>': lambda: left > right,
+        '<=': lambda: left <= right,
+        '>=': lambda: left >= right,
+        '<<': lambda: left << right,
+        '>>': lambda: left >> right,
+        '+': lambda: left + right,
+        '-': lambda: left - right,
+        '*': lambda: left * right,
+        '/': lambda: divide(left, right),
+        '%': lambda: left - right * divide(left, right),
+    }[operator]())
+
+
+class Expression(object):
+    '''
+    Evaluates the condition of an #if or #elif with three-valued logic.
+
+    Every value is either an integer or None, for values depending on macros
+    we know nothing about. There is no macro expansion beyond looking up
+    macros defined as integer literals.
+    '''
+
+    def __init__(self, tokens, macros):
+        '''
+        Constructor.
+
+        Args:
+            tokens: The tokens of the condition, as returned by `tokenize()`
+            macros: A map from macro names to definitions (None if undefined)
+        '''
+        self.tokens = tokens
+        self.position = 0
+        self.macros = macros
+
+    def evaluate(self):
+        '''
+        Returns:
+            The value of the expression, or None if it is unknown.
+
+        Raises:
+            ParseError: If the expression is malformed or unsupported.
+        '''
+        value = self.conditional()
+        if self.position != len(self.tokens):
+            raise ParseError('Trailing tokens')
+        return value
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position][1]
+        return None
+
+    def next(self):
+        if self.position >= len(self.tokens):
+            raise ParseError('Unexpected end')
+        self.position += 1
+        return self.tokens[self.position - 1]
+
+    def expect(self, token):
+        if self.next()[1] != token:
+            raise ParseError('Expected ' + token)
+
+    def conditional(self):
+        condition = self.binary(1)
+        if self.peek() != '?':
+            return condition
+        self.next()
+        if_true = self.conditional()
+        self.expect(':')
+        if_false = self.conditional()
+        if condition is None:
+            return if_true if if_true == if_false else None
+        return if_true if condition else if_false
+
+    def binary(self, precedence):
+        left = self.unary()
+        while PRECEDENCE.get(self.peek(), 0) >= precedence:
+            operator = self.next()[1]
+            right = self.binary(PRECEDENCE[operator] + 1)
+            left = binary(operator, left, right)
+        return left
+
+    def unary(self):
+        kind, token = self.next()
+        if token == '(' and kind == 3:
+            value = self.conditional()
+            self.expect(')')
+            return value
+        if kind == 3 and token in ('!', '-', '+', '~'):
+            value = self.unary()
+            if value is None:
+                return None
+            elif token == '!':
+                return int(not value)
+            elif token == '-':
+                return -value
+            elif token == '~':
+                return ~value
+            return value
+        if kind == 1:
+            if token.startswith("'"):
+                return None  # Character literals are rare enough
+            value = to_int(token)
+            if value is None:
+                raise ParseError(token)
+            return value
+        if kind == 2:
+            return self.identifier(token)
+        raise ParseError(token)
+
+    def identifier(self, name):
+        if name == 'defined':
+            parenthesized = self.peek() == '('
+            if parenthesized:
+                self.next()
+            kind, macro = self.next()
+            if kind != 2:
+                raise ParseError('Expected a macro name')
+            if parenthesized:
+                self.expect(')')
+            if macro not in self.macros:
+                return None
+            return int(self.macros[macro] is not None)
+
+        if self.peek() == '(':
+            # A function-like macro (or __has_include etc.): skip its arguments
+            depth = 0
+            while True:
+                token = self.next()[1]
+                depth += {'(': 1, ')': -1}.get(token, 0)
+                if depth == 0:
+                    return None
+
+        if name in ('true', 'false'):
+            return int(name == 'true')
+        if name not in self.macros:
+            return None
+        definition = self.macros[name]
+        if definition is None:
+            return 0  # Undefined identifiers are zero
+        return to_int(definition) if definition else None
+
+
+def tokenize(condition):
+    '''
+    Splits a condition into tokens.
+
+    Args:
+        condition: The text of the condition (as bytes)
+
+    Returns:
+        A list of (kind, token) tuples, where the kind is 1 for numbers, 2 for
+        identifiers and 3 for operators, or None if the condition contains
+        anything else.
+    '''
+    tokens = tokens_cache.get(condition, False)
+    if tokens is not False:
+        return tokens
+
+    text = COMMENT_PATTERN.sub(' ', condition.decode('utf-8', 'replace'))
+    text = text.rstrip()
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = TOKEN_PATTERN.match(text, position)
+        if match is None:
+            tokens = None
+            break
+        tokens.append((match.lastindex, match.group(match.lastindex)))
+        position = match.end()
+
+    if len(tokens_cache) >= CACHE_SIZE:
+        tokens_cache.clear()
+    tokens_cache[condition] = tokens
+    return tokens
+
+
+def evaluate(condition, macros):
+    '''
+    Evaluates a condition, falling back to "unknown" if it cannot be parsed.
+
+    Args:
+        condition: The text of the condition (as bytes)
+        macros: A map from macro names to definitions
+
+    Returns:
+        True, False, or None if the value is unknown.
+    '''
+    tokens = tokenize(condition)
+    if tokens is None:
+        return None
+    try:
+        value = Expression(tokens, macros).evaluate()
+    except (ParseError, ValueError, OverflowError):
+        return None
+    return None if value is None else value != 0
+
+
+def is_defined(name, macros):
+    '''
+    Args:
+        name: The name of a macro (as bytes), or None if there was none
+        macros: A map from macro names to definitions
+
+    Returns:
+        Whether the macro is defined: True, False, or None if unknown.
+    '''
+    if name is None:
+        return None
+    definition = macros.get(name.group(1).decode('ascii'), False)
+    return None if definition is False else definition is not None
+
+
+def and3(left, right):
+    '''Three-valued conjunction.'''
+    if left is False or right is False:
+        return False
+    return None if left is None or right is None else True
+
+
+def or3(left, right):
+    '''Three-valued disjunction.'''
+    if left is True or right is True:
+        return True
+    return None if left is None or right is None else False
+
+
+def not3(value):
+    '''Three-valued negation.'''
+    return None if value is None else not value
+
+
+def extract_includes(source, macros, end=None):
+    '''
+    Extracts the include directives from the branches that may be compiled.
+
+    Conditionals are evaluated with three-valued logic: a branch is skipped
+    if its condition is definitely false given `macros`, and kept if it is
+    true or unknown. #define and #undef directives within the file update the
+    macros for the rest of it (or make them unknown, in branches that may not
+    be compiled).
+
+    An include guard (#ifndef followed by a #define of the same macro as the
+    first two directives) counts as taken, as the file is scanned for its
+    first inclusion. For the same reason, #pragma once needs no handling.
+
+    Args:
+        source: The contents of a file (as bytes)
+        macros: Known macros, as returned by `make_macros()`
+        end: The offset at which to stop looking, if any
+
+    Returns:
+        A list of (quoted, path) tuples, like `walk.extract_includes()`.
+    '''
+    macros = dict(macros)
+    # One frame per open conditional: [active, taken], where `active` says
+    # whether the current branch is compiled and `taken` whether any branch
+    # so far was (each True, False or None)
+    stack = []
+    active = True
+    includes = []
+    guard = None
+
+    if end is None:
+        end = len(source)
+    for index, match in enumerate(DIRECTIVE_PATTERN.finditer(source, 0, end)):
+        directive, rest = match.group(1), match.group(2)
+
+        if directive == b'include':
+            if active is not False:
+                include = INCLUDE_PATTERN.match(rest)
+                if include is not None:
+                    includes.append((include.group(1) == b'"',
+                                     include.group(2).decode('utf-8',
+                                                             'replace')))
+        elif directive == b'define' or directive == b'undef':
+            name = IDENTIFIER_PATTERN.match(rest)
+            if name is None:
+                continue
+            body = rest[name.end():]
+            name = name.group(1).decode('ascii')
+            if index == 1 and guard == name and directive == b'define':
+                stack[0] = [True, True]  # The include guard
+                active = True
+            if active is False:
+                continue
+            if active is None:
+                macros.pop(name, None)
+            elif directive == b'undef':
+                macros[name] = None
+            elif body.startswith(b'('):
+                macros[name] = ''  # Function-like, so the value is unknown
+            else:
+                body = COMMENT_PATTERN.sub(' ', body.decode('utf-8', 'replace'))
+                macros[name] = body.strip()
+        elif directive in (b'if', b'ifdef', b'ifndef'):
+            if active is False:
+                condition = False  # Nested in a dead branch
+            elif directive == b'if':
+                condition = evaluate(rest, macros)
+            else:
+                name = IDENTIFIER_PATTERN.match(rest)
+                condition = is_defined(name, macros)
+                if directive == b'ifndef':
+                    condition = not3(condition)
+                    if index == 0 and name is not None:
+                        guard = name.group(1).decode('ascii')
+            branch = and3(active, condition)
+            stack.append([active, branch])
+            active = branch
+        elif not stack:
+            continue  # An unbalanced directive
+        elif directive == b'endif':
+            active = stack.pop()[0]
+        else:
+            parent, taken = stack[-1]
+            if parent is False or taken is True:
+                condition = False
+            elif directive == b'else':
+                condition = True
+            elif directive == b'elif':
+                condition = evaluate(rest, macros)
+            else:
+                condition = is_defined(IDENTIFIER_PATTERN.match(rest), macros)
+                if directive == b'elifndef':
+                    condition = not3(condition)
+            condition = and3(parent, condition)
+            active = and3(not3(taken), condition)
+            stack[-1][1] = or3(taken, condition)
+
+    return includes
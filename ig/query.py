@@ -0,0 +1,234 @@
+'''Answers queries for parts of the graph, so clients need not load all of it.'''
+
+import collections
+import itertools
+import logging
+import threading
+
+from ig import analysis, cluster
+
+log = logging.getLogger(__name__)
+
+
+class QueryError(Exception):
+    '''Raised for invalid queries (e.g. unknown nodes or bad parameters).'''
+    pass
+
+
+class Index(object):
+    '''
+    Adjacency and group indexes over a snapshot of a graph.
+    '''
+
+    def __init__(self, graph):
+        '''
+        Constructor.
+
+        Args:
+            graph: The graph to index
+        '''
+        self.successors = analysis.successors(graph)
+        self.predecessors = [[] for _ in graph.nodes]
+        for node_id, targets in enumerate(self.successors):
+            for target in targets:
+                self.predecessors[target].append(node_id)
+
+        self.groups = collections.defaultdict(list)
+        self.degrees = [0] * len(graph.nodes)
+        for node_id in graph.node_ids():
+            self.groups[graph.nodes[node_id].group].append(node_id)
+            self.degrees[node_id] = (len(self.successors[node_id]) +
+                                     len(self.predecessors[node_id]))
+
+        # All nodes, from highest to lowest degree
+        self.by_degree = sorted(graph.node_ids(),
+                                key=lambda n: (-self.degrees[n], n))
+
+
+class Query(object):
+    '''
+    Extracts subgraphs (e.g. the neighborhood of a node) from a graph.
+
+    The indexes are built lazily and rebuilt after the graph changed (see
+    `invalidate()`). All access to the graph happens under `lock`, which
+    anything else modifying the graph must hold as well.
+    '''
+
+    def __init__(self, graph, lock=None, limit=5000):
+        '''
+        Constructor.
+
+        Args:
+            graph: The graph to query
+            lock: The lock guarding modifications of the graph, if any
+            limit: The maximum number of nodes returned for any query
+        '''
+        self.graph = graph
+        self.lock = lock or threading.Lock()
+        self.limit = limit
+        self.index = None
+        self.hierarchy = None
+
+    def invalidate(self):
+        '''Marks the indexes as stale, after the graph was changed.'''
+        with self.lock:
+            self.index = None
+            self.hierarchy = None
+
+    def summary(self):
+        '''
+        Returns:
+            The number of nodes and edges, the maximum degree and the names of
+            all groups of the graph.
+        '''
+        with self.lock:
+            index = self._get_index()
+            max_degree = index.degrees[index.by_degree[0]] \
+                if index.by_degree else 0
+            return dict(nodes=self.graph.node_count,
+                        edges=self.graph.edge_count,
+                        maxDegree=max_degree,
+                        groups=sorted(g for g in index.groups if g))
+
+    def neighborhood(self, node, depth=1):
+        '''
+        Finds all nodes within some distance of a node (in either direction).
+
+        Args:
+            node: The ID or name of the node
+            depth: The maximum distance of nodes to include
+
+        Returns:
+            The JSON of the subgraph induced by the neighborhood.
+        '''
+        with self.lock:
+            index = self._get_index()
+            start = self._find(node)
+            found = set([start])
+            frontier = [start]
+            for _ in range(depth):
+                following = []
+                for node_id in frontier:
+                    for neighbor in itertools.chain(
+                            index.successors[node_id],
+                            index.predecessors[node_id]):
+                        if neighbor not in found:
+                            if len(found) == self.limit:
+                                return self._subgraph(found)
+                            found.add(neighbor)
+                            following.append(neighbor)
+                frontier = following
+            return self._subgraph(found)
+
+    def group(self, name, degree=0):
+        '''
+        Finds the nodes of a group.
+
+        Args:
+            name: The name of the group
+            degree: The minimum degree of nodes to include
+
+        Returns:
+            The JSON of the subgraph induced by the (highest-degree) nodes of
+            the group.
+        '''
+        with self.lock:
+            index = self._get_index()
+            if name not in index.groups:
+                raise QueryError('Unknown group: {0}'.format(name))
+            members = [n for n in index.groups[name]
+                       if index.degrees[n] >= degree]
+            members.sort(key=lambda n: (-index.degrees[n], n))
+            return self._subgraph(members[:self.limit])
+
+    def top(self, degree=0):
+        '''
+        Finds the nodes with the highest degrees.
+
+        Args:
+            degree: The minimum degree of nodes to include
+
+        Returns:
+            The JSON of the subgraph induced by the highest-degree nodes.
+        '''
+        with self.lock:
+            index = self._get_index()
+            found = []
+            for node_id in index.by_degree:
+                if index.degrees[node_id] < degree or len(found) == self.limit:
+                    break
+                found.append(node_id)
+            return self._subgraph(found)
+
+    def clusters(self, expanded=()):
+        '''
+        Collapses the graph into clusters of directories.
+
+        Args:
+            expanded: The clusters (directories) to show the contents of
+
+        Returns:
+            The JSON of the shown clusters and files and of the edges between
+            them, weighted by the number of includes they stand for.
+        '''
+        with self.lock:
+            if self.hierarchy is None:
+                index = self._get_index()
+                self.hierarchy = cluster.Hierarchy(self.graph,
+                                                   index.successors,
+                                                   index.predecessors)
+            try:
+                return self.hierarchy.view(expanded, self.limit)
+            except ValueError as error:
+                raise QueryError(str(error))
+
+    def _get_index(self):
+        '''
+        Returns:
+            The indexes of the graph, (re)built if necessary.
+        '''
+        if self.index is None:
+            self.index = Index(self.graph)
+            log.debug('Indexed graph for queries')
+        return self.index
+
+    def _find(self, node):
+        '''
+        Looks up a node by ID or name.
+
+        Args:
+            node: The ID (as a string of digits) or the name of a node
+
+        Returns:
+            The ID of the node.
+
+        Raises:
+            QueryError: If there is no such node.
+        '''
+        if node.isdigit():
+            node_id = int(node)
+            if node_id < len(self.graph.nodes) and \
+               self.graph.nodes[node_id] is not None:
+                return node_id
+        elif node in self.graph.ids:
+            return self.graph.ids[node]
+        raise QueryError('Unknown node: {0}'.format(node))
+
+    def _subgraph(self, node_ids):
+        '''
+        Materializes the subgraph induced by some nodes.
+
+        Args:
+            node_ids: An iterable of node IDs
+
+        Returns:
+            The JSON of the nodes and all edges between them.
+        '''
+        node_ids = set(node_ids)
+        nodes = [self.graph.node_json(n) for n in sorted(node_ids)]
+        edges = []
+        for node_id in sorted(node_ids):
+            for edge_id in self.graph.nodes[node_id].edges or ():
+                if self.graph.targets[edge_id] in node_ids:
+                    edges.append(self.graph.edge_json(edge_id))
+        return dict(nodes=nodes, edges=edges)
@@ -0,0 +1,97 @@
+'''Produces textual reports about include graphs.'''
+
+from __future__ import print_function
+
+import json
+
+from ig import analysis
+
+
+def cost(graph):
+    '''
+    Ranks files by the preprocessing work they cause.
+
+    The saving of a file is the number of translation units that include it
+    times the number of bytes it transitively pulls in, i.e. an upper bound on
+    the aggregate preprocessing work that removing it would save (shared
+    transitive includes are counted once per path, not once per unit).
+
+    Args:
+        graph: The graph to analyze
+
+    Returns:
+        A list of rows (dictionaries), sorted by decreasing saving.
+    '''
+    rows = analysis.costs(graph)
+    for row in rows:
+        row['saving'] = row['includers'] * row['bytes']
+    rows.sort(key=lambda r: (-r['saving'], -r['bytes'], r['file']))
+    return rows
+
+
+def cycles(graph):
+    '''
+    Lists the files that are part of include cycles.
+
+    Args:
+        graph: The graph to analyze
+
+    Returns:
+        A list of rows (dictionaries), one per file in a cycle, with the index
+        of the cycle and its size. Larger cycles come first.
+    '''
+    rows = []
+    for index, cycle in enumerate(analysis.cycles(graph)):
+        for node_id in cycle:
+            rows.append(dict(cycle=index,
+                             size=len(cycle),
+                             file=graph.names[node_id]))
+    return rows
+
+
+REPORTS = dict(cost=(cost, ['saving', 'bytes', 'includes', 'includers']),
+               cycles=(cycles, ['cycle', 'size']))
+
+
+def write_table(stream, rows, columns):
+    '''
+    Writes rows as a table with aligned columns (and the file last).
+
+    Args:
+        stream: The (text) file object to write to
+        rows: The rows to write
+        columns: The names of the (numeric) columns to show before the file
+    '''
+    widths = [len(c) for c in columns]
+    for row in rows:
+        for index, column in enumerate(columns):
+            widths[index] = max(widths[index], len(str(row[column])))
+
+    header = [c.rjust(w) for c, w in zip(columns, widths)] + ['file']
+    print('  '.join(header), file=stream)
+    for row in rows:
+        cells = [str(row[c]).rjust(w) for c, w in zip(columns, widths)]
+        print('  '.join(cells + [row['file']]), file=stream)
+
+
+def write(stream, graph, name, output_format='table', limit=None):
+    '''
+    Computes a report and writes it.
+
+    Args:
+        stream: The (text) file object to write to
+        graph: The graph to analyze
+        name: The name of the report (one of `REPORTS`)
+        output_format: One of {'table', 'json'}
+        limit: The maximum number of rows to write, if any
+    '''
+    function, columns = REPORTS[name]
+    rows = function(graph)
+    if limit is not None:
+        rows = rows[:limit]
+
+    if output_format == 'json':
+        json.dump(rows, stream, separators=(',', ':'))
+        stream.write('\n')
+    else:
+        write_table(stream, rows, columns)
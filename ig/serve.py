@@ -1,24 +1,446 @@
 '''The server that serves the web visualization.'''
 
+import email.utils
+import gzip
 import json
 import logging
 import os
+import re
 import shutil
-import socket
+import tempfile
+import threading
 import webbrowser
 
-from ig import paths
+from ig import output, paths, query
 
 try:
+    import queue
     import socketserver
     import http.server as http
+    from urllib.parse import parse_qs, urlparse
 except ImportError:
+    import Queue as queue
     import SocketServer as socketserver
     import SimpleHTTPServer as http
+    from urlparse import parse_qs, urlparse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 
 log = logging.getLogger(__name__)
 
+# Content encodings we precompress generated files with, by preference, along
+# with the suffix of the compressed file
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# The size of the blocks in which files are compressed
+BLOCK_SIZE = 1 << 20
+
+
+def compress(path):
+    '''
+    Writes gzip (and, if available, brotli) compressed copies of a file.
+
+    The copies are written next to the file (e.g. `graph.json.gz`), such that
+    `Handler` can serve them to clients accepting the encoding. Every copy
+    replaces any previous one atomically.
+
+    Args:
+        path: The path of the file to compress
+    '''
+    directory = os.path.dirname(path)
+    for encoding, suffix in ENCODINGS:
+        if encoding == 'br' and brotli is None:
+            continue
+        descriptor, temporary = tempfile.mkstemp(dir=directory)
+        with open(path, 'rb') as source, os.fdopen(descriptor, 'wb') as sink:
+            if encoding == 'gzip':
+                # Level 6 is the usual default and much faster than 9
+                with gzip.GzipFile(fileobj=sink,
+                                   mode='wb',
+                                   compresslevel=6) as compressed:
+                    shutil.copyfileobj(source, compressed, BLOCK_SIZE)
+            else:
+                compressor = brotli.Compressor(quality=5)
+                for block in iter(lambda: source.read(BLOCK_SIZE), b''):
+                    sink.write(compressor.process(block))
+                sink.write(compressor.finish())
+        os.rename(temporary, path + suffix)
+        log.debug('Compressed %s with %s', path, encoding)
+
+
+def discard_compressed(path):
+    '''
+    Removes the compressed copies of a file, e.g. before it changes.
+
+    Args:
+        path: The path of the (uncompressed) file
+    '''
+    for _, suffix in ENCODINGS:
+        try:
+            os.remove(path + suffix)
+        except OSError:
+            pass  # There was none
+
+
+class EventStream(object):
+    '''
+    Broadcasts events (e.g. graph updates) to all connected clients.
+    '''
+
+    def __init__(self):
+        '''Constructor.'''
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self):
+        '''
+        Returns:
+            A new queue, on which all future events will be put.
+        '''
+        subscriber = queue.Queue()
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        '''
+        Args:
+            subscriber: A queue returned by `subscribe()`
+        '''
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def close(self):
+        '''Ends the streams of all subscribers.'''
+        with self.lock:
+            for subscriber in self.subscribers:
+                subscriber.put(None)
+
+    def publish(self, payload):
+        '''
+        Sends an event to all subscribers.
+
+        Args:
+            payload: The payload to JSONify and send
+        '''
+        event = json.dumps(payload)
+        with self.lock:
+            for subscriber in self.subscribers:
+                subscriber.put(event)
+
+
+class Handler(http.SimpleHTTPRequestHandler):
+    '''
+    Serves the `www` directory, along with a stream of graph updates and an
+    API to query parts of the graph.
+
+    Generated files (e.g. `graph.json`) are served from `directory`,
+    everything else straight from the `www` folder of the package. Files are
+    sent precompressed if the client accepts it, and come with ETag and
+    Last-Modified headers so that unchanged files are not sent again. Single
+    byte ranges are supported, so large downloads can be resumed.
+    '''
+
+    # The number of bytes left to send of a range request, if any
+    range_length = None
+
+    # The `EventStream` to serve at /events, if any
+    events = None
+
+    # The `query.Query` to answer requests to /api/ with, if any
+    api = None
+
+    # The directory of the generated files
+    root = None
+
+    # How often to send a comment to keep idle event streams alive
+    KEEPALIVE_INTERVAL = 15
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if self.events is not None and url.path == '/events':
+            self.stream_events()
+        elif self.api is not None and url.path.startswith('/api/'):
+            self.answer_query(url.path[len('/api/'):], parse_qs(url.query))
+        else:
+            http.SimpleHTTPRequestHandler.do_GET(self)
+
+    def translate_path(self, path):
+        # The base class maps the path into the current directory, which we
+        # never change, since relative paths on the command line (e.g. those
+        # the watcher scans) are relative to it
+        translated = http.SimpleHTTPRequestHandler.translate_path(self, path)
+        relative = os.path.relpath(translated, os.getcwd())
+        generated = os.path.join(self.root, relative)
+        if os.path.exists(generated):
+            return generated
+        return os.path.join(paths.WWW, relative)
+
+    def send_head(self):
+        self.range_length = None
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            return http.SimpleHTTPRequestHandler.send_head(self)
+
+        encoding, encoded_path = self.negotiate_encoding(path)
+        try:
+            stream = open(encoded_path, 'rb')
+        except IOError:
+            self.send_error(404, 'File not found')
+            return None
+
+        try:
+            status = os.fstat(stream.fileno())
+            etag = '"{0:x}-{1:x}"'.format(int(status.st_mtime * 1e6),
+                                          status.st_size)
+            if self.is_fresh(etag, status.st_mtime):
+                stream.close()
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return None
+
+            byte_range = self.parse_range(etag, status.st_size)
+            if byte_range == 'unsatisfiable':
+                stream.close()
+                self.send_response(416)
+                self.send_header('Content-Range',
+                                 'bytes */{0}'.format(status.st_size))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return None
+
+            if byte_range is None:
+                self.send_response(200)
+                self.send_header('Content-Length', str(status.st_size))
+            else:
+                first, last = byte_range
+                stream.seek(first)
+                self.range_length = last - first + 1
+                self.send_response(206)
+                self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(
+                    first, last, status.st_size))
+                self.send_header('Content-Length', str(self.range_length))
+            self.send_header('Content-Type', self.guess_type(path))
+            self.send_header('Accept-Ranges', 'bytes')
+            if encoding is not None:
+                self.send_header('Content-Encoding', encoding)
+            if encoded_path != path or self.has_encodings(path):
+                self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified',
+                             self.date_time_string(status.st_mtime))
+            # Files may change (e.g. in watch mode), so always revalidate
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            return stream
+        except Exception:
+            stream.close()
+            raise
+
+    def parse_range(self, etag, size):
+        '''
+        Parses the Range header of the request.
+
+        Only a single range is supported; requests for multiple ranges get the
+        whole file. If-Range is honored, such that a resumed download of a file
+        that changed meanwhile starts over.
+
+        Args:
+            etag: The ETag of the file
+            size: The size of the file
+
+        Returns:
+            A tuple (first, last) of the inclusive byte range to send, None to
+            send the whole file or 'unsatisfiable' if the range lies beyond the
+            end of the file.
+        '''
+        header = self.headers.get('Range')
+        if header is None or self.headers.get('If-Range', etag) != etag:
+            return None
+
+        match = re.match(r'^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$', header)
+        if match is None or match.group(1) == match.group(2) == '':
+            return None
+
+        if match.group(1) == '':
+            # A suffix range, i.e. the last n bytes
+            length = int(match.group(2))
+            if length == 0:
+                return 'unsatisfiable'
+            return max(0, size - length), size - 1
+
+        first = int(match.group(1))
+        last = int(match.group(2)) if match.group(2) else size - 1
+        if first >= size:
+            return 'unsatisfiable'
+        if last < first:
+            return None
+        return first, min(last, size - 1)
+
+    def copyfile(self, source, outputfile):
+        if self.range_length is None:
+            http.SimpleHTTPRequestHandler.copyfile(self, source, outputfile)
+            return
+        while self.range_length > 0:
+            block = source.read(min(BLOCK_SIZE, self.range_length))
+            if not block:
+                break
+            outputfile.write(block)
+            self.range_length -= len(block)
+        self.range_length = None
+
+    def negotiate_encoding(self, path):
+        '''
+        Picks the precompressed version of a file to send, if any.
+
+        Args:
+            path: The path of the requested file
+
+        Returns:
+            A tuple (encoding, path) of the content encoding (None for the
+            identity) and the path of the file to send.
+        '''
+        accepted = set()
+        for item in self.headers.get('Accept-Encoding', '').split(','):
+            name, _, parameters = item.partition(';')
+            parameters = parameters.replace(' ', '')
+            quality = 1.0
+            if parameters.startswith('q='):
+                try:
+                    quality = float(parameters[2:])
+                except ValueError:
+                    pass
+            if quality > 0:
+                accepted.add(name.strip().lower())
+
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted and os.path.isfile(path + suffix):
+                return encoding, path + suffix
+        return None, path
+
+    def has_encodings(self, path):
+        '''
+        Returns:
+            Whether any precompressed version of a file exists.
+        '''
+        return any(os.path.isfile(path + s) for _, s in ENCODINGS)
+
+    def is_fresh(self, etag, modification_time):
+        '''
+        Checks the conditional headers of the request.
+
+        Args:
+            etag: The ETag of the file
+            modification_time: The modification time of the file
+
+        Returns:
+            True if the client's copy of the file is up to date.
+        '''
+        if 'If-None-Match' in self.headers:
+            tags = [t.strip() for t in self.headers['If-None-Match'].split(',')]
+            return etag in tags or '*' in tags
+
+        since = self.headers.get('If-Modified-Since')
+        if since is not None:
+            parsed = email.utils.parsedate_tz(since)
+            if parsed is not None:
+                return int(modification_time) <= email.utils.mktime_tz(parsed)
+
+        return False
+
+    def answer_query(self, endpoint, parameters):
+        '''
+        Answers a request to the query API.
+
+        The endpoints are:
+            /api/summary: Counts, the maximum degree and the groups
+            /api/neighborhood?node=<ID or path>&depth=<k>: All nodes within
+                distance k of a node
+            /api/group?name=<group>&degree=<d>: The nodes of a group with at
+                least degree d
+            /api/top?degree=<d>: The nodes with at least degree d
+            /api/clusters?expand=<directory>&expand=...: The graph collapsed
+                into clusters of directories, except for the expanded ones
+
+        Args:
+            endpoint: The path after /api/
+            parameters: The parsed query string
+        '''
+        def get(name, default=None, convert=str):
+            values = parameters.get(name)
+            if not values:
+                if default is None:
+                    raise query.QueryError('Missing parameter: ' + name)
+                return default
+            try:
+                return convert(values[0])
+            except ValueError:
+                raise query.QueryError('Invalid parameter: ' + name)
+
+        try:
+            if endpoint == 'summary':
+                result = self.api.summary()
+            elif endpoint == 'neighborhood':
+                result = self.api.neighborhood(get('node'),
+                                               get('depth', 1, int))
+            elif endpoint == 'group':
+                result = self.api.group(get('name'), get('degree', 0, float))
+            elif endpoint == 'top':
+                result = self.api.top(get('degree', 0, float))
+            elif endpoint == 'clusters':
+                result = self.api.clusters(parameters.get('expand', []))
+            else:
+                self.send_error(404, 'Unknown endpoint')
+                return
+        except query.QueryError as error:
+            self.send_error(400, str(error))
+            return
+
+        body = output.ENCODER.encode(result).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream_events(self):
+        '''Sends events as server-sent events until the client leaves.'''
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        subscriber = self.events.subscribe()
+        try:
+            while True:
+                try:
+                    event = subscriber.get(timeout=self.KEEPALIVE_INTERVAL)
+                    if event is None:
+                        break  # The server is shutting down
+                    message = 'data: {0}\n\n'.format(event)
+                except queue.Empty:
+                    message = ': keepalive\n\n'
+                self.wfile.write(message.encode('utf-8'))
+                self.wfile.flush()
+        except (IOError, OSError):
+            log.debug('Client left the event stream')
+        finally:
+            self.events.unsubscribe(subscriber)
+
+
+class ThreadingServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    '''
+    A TCP server that handles every request in a separate thread, so slow
+    clients (and event streams) do not hold up any others.
+    '''
+    daemon_threads = True
+    allow_reuse_address = True
+
 
 class Server(object):
     def __init__(self, directory):
@@ -28,49 +450,93 @@ class Server(object):
         Args:
             directory: The directory to serve from.
         '''
+        paths.check_www()
         self.delete_directory = directory is None
         self.directory = paths.create_directory(directory)
+        self.http_server = None
+        self.events = None
+        # A `watch.Watcher` to stop on exit, if any
+        self.watcher = None
 
-    def run(self, open_immediately, port):
+    def run(self, open_immediately, port, events=None, api=None, host=''):
         '''
         Serves the `www` directory.
 
+        Every client is served in its own thread, so that one slow download
+        does not stall everyone else.
+
         Args:
             open_immediately: Whether to open the web browser immediately
             port: The port at which to serve the graph
+            events: An optional `EventStream` of graph updates to serve
+            api: An optional `query.Query` to serve the query API with
+            host: The host to bind to (all interfaces if empty)
         '''
-        os.chdir(self.directory)
-        handler = http.SimpleHTTPRequestHandler
+        handler = type('Handler',
+                       (Handler, ),
+                       dict(events=events, api=api, root=self.directory))
         handler.extensions_map.update({
             '.webapp': 'application/x-web-app-manifest+json',
         })
 
-        server = socketserver.TCPServer(('', port), handler)
-        server.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.events = events
+        self.http_server = ThreadingServer((host, port), handler)
 
-        address = 'http://localhost:{0}/graph.html'.format(port)
+        address = 'http://{0}:{1}/graph.html'.format(host or 'localhost', port)
         log.info('Serving at %s', address)
 
         if open_immediately:
             log.debug('Opening webbrowser')
             webbrowser.open(address)
 
-        server.serve_forever()
+        self.http_server.serve_forever()
 
-    def write(self, payload):
+    def write(self, settings, graph, compressed=True):
         '''
-        Writes the given JSON representation to the served location.
+        Writes the JSON payload for the visualization to the served location.
+
+        The JSON is streamed to the file, so the payload never exists as a
+        whole in memory. Compressed copies of any previous payload are
+        removed, so they are never served in place of the new one.
 
         Args:
-            payload: The playlod to JSONify and store.
+            settings: The settings of the visualization
+            graph: The graph to visualize, or None if it is only served via
+                   the query API
+            compressed: Whether to also write compressed copies right away,
+                        rather than with a later call to `compress()`
         '''
         path = os.path.join(self.directory, 'graph.json')
-        with open(path, 'w') as graph_file:
-            graph_file.write(json.dumps(payload, indent=4))
+        # Write to a temporary file first, so the file is replaced atomically
+        # if it is rewritten while being served.
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(descriptor, 'w') as graph_file:
+            output.write_payload(graph_file, settings, graph)
+        discard_compressed(path)
+        os.rename(temporary, path)
 
         log.debug('Wrote graph file to {0}'.format(path))
 
+        if compressed:
+            self.compress()
+
+    def compress(self):
+        '''
+        Writes compressed copies of the payload written last.
+
+        This only reads the payload file, so (unlike `write()`) it needs no
+        access to the graph and may run while the graph changes.
+        '''
+        compress(os.path.join(self.directory, 'graph.json'))
+
     def cleanup(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+        if self.events is not None:
+            self.events.close()
+        if self.http_server is not None:
+            self.http_server.server_close()
+            log.debug('Closed server socket')
         if self.delete_directory:
             assert self.directory is not None
             shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,207 @@
+'''Collects statistics about the stages of a run, for --stats and --profile.'''
+
+from __future__ import print_function
+
+import collections
+import contextlib
+import json
+import logging
+import os
+import sys
+import timeit
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+log = logging.getLogger(__name__)
+
+# The parts of the walk stage whose time is accumulated while scanning, as
+# (name, counter) pairs
+WALK_PARTS = (('traversal', 'traversal_seconds'),
+              ('parsing', 'parsing_seconds'),
+              ('resolution', 'resolution_seconds'),
+              ('graph', 'graph_seconds'))
+
+# The counters of a scan that are reported, as (counter, description) pairs
+COUNTERS = (('files', 'Files scanned'),
+            ('bytes', 'Bytes read'),
+            ('includes', 'Include directives'),
+            ('unresolved', 'Unresolved includes'),
+            ('resolution_hits', 'Resolution cache hits'),
+            ('resolution_misses', 'Resolution cache misses'),
+            ('cache_hits', 'Scan cache hits'))
+
+
+def cpu_time():
+    '''
+    Returns:
+        The CPU time (user and system) used by this process and its (waited
+        for) children so far, in seconds.
+    '''
+    times = os.times()
+    return times[0] + times[1] + times[2] + times[3]
+
+
+def peak_memory():
+    '''
+    Returns:
+        The peak resident memory of this process so far in bytes, or None if
+        it is not available on this platform.
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Stats(object):
+    '''
+    Records the wall and CPU time and the memory of every stage of a run,
+    along with the counters of the scan.
+
+    Memory is measured as the peak resident size of the process at the end of
+    every stage, i.e. a high-water mark rather than the memory of the stage
+    alone. CPU times include those of worker processes.
+    '''
+
+    def __init__(self):
+        '''Constructor.'''
+        self.stages = collections.OrderedDict()
+        # Passed to `walk.walk()` to collect the statistics of the scan
+        self.counters = collections.Counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''
+        Measures a stage of the run.
+
+        Args:
+            name: The name of the stage
+        '''
+        wall, cpu = timeit.default_timer(), cpu_time()
+        try:
+            yield
+        finally:
+            self.stages[name] = dict(
+                wall=timeit.default_timer() - wall,
+                cpu=cpu_time() - cpu,
+                peak_memory=peak_memory())
+            log.debug('%s took %.3fs', name, self.stages[name]['wall'])
+
+    def attempts(self):
+        '''
+        Returns:
+            A list of (prefix, count) tuples of the number of paths checked
+            under every include prefix, most first.
+        '''
+        attempts = [(key[1], count) for key, count in self.counters.items()
+                    if isinstance(key, tuple) and key[0] == 'attempts']
+        attempts.sort(key=lambda a: (-a[1], a[0]))
+        return attempts
+
+    def to_json(self):
+        '''
+        Returns:
+            A dictionary (JSON) of the stages, the parts of the walk, the
+            counters and the resolution attempts per prefix.
+        '''
+        parts = collections.OrderedDict(
+            (name, self.counters[counter]) for name, counter in WALK_PARTS)
+        counters = collections.OrderedDict(
+            (counter, self.counters[counter]) for counter, _ in COUNTERS)
+        return dict(stages=self.stages,
+                    walk=parts,
+                    counters=counters,
+                    attempts=collections.OrderedDict(self.attempts()))
+
+    def write_summary(self, stream):
+        '''
+        Writes a human-readable summary.
+
+        The parts of the walk are accumulated over all files (and processes),
+        so with several jobs they may add up to more than the walk itself.
+
+        Args:
+            stream: The (text) file object to write to
+        '''
+        print('{0:<14} {1:>10} {2:>10} {3:>12}'.format(
+            'stage', 'wall (s)', 'cpu (s)', 'peak memory'), file=stream)
+        for name, stage in self.stages.items():
+            print('{0:<14} {1:>10.3f} {2:>10.3f} {3:>12}'.format(
+                name,
+                stage['wall'],
+                stage['cpu'],
+                format_bytes(stage['peak_memory'])), file=stream)
+            if name == 'walk':
+                for part, counter in WALK_PARTS:
+                    print('  {0:<12} {1:>10.3f}'.format(
+                        part, self.counters[counter]), file=stream)
+
+        print(file=stream)
+        for counter, description in COUNTERS:
+            print('{0:<26} {1:>12}'.format(description,
+                                           self.counters[counter]),
+                  file=stream)
+
+        attempts = self.attempts()
+        if attempts:
+            print(file=stream)
+            print('Resolution attempts per prefix:', file=stream)
+            for prefix, count in attempts:
+                print('{0:>12}  {1}'.format(count,
+                                            prefix or '(working directory)'),
+                      file=stream)
+
+    def write(self, path):
+        '''
+        Writes the statistics as JSON.
+
+        Args:
+            path: The path of the file to write
+        '''
+        with open(path, 'w') as destination:
+            json.dump(self.to_json(), destination, indent=2)
+        log.debug('Wrote statistics to %s', path)
+
+
+def format_bytes(count):
+    '''
+    Returns:
+        A human-readable representation of a number of bytes.
+    '''
+    if count is None:
+        return '-'
+    for unit in ('B', 'KiB', 'MiB'):
+        if count < 1024:
+            return '{0:.1f} {1}'.format(count, unit)
+        count /= 1024.0
+    return '{0:.1f} GiB'.format(count)
+
+
+@contextlib.contextmanager
+def profile(path):
+    '''
+    Profiles a block with cProfile and dumps the profile to a file.
+
+    The dump can be inspected with `python -m pstats PATH` or tools like
+    snakeviz. Only the current process is profiled, not worker processes.
+
+    Args:
+        path: The path to dump the profile to, or None to not profile
+    '''
+    if path is None:
+        yield
+        return
+
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        log.info('Wrote profile of the scan to %s', path)
@@ -0,0 +1,235 @@
+'''Saves graphs to and loads them from a compact binary file (.igb).'''
+
+import array
+import json
+import logging
+import mmap
+import struct
+import sys
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'IGB\0'
+
+# Bumped whenever the layout of the file changes
+VERSION = 2
+
+# The magic, the version, the number of nodes and edges and the length of the
+# metadata
+HEADER = struct.Struct('<4sIIII')
+
+# Every section starts at a multiple of this, so it can be mapped as an array
+ALIGNMENT = 8
+
+
+class FormatError(Exception):
+    '''Raised for files that are not (supported) graph files.'''
+    pass
+
+
+def padding(length):
+    '''
+    Returns:
+        The number of bytes to add to reach the next aligned offset.
+    '''
+    return -length % ALIGNMENT
+
+
+def to_little_endian(values):
+    '''
+    Returns:
+        The bytes of an array in little-endian order.
+    '''
+    if sys.byteorder == 'big':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tostring() if sys.version_info[0] < 3 else values.tobytes()
+
+
+def from_little_endian(typecode, data):
+    '''
+    Returns:
+        An array of the given type read from little-endian bytes.
+    '''
+    values = array.array(typecode)
+    if sys.version_info[0] < 3:
+        values.fromstring(bytes(data))
+    else:
+        values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def save(graph, path, metadata=None):
+    '''
+    Writes a graph to a file.
+
+    The file starts with a fixed header and a JSON object of metadata (e.g.
+    the directories that were scanned), followed by these sections, each
+    starting at a multiple of eight bytes:
+
+        1. The offset of the name of every node in the string table, plus the
+           end of the table (uint32)
+        2. The string table: all names in UTF-8, each terminated by a NUL byte
+        3. Whether every node was scanned (uint8)
+        4. The offset of the edges of every node, plus the end (uint32)
+        5. The target of every edge (int32)
+        6. The weight of every edge (int32)
+        7. The in-degree of every node (int32)
+        8. The size of every node in bytes, as it was scanned (uint32)
+        9. The x and the y position of every node (float64)
+
+    All numbers are little-endian. Removed nodes and edges are left out, so
+    IDs are renumbered densely; edges are sorted by their source.
+
+    Args:
+        graph: The graph to save
+        path: The path of the file to write
+        metadata: A dictionary of additional (JSON) data to store
+    '''
+    node_ids = list(graph.node_ids())
+    new_ids = array.array('i', [-1]) * len(graph.nodes)
+    for new_id, node_id in enumerate(node_ids):
+        new_ids[node_id] = new_id
+
+    names = [graph.names[n].encode('utf-8') + b'\0' for n in node_ids]
+    name_offsets = array.array('I', [0])
+    for name in names:
+        name_offsets.append(name_offsets[-1] + len(name))
+
+    scanned = array.array('B', [graph.nodes[n].edges is not None
+                                for n in node_ids])
+    edge_offsets = array.array('I', [0])
+    targets = array.array('i')
+    weights = array.array('i')
+    for node_id in node_ids:
+        for edge_id in graph.nodes[node_id].edges or ():
+            targets.append(new_ids[graph.targets[edge_id]])
+            weights.append(graph.weights[edge_id])
+        edge_offsets.append(len(targets))
+
+    in_degrees = array.array('i', [graph.in_degrees[n] for n in node_ids])
+    sizes = array.array('I', [graph.sizes[n] for n in node_ids])
+    xs = array.array('d', [graph.xs[n] for n in node_ids])
+    ys = array.array('d', [graph.ys[n] for n in node_ids])
+
+    metadata = json.dumps(metadata or {}).encode('utf-8')
+    sections = [
+        metadata,
+        to_little_endian(name_offsets),
+        b''.join(names),
+        to_little_endian(scanned),
+        to_little_endian(edge_offsets),
+        to_little_endian(targets),
+        to_little_endian(weights),
+        to_little_endian(in_degrees),
+        to_little_endian(sizes),
+        to_little_endian(xs),
+        to_little_endian(ys),
+    ]
+
+    with open(path, 'wb') as stream:
+        stream.write(HEADER.pack(MAGIC,
+                                 VERSION,
+                                 len(node_ids),
+                                 len(targets),
+                                 len(metadata)))
+        stream.write(b'\0' * padding(HEADER.size))
+        for section in sections:
+            stream.write(section)
+            stream.write(b'\0' * padding(len(section)))
+
+    log.debug('Saved %d nodes and %d edges to %s',
+              len(node_ids), len(targets), path)
+
+
+def load(graph, path):
+    '''
+    Reads a graph written by `save()` into an empty graph.
+
+    The file is memory-mapped and every array section is copied out in one
+    go, so loading takes time roughly proportional to the number of nodes
+    rather than edges. Groups and colors are assigned according to the
+    settings of the graph, like for a scanned graph.
+
+    Args:
+        graph: The empty graph to populate
+        path: The path of the file to read
+
+    Returns:
+        The metadata stored with the graph.
+
+    Raises:
+        FormatError: If the file is not a graph file of a supported version,
+                     or is corrupt.
+        IOError: If the file cannot be read.
+    '''
+    with open(path, 'rb') as stream:
+        try:
+            data = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise FormatError('{0} is empty'.format(path))
+
+    try:
+        if len(data) < HEADER.size:
+            raise FormatError('{0} is not a graph file'.format(path))
+        magic, version, node_count, edge_count, metadata_length = \
+            HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise FormatError('{0} is not a graph file'.format(path))
+        if version != VERSION:
+            raise FormatError('{0} has version {1}, but only version {2} is '
+                              'supported'.format(path, version, VERSION))
+
+        position = [HEADER.size + padding(HEADER.size)]
+
+        def section(length):
+            begin = position[0]
+            position[0] += length + padding(length)
+            if begin + length > len(data):
+                raise FormatError('{0} is truncated'.format(path))
+            return data[begin:begin + length]
+
+        try:
+            metadata = json.loads(section(metadata_length).decode('utf-8'))
+        except ValueError:
+            raise FormatError('{0} has corrupt metadata'.format(path))
+        name_offsets = from_little_endian('I', section(4 * (node_count + 1)))
+        try:
+            names = section(name_offsets[-1]).decode('utf-8')
+        except UnicodeDecodeError:
+            raise FormatError('{0} has a corrupt string table'.format(path))
+        scanned = from_little_endian('B', section(node_count))
+        edge_offsets = from_little_endian('I', section(4 * (node_count + 1)))
+        targets = from_little_endian('i', section(4 * edge_count))
+        weights = from_little_endian('i', section(4 * edge_count))
+        in_degrees = from_little_endian('i', section(4 * node_count))
+        sizes = from_little_endian('I', section(4 * node_count))
+        xs = from_little_endian('d', section(8 * node_count))
+        ys = from_little_endian('d', section(8 * node_count))
+    finally:
+        data.close()
+
+    names = names.split('\0')[:-1]
+    if len(names) != node_count:
+        raise FormatError('{0} has a corrupt string table'.format(path))
+    if edge_offsets[-1] != edge_count or \
+       any(a > b for a, b in zip(edge_offsets, edge_offsets[1:])) or \
+       (targets and not 0 <= min(targets) <= max(targets) < node_count):
+        raise FormatError('{0} has corrupt edges'.format(path))
+
+    graph.extend(names,
+                 scanned,
+                 edge_offsets,
+                 targets,
+                 weights,
+                 in_degrees,
+                 sizes,
+                 xs,
+                 ys)
+
+    log.debug('Loaded %d nodes and %d edges from %s',
+              node_count, edge_count, path)
+
+    return metadata
@@ -1,15 +1,238 @@
 from __future__ import print_function
 
+import collections
 import fnmatch
+import itertools
 import logging
+import multiprocessing
 import os
 import re
 import sys
+import timeit
+
+try:
+    from os import scandir
+except ImportError:
+    scandir = None
+
+from ig import cache, compdb, git, ignore, preprocessor
 
 log = logging.getLogger(__name__)
 
 
-INCLUDE_PATTERN = re.compile(r'^#include ["<](.*)[">]$')
+INCLUDE_PATTERN = re.compile(
+    br'^[ \t]*#[ \t]*include[ \t]*([<"])([^>"\r\n]*)[>"]', re.M)
+
+# Matches lines that start with anything but a directive or comment
+CODE_PATTERN = re.compile(br'^[ \t]*[^\s#/*]', re.M)
+
+# The settings that determine which includes are found for a file, where
+# `quote_prefixes` are only searched for quoted includes (before `prefixes`)
+# and `macros` are those of `preprocessor.make_macros()`, or None to keep the
+# includes of all branches
+Settings = collections.namedtuple(
+    'Settings', ['prefixes', 'preamble_only', 'quote_prefixes', 'macros'])
+
+# Counts resolution attempts in the directory of the including file (of quoted
+# includes), which differs for every file
+INCLUDING_DIRECTORY = '<including directory>'
+
+
+class FileSystem(object):
+    '''
+    The file system, as a source of files to scan.
+
+    `git.Revision` provides the same interface for the files of a commit.
+    '''
+
+    def list(self, directory):
+        '''
+        Lists a directory, along with the type of every entry.
+
+        Uses `os.scandir` where available, so that the file type information
+        from the directory listing saves us a `stat` per entry.
+
+        Args:
+            directory: The directory to list
+
+        Returns:
+            A list of (name, path, is_directory, is_symlink) tuples.
+        '''
+        if scandir is None:
+            entries = []
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                entries.append((name,
+                                path,
+                                os.path.isdir(path),
+                                os.path.islink(path)))
+            return entries
+        return [(e.name, e.path, e.is_dir(), e.is_symlink())
+                for e in scandir(directory)]
+
+    def listdir(self, directory):
+        '''
+        Returns:
+            The names of the entries of a directory.
+        '''
+        return os.listdir(directory)
+
+    def is_file(self, path):
+        '''
+        Returns:
+            True if the path is a file, else False.
+        '''
+        return os.path.isfile(path)
+
+    def read(self, path):
+        '''
+        Returns:
+            The contents of a file (as bytes).
+        '''
+        with open(path, 'rb') as source:
+            return source.read()
+
+    def size(self, path):
+        '''
+        Returns:
+            The size of a file in bytes, or zero if it does not exist.
+        '''
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+
+class Resolver(object):
+    '''
+    Resolves include paths against lists of prefixes.
+
+    Resolution results are memoized per (include, prefixes, directory) key,
+    where the directory of the including file is only part of the key for
+    quoted includes. Instead of stat-ing every candidate path, the resolver
+    lists each directory it looks into once and checks membership in that
+    listing, so repeated lookups of the same headers cost a dict lookup.
+    Names that only match an entry when ignoring case are checked with the
+    source, since they exist on case-insensitive file systems.
+
+    The number of candidate paths checked under every prefix is counted in
+    `attempts`, to spot include paths that are searched in vain.
+    '''
+
+    def __init__(self, source=None):
+        '''
+        Constructor.
+
+        Args:
+            source: Where files are listed and read from (a `FileSystem` if
+                    not supplied)
+        '''
+        self.source = source or FileSystem()
+        self.resolved = {}
+        self.listings = {}
+        # The listings in lower case, for names missing from the listings
+        self.folded_listings = {}
+        self.hits = 0
+        self.misses = 0
+        self.attempts = collections.Counter()
+
+    def resolve(self, path, prefixes, directory=None):
+        '''
+        Finds the full path of an include.
+
+        Args:
+            path: The path as written in the include directive
+            prefixes: A tuple of prefixes to search under
+            directory: For quoted includes, the directory of the including
+                       file, which is searched before any of the prefixes
+
+        Returns:
+            The best possible path.
+        '''
+        key = (path, prefixes, directory)
+        full_path = self.resolved.get(key)
+        if full_path is not None:
+            self.hits += 1
+            return full_path
+
+        self.misses += 1
+        if directory is not None:
+            self.attempts[INCLUDING_DIRECTORY] += 1
+            full_path = os.path.normpath(os.path.join(directory, path))
+            if self.exists(full_path):
+                full_path = os.path.realpath(full_path)
+            else:
+                full_path = self._try_prefixes(path, prefixes)
+        else:
+            full_path = self._try_prefixes(path, prefixes)
+        self.resolved[key] = full_path
+
+        return full_path
+
+    def invalidate(self, directories):
+        '''
+        Forgets what is known about directories whose contents changed.
+
+        Args:
+            directories: The directories in which files were added or removed
+        '''
+        for directory in directories:
+            self.listings.pop(directory, None)
+            self.folded_listings.pop(directory, None)
+        # Any resolution may have depended on those listings
+        self.resolved.clear()
+
+    def exists(self, path):
+        '''
+        Checks if a path exists, using (cached) directory listings.
+
+        Args:
+            path: An absolute, normalized path
+
+        Returns:
+            True if the path exists, else False.
+        '''
+        directory, name = os.path.split(path)
+        listing = self.listings.get(directory)
+        if listing is None:
+            try:
+                listing = frozenset(self.source.listdir(directory))
+            except OSError:
+                listing = frozenset()
+            self.listings[directory] = listing
+        if name in listing:
+            return True
+
+        # The file system may be case-insensitive (e.g. on macOS or Windows)
+        folded = self.folded_listings.get(directory)
+        if folded is None:
+            folded = frozenset(entry.lower() for entry in listing)
+            self.folded_listings[directory] = folded
+        return name.lower() in folded and self.source.is_file(path)
+
+    def _try_prefixes(self, path, prefixes):
+        '''
+        Tries to prepend a list of prefixes to a path to see if any exists.
+
+        Args:
+            path: The path to append to the prefixes
+            prefixes: The prefixes to prepend to the path
+
+        Returns:
+            The real path of the first existing candidate, or the path itself.
+        '''
+        for prefix in prefixes:
+            self.attempts[prefix] += 1
+            full_path = os.path.normpath(
+                os.path.join(os.path.abspath(prefix), path))
+            if self.exists(full_path):
+                return os.path.realpath(full_path)
+
+        return path
+
+
+# Every (worker) process memoizes resolutions in its own resolver.
+resolver = Resolver()
 
 
 def try_prefixes(path, prefixes):
@@ -27,75 +250,702 @@ def try_prefixes(path, prefixes):
     Returns:
         The best possible path.
     '''
-    for prefix in prefixes:
-        full_path = os.path.realpath(os.path.join(prefix, path))
-        if os.path.exists(full_path):
-            return full_path
+    return resolver.resolve(path, tuple(prefixes))
+
+
+def preamble_end(source):
+    '''
+    Finds the end of the preamble of a file.
+
+    The preamble consists of everything up to the first line of actual code,
+    i.e. a line that is neither blank, nor a preprocessor directive (or its
+    continuation), nor part of a comment.
+
+    Args:
+        source: The contents of a file (as bytes)
+
+    Returns:
+        The offset at which the preamble ends.
+    '''
+    for match in CODE_PATTERN.finditer(source):
+        start = match.start()
+        if source.rfind(b'/*', 0, start) > source.rfind(b'*/', 0, start):
+            continue  # Inside a block comment
+        if source[max(0, start - 3):start].rstrip(b'\r\n').endswith(b'\\'):
+            continue  # Continuation of a (macro) directive
+        return start
+    return len(source)
+
+
+def extract_includes(source, preamble_only=False, macros=None):
+    '''
+    Extracts the include directives from the contents of a file.
+
+    The whole buffer is scanned with a single regular expression, which also
+    recognizes directives with leading whitespace, space after the hash,
+    trailing comments and CRLF line endings. Given macros, includes in
+    branches of conditionals that are known not to be compiled are skipped.
+
+    Args:
+        source: The contents of a file (as bytes)
+        preamble_only: Whether to stop looking after the preamble of the file
+        macros: The macros to evaluate conditionals with, if any
 
-    return path
+    Returns:
+        A list of (quoted, path) tuples, where `quoted` is True for includes
+        using double quotes rather than angle brackets.
+    '''
+    end = preamble_end(source) if preamble_only else len(source)
+    if macros is not None:
+        return preprocessor.extract_includes(source, macros, end)
+    return [(match.group(1) == b'"', match.group(2).decode('utf-8', 'replace'))
+            for match in INCLUDE_PATTERN.finditer(source, 0, end)]
 
 
-def get_includes(filename, prefixes):
+def parse_includes(filename, preamble_only=False, macros=None, counters=None):
+    '''
+    Reads the include directives of a file.
+
+    Args:
+        filename: The name of the file
+        preamble_only: Whether to stop looking after the preamble of the file
+        macros: The macros to evaluate conditionals with, if any
+        counters: An optional `collections.Counter` to count the file, its
+                  bytes and its include directives in, along with the time
+                  spent parsing
+
+    Returns:
+        A list of (quoted, path) tuples, see `extract_includes()`.
+    '''
+    start = timeit.default_timer()
+    contents = resolver.source.read(filename)
+    found = extract_includes(contents, preamble_only, macros)
+
+    if counters is not None:
+        counters['files'] += 1
+        counters['bytes'] += len(contents)
+        counters['includes'] += len(found)
+        counters['parsing_seconds'] += timeit.default_timer() - start
+
+    return found
+
+
+def resolve_includes(filename,
+                     found,
+                     prefixes,
+                     quote_prefixes=(),
+                     counters=None):
+    '''
+    Resolves the include directives of a file.
+
+    Args:
+        filename: The name of the file
+        found: The include directives of the file, see `parse_includes()`
+        prefixes: The prefixes under which to search for includes
+        quote_prefixes: Additional prefixes to search for quoted includes
+        counters: An optional `collections.Counter` to count the includes
+                  that could not be resolved in, along with the time spent
+                  resolving
+
+    Returns:
+        A list of includes for the file, with one entry per include directive,
+        so that the graph can record how often a file is included.
+    '''
+    prefixes = tuple(prefixes)
+    quote_prefixes = tuple(quote_prefixes) + prefixes
+    directory = os.path.dirname(filename)
+
+    start = timeit.default_timer()
+    includes = []
+    unresolved = 0
+    for quoted, path in found:
+        if quoted:
+            full_path = resolver.resolve(path, quote_prefixes, directory)
+        else:
+            full_path = resolver.resolve(path, prefixes)
+        # Includes that could not be resolved are left as written
+        if full_path == path:
+            unresolved += 1
+        includes.append(full_path)
+
+    if counters is not None:
+        counters['unresolved'] += unresolved
+        counters['resolution_seconds'] += timeit.default_timer() - start
+
+    return includes
+
+
+def get_includes(filename,
+                 prefixes,
+                 preamble_only=False,
+                 quote_prefixes=(),
+                 macros=None,
+                 counters=None):
     '''
     Parses out the includes from a file.
 
     Args:
         filename: The name of the file to get includes for
         prefixes: The prefixes under which to search for includes
+        preamble_only: Whether to stop looking after the preamble of the file
+        quote_prefixes: Additional prefixes to search for quoted includes
+        macros: The macros to evaluate conditionals with, if any
+        counters: An optional `collections.Counter` to count the file, its
+                  bytes, its include directives and those that could not be
+                  resolved in, along with the time spent parsing and resolving
 
     Returns:
-        A list of includes for the file.
+        A list of includes for the file, see `resolve_includes()`.
     '''
-    includes = set()
-    with open(filename) as source:
-        for line in source:
-            match = INCLUDE_PATTERN.match(line)
-            if match is not None:
-                full_path = try_prefixes(match.group(1), prefixes)
-                includes.add(full_path)
+    found = parse_includes(filename, preamble_only, macros, counters)
+    return resolve_includes(filename,
+                            found,
+                            prefixes,
+                            quote_prefixes,
+                            counters)
 
-    return includes
+
+def resolution_state():
+    '''
+    Returns:
+        The counts of the resolver, to pass to `count_resolution()` later.
+    '''
+    return resolver.hits, resolver.misses, resolver.attempts.copy()
+
+
+def count_resolution(counters, state):
+    '''
+    Counts the work of the resolver since a `resolution_state()`.
+
+    Resolution attempts under every prefix are counted as ('attempts',
+    prefix) keys.
+
+    Args:
+        counters: The `collections.Counter` to count in
+        state: The result of `resolution_state()`
+    '''
+    hits, misses, attempts = state
+    counters['resolution_hits'] += resolver.hits - hits
+    counters['resolution_misses'] += resolver.misses - misses
+    for prefix, count in (resolver.attempts - attempts).items():
+        counters['attempts', prefix] += count
+
+
+def scan_batch(batch):
+    '''
+    Parses out the includes for a batch of files.
+
+    This is the unit of work handed to worker processes, so it must remain a
+    module-level (picklable) function.
+
+    Args:
+        batch: A tuple (filenames, settings) of files sharing the same
+               `Settings`
+
+    Returns:
+        A list of (filename, sorted includes, directives) tuples, in the order
+        of the batch, where the directives are those `parse_includes()` found,
+        along with a `collections.Counter` of statistics of the batch (see
+        `count_resolution()`).
+    '''
+    filenames, settings = batch
+    state = resolution_state()
+    counters = collections.Counter()
+    results = []
+    for filename in filenames:
+        found = parse_includes(filename,
+                               settings.preamble_only,
+                               settings.macros,
+                               counters)
+        includes = resolve_includes(filename,
+                                    found,
+                                    settings.prefixes,
+                                    settings.quote_prefixes,
+                                    counters)
+        results.append((filename, sorted(includes), found))
+    count_resolution(counters, state)
+    return results, counters
 
 
-def glob(directory, pattern):
+def batches(filenames, settings, batch_size):
     '''
-    Globs for files patterns under a directory.
+    Splits filenames into chunks of (at most) a fixed size.
+
+    Args:
+        filenames: An iterable of filenames
+        settings: The `Settings` to attach to every batch
+        batch_size: The maximum number of files per batch
+
+    Yields:
+        (filenames, settings) tuples, suitable for `scan_batch`.
+    '''
+    batch = []
+    for filename in filenames:
+        batch.append(filename)
+        if len(batch) == batch_size:
+            yield batch, settings
+            batch = []
+    if batch:
+        yield batch, settings
+
+
+def scan(filenames,
+         settings,
+         pool=None,
+         cache=None,
+         counters=None,
+         batch_size=256):
+    '''
+    Parses the includes of many files, possibly in parallel.
+
+    Results are yielded in the same order as the filenames, independent of
+    whether a pool or cache is used, so that graph construction is
+    deterministic.
+
+    Args:
+        filenames: An iterable of filenames to scan
+        settings: The `Settings` to scan the files with
+        pool: An optional `multiprocessing.Pool` to distribute the work over
+        cache: An optional `cache.Cache` to consult before parsing a file
+        counters: An optional `collections.Counter` to accumulate statistics
+                  of the scan into
+        batch_size: The number of files to send to a worker at once
+
+    Yields:
+        (filename, sorted includes) tuples.
+    '''
+    if cache is None:
+        for filename, includes, _ in scan_files(filenames,
+                                                settings,
+                                                pool,
+                                                counters,
+                                                batch_size):
+            yield filename, includes
+        return
+
+    # Only the include directives are cached, not where they resolve to, since
+    # headers may have been added or removed anywhere since. So entries only
+    # depend on the settings that affect parsing.
+    key = (settings.preamble_only, settings.macros)
+    filenames = list(filenames)
+    cached = {}
+    for filename in filenames:
+        found = cache.lookup(filename, key)
+        if found is not None:
+            cached[filename] = found
+    misses = [f for f in filenames if f not in cached]
+    if counters is not None:
+        counters['cache_hits'] += len(cached)
+    fresh = scan_files(misses, settings, pool, counters, batch_size)
+    for filename in filenames:
+        if filename in cached:
+            state = resolution_state()
+            includes = resolve_includes(filename,
+                                        cached[filename],
+                                        settings.prefixes,
+                                        settings.quote_prefixes,
+                                        counters)
+            if counters is not None:
+                count_resolution(counters, state)
+            yield filename, sorted(includes)
+        else:
+            scanned, includes, found = next(fresh)
+            assert scanned == filename
+            cache.store(filename, key, found)
+            yield filename, includes
+
+
+def scan_files(filenames, settings, pool=None, counters=None, batch_size=256):
+    '''
+    Parses and resolves the includes of many files, possibly in parallel.
+
+    Args:
+        filenames: An iterable of filenames to scan
+        settings: The `Settings` to scan the files with
+        pool: An optional `multiprocessing.Pool` to distribute the work over
+        counters: An optional `collections.Counter` to accumulate statistics
+                  of the scan into
+        batch_size: The number of files to send to a worker at once
+
+    Yields:
+        (filename, sorted includes, directives) tuples, see `scan_batch()`, in
+        the order of the filenames.
+    '''
+    work = batches(filenames, settings, batch_size)
+    if pool is None:
+        results = map(scan_batch, work)
+    else:
+        results = pool.imap(scan_batch, work)
+    for result, batch_counters in results:
+        if counters is not None:
+            counters.update(batch_counters)
+        for item in result:
+            yield item
+
+
+def follow(groups, pool=None, cache=None, counters=None):
+    '''
+    Scans files and, transitively, every file they include.
+
+    This is a worklist over the include graph, processed in rounds: every
+    round scans the files discovered in the previous one, so that each round
+    can still be distributed over the pool. Every file is scanned only once.
+    Headers have no settings of their own, so they are scanned with those of
+    the first file found including them.
+
+    Args:
+        groups: An iterable of (settings, filenames) tuples, like `sources()`
+        pool: An optional `multiprocessing.Pool` to distribute the work over
+        cache: An optional `cache.Cache` to consult before parsing a file
+        counters: An optional `collections.Counter` to accumulate statistics
+                  of the scan into
+
+    Yields:
+        (filename, sorted includes) tuples.
+    '''
+    seen = set()
+    # Claim all initial files first, so that they keep their own settings
+    pending = [(settings, list(unique(filenames, seen)))
+               for settings, filenames in groups]
+    while pending:
+        following = collections.OrderedDict()
+        for settings, filenames in pending:
+            for filename, includes in scan(filenames,
+                                           settings,
+                                           pool,
+                                           cache,
+                                           counters):
+                yield filename, includes
+                for include in includes:
+                    # Includes that could not be resolved are left as written
+                    if include not in seen and os.path.isabs(include) and \
+                       resolver.source.is_file(include):
+                        seen.add(include)
+                        following.setdefault(settings, []).append(include)
+        pending = list(following.items())
+        if pending:
+            log.debug('Following %d included files',
+                      sum(len(f) for _, f in pending))
+
+
+def create_pool(jobs):
+    '''
+    Creates a process pool for scanning, if more than one job is requested.
+
+    Args:
+        jobs: The number of processes to use (<= 0 means one per CPU)
+
+    Returns:
+        A `multiprocessing.Pool`, or None if scanning should be serial.
+    '''
+    if jobs <= 0:
+        jobs = multiprocessing.cpu_count()
+    if jobs == 1:
+        return None
+    log.debug('Scanning with %d processes', jobs)
+    return multiprocessing.Pool(jobs)
+
+
+def compile_patterns(patterns):
+    '''
+    Combines several glob patterns into a single regular expression.
+
+    Args:
+        patterns: A list of (fnmatch-style) glob patterns
+
+    Returns:
+        A compiled regular expression matching any of the patterns.
+    '''
+    translated = ('(?:{0})'.format(fnmatch.translate(p)) for p in patterns)
+    return re.compile('|'.join(translated))
+
+
+def timed(iterable, counters, key):
+    '''
+    Measures the time spent producing the items of a (lazy) iterable.
+
+    Args:
+        iterable: The iterable to consume
+        counters: The `collections.Counter` to add the time to
+        key: The key to add the time (in seconds) under
+
+    Yields:
+        The items of the iterable.
+    '''
+    iterator = iter(iterable)
+    while True:
+        start = timeit.default_timer()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            counters[key] += timeit.default_timer() - start
+        yield item
+
+
+def glob(directory, pattern, rules=None, gitignore=False):
+    '''
+    Globs for files matching a (compiled) pattern under a directory.
 
     There is a `glob` module, but its recursive variant only works in Python3.
-    This is a short DIY version of recursive globbing.
+    This is a short DIY version of recursive globbing, which traverses the tree
+    exactly once. Ignored directories are pruned before we descend into them,
+    so nothing under them is ever listed. The tree is listed through the
+    source of the resolver, so this also globs the files of a git revision.
 
     Args:
         directory: The root directory
-        pattern: The pattern to glob for
+        pattern: The compiled pattern to match filenames against
+        rules: Optional `ignore.Rules` (relative to the root) of files and
+               directories to skip, which take precedence over .gitignore
+               files (like patterns on the command line of git)
+        gitignore: Whether to also skip what .gitignore files (and
+                   .git/info/exclude) in the tree ignore, along with .git
 
     Yields:
         Any matching files (with absolute paths).
     '''
-    for root, _, filenames in os.walk(directory):
-        for filename in fnmatch.filter(filenames, pattern):
-            yield os.path.join(root, filename)
+    source = resolver.source
+    excludes = () if rules is None else (rules, )
+    root_rules = ()
+    if gitignore:
+        found = ignore.read_rules(directory,
+                                  [ignore.GIT_EXCLUDE, ignore.GITIGNORE],
+                                  source.read)
+        if found is not None:
+            root_rules += (found, )
+
+    stack = [(directory, root_rules)]
+    while stack:
+        current, rules = stack.pop()
+        if gitignore and current != directory:
+            found = ignore.read_rules(current, [ignore.GITIGNORE], source.read)
+            if found is not None:
+                rules += (found, )
+        applied = rules + excludes
+        try:
+            entries = source.list(current)
+        except OSError as error:
+            log.debug('Could not list directory: %s', error)
+            continue
+        # Visit subdirectories in the same order as os.walk would.
+        subdirectories = []
+        for name, path, is_directory, is_symlink in entries:
+            if is_directory:
+                if is_symlink or (gitignore and name == '.git'):
+                    continue
+                if applied and ignore.is_ignored(applied, path, True):
+                    log.debug('Skipping ignored directory %s', path)
+                    continue
+                subdirectories.append((path, rules))
+            elif pattern.match(name):
+                if not (applied and ignore.is_ignored(applied, path, False)):
+                    yield path
+        stack.extend(reversed(subdirectories))
+
+
+def unique(filenames, seen):
+    '''
+    Filters out files that were already visited.
+
+    Args:
+        filenames: An iterable of paths
+        seen: The set of paths visited so far (updated in place)
+
+    Yields:
+        The paths not contained in `seen`.
+    '''
+    for filename in filenames:
+        if filename in seen:
+            log.debug('%s was already visited, skipping', filename)
+            continue
+        seen.add(filename)
+        yield filename
+
+
+def sources(args, counters=None):
+    '''
+    Finds all files to scan, grouped by the directory they were found under.
+
+    Files are yielded once, even if they are found under several directories,
+    so the groups must be consumed in order.
+
+    Args:
+        args: The arguments passed to the command line
+        counters: An optional `collections.Counter` to add the time spent
+                  traversing directories to (as 'traversal_seconds')
+
+    Yields:
+        (settings, filenames) tuples, where `settings` are the `Settings` to
+        scan the `filenames` with.
+    '''
+    # Overlapping directories would otherwise make us parse files twice
+    seen = set()
+
+    macros = None
+    if args.conditionals or args.defines or args.undefines:
+        macros = preprocessor.make_macros(args.defines, args.undefines)
+
+    if args.compdb is not None:
+        # Consecutive units with the same search paths form one group
+        def get_settings(command):
+            unit_macros = macros
+            if macros is not None:
+                # Our own macros take precedence over those of the unit
+                unit_macros = preprocessor.make_macros(
+                    args.defines,
+                    args.undefines,
+                    preprocessor.make_macros(command.defines,
+                                             command.undefines))
+            return Settings(prefixes=tuple(command.include_paths),
+                            preamble_only=args.preamble_only,
+                            quote_prefixes=tuple(command.quote_paths),
+                            macros=unit_macros)
+        commands = compdb.load(args.compdb)
+        for settings, group in itertools.groupby(commands, get_settings):
+            yield settings, unique((c.filename for c in group), seen)
+
+    pattern = compile_patterns(args.patterns)
+    for directory in args.directories:
+        path = os.path.realpath(directory)
+        rules = None
+        if args.excludes or args.exclude_regexes:
+            rules = ignore.Rules(path, args.excludes, args.exclude_regexes)
+        settings = Settings(prefixes=tuple([path] + args.prefixes),
+                            preamble_only=args.preamble_only,
+                            quote_prefixes=(),
+                            macros=macros)
+        filenames = glob(path, pattern, rules, args.gitignore)
+        if counters is not None:
+            filenames = timed(filenames, counters, 'traversal_seconds')
+        yield settings, unique(filenames, seen)
+
+
+def check_arguments(args, scan_resolver=None):
+    '''
+    Checks that the arguments of a scan can be used together.
+
+    Revisions are read through a single git process, in this process and
+    without the scan cache (whose entries are checked against the working
+    tree).
+
+    Args:
+        args: The arguments passed to the command line (or `ig.api`)
+        scan_resolver: The `Resolver` to scan with, if any
+
+    Raises:
+        ValueError: For arguments that cannot be combined.
+    '''
+    if args.rev is None:
+        return
+    if args.cache is not None:
+        raise ValueError('rev cannot be combined with cache')
+    if args.jobs != 1:
+        raise ValueError('rev cannot be combined with more than one job')
+    if scan_resolver is not None:
+        raise ValueError('rev cannot be combined with a persistent resolver')
 
 
-def walk(graph, args):
+def record_sizes(graph, counters):
+    '''
+    Records the size of every file in the graph, as the source of the scan
+    (the working tree or a revision) has it.
+
+    Includes that could not be resolved are left at zero.
+
+    Args:
+        graph: The populated graph
+        counters: A `collections.Counter` to add the time spent to
+    '''
+    start = timeit.default_timer()
+    for node_id in graph.node_ids():
+        name = graph.names[node_id]
+        if os.path.isabs(name):
+            graph.sizes[node_id] = resolver.source.size(name)
+    counters['graph_seconds'] += timeit.default_timer() - start
+
+
+def walk(graph, args, counters=None, scan_resolver=None):
     '''
     Walks the file tree, populating the graph.
 
+    With a compilation database, its translation units are scanned along with
+    every file they (transitively) include, rather than everything under the
+    directories. Given a revision, files are read from git rather than from
+    the working tree, in this process only.
+
     Args:
         graph: The empty graph to populate
         args: The arguments passed to the command line
+        counters: An optional `collections.Counter` to accumulate statistics
+                  of the scan into (see `scan_batch()`), along with the time
+                  spent traversing directories and building the graph
+        scan_resolver: A `Resolver` to use in this process instead of the
+                       global one, e.g. to keep its memos between scans
 
     Returns:
         The (possibly) populated graph.
+
+    Raises:
+        ValueError: For arguments that cannot be combined (see
+                    `check_arguments()`).
     '''
-    for directory in args.directories:
-        # Swap pattern <-> filename loops if too inefficient
-        for pattern in args.patterns:
-            path = os.path.realpath(directory)
-            for filename in glob(path, pattern):
-                if os.path.isdir(filename):
-                    log.debug('%s is a directory, skipping', filename)
-                    continue
-                includes = get_includes(filename, [path] + args.prefixes)
-                graph.add(filename, includes)
+    global resolver
+
+    check_arguments(args, scan_resolver)
+    if counters is None:
+        counters = collections.Counter()
+    scan_cache = None
+    if args.cache is not None:
+        scan_cache = cache.Cache(args.cache, args.cache_hash)
+
+    revision = None
+    pool = None
+    completed = False
+    previous = resolver
+    if args.rev is not None:
+        directory = args.directories[0] if args.directories else os.getcwd()
+        revision = git.Revision(directory, args.rev)
+        resolver = Resolver(revision)
+    else:
+        resolver = scan_resolver or resolver
+        pool = create_pool(args.jobs)
+    try:
+        if args.compdb is not None:
+            results = follow(sources(args, counters),
+                             pool,
+                             scan_cache,
+                             counters)
+        else:
+            results = (item
+                       for settings, filenames in sources(args, counters)
+                       for item in scan(filenames,
+                                        settings,
+                                        pool,
+                                        scan_cache,
+                                        counters))
+        for filename, includes in results:
+            start = timeit.default_timer()
+            graph.add(filename, includes)
+            counters['graph_seconds'] += timeit.default_timer() - start
+        record_sizes(graph, counters)
+        completed = True
+    finally:
+        if pool is not None:
+            if completed:
+                pool.close()
+                pool.join()
+            else:
+                # Don't wait for the batches still queued
+                pool.terminate()
+        if scan_cache is not None:
+            scan_cache.close()
+        if revision is not None:
+            revision.close()
+        resolver = previous
 
+    log.debug('Include resolution: %d hits, %d misses',
+              counters['resolution_hits'],
+              counters['resolution_misses'])
     log.debug('Resulting graph: %s', repr(graph))
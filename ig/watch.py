@@ -0,0 +1,255 @@
+'''Watches the scanned directories and patches the graph when files change.'''
+
+import logging
+import os
+import threading
+import time
+
+from ig import graph, walk
+
+log = logging.getLogger(__name__)
+
+
+def status(filename, settings):
+    '''
+    Returns:
+        A (settings, modification time, size) tuple for a file, or None if
+        it does not exist.
+    '''
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return settings, stat.st_mtime, stat.st_size
+
+
+def snapshot(args, followed=None):
+    '''
+    Takes a snapshot of the state of all files that would be scanned.
+
+    Args:
+        args: The arguments passed to the command line
+        followed: A map from the files scanned because they were included
+                  (with --compdb) to the settings they were scanned with
+
+    Returns:
+        A map from filename to a (settings, modification time, size) tuple.
+    '''
+    files = {}
+    for settings, filenames in walk.sources(args):
+        for filename in filenames:
+            state = status(filename, settings)
+            if state is not None:
+                files[filename] = state
+    for filename, settings in (followed or {}).items():
+        if filename not in files:
+            state = status(filename, settings)
+            if state is not None:
+                files[filename] = state
+    return files
+
+
+def followed_files(include_graph, groups):
+    '''
+    Recovers which files a scan with --compdb followed, and their settings.
+
+    Like `walk.follow()`, this goes through the includes round by round, and
+    every file gets the settings of the first file found including it.
+
+    Args:
+        include_graph: The graph of the scan
+        groups: The (settings, filenames) tuples the scan started from
+
+    Returns:
+        A map from the followed files to their settings.
+    '''
+    followed = {}
+    seen = set()
+    pending = []
+    for settings, filenames in groups:
+        for filename in filenames:
+            if filename not in seen:
+                seen.add(filename)
+                pending.append((filename, settings))
+    while pending:
+        following = []
+        for filename, settings in pending:
+            node_id = include_graph.ids.get(filename)
+            if node_id is None or include_graph.nodes[node_id].edges is None:
+                continue
+            for edge_id in include_graph.nodes[node_id].edges:
+                target = include_graph.targets[edge_id]
+                include = include_graph.names[target]
+                # Only files that were scanned themselves were followed
+                if include not in seen and \
+                   include_graph.nodes[target].edges is not None:
+                    seen.add(include)
+                    followed[include] = settings
+                    following.append((include, settings))
+        pending = following
+    return followed
+
+
+def stale_includers(include_graph, added, removed):
+    '''
+    Finds the files whose includes may resolve differently now that files
+    were added or removed.
+
+    These are the files including a removed file, and those with an include
+    that could not be resolved (and is thus left as written) but names the
+    end of the path of an added file.
+
+    Args:
+        include_graph: The graph
+        added: The files that were added
+        removed: The files that were removed
+
+    Returns:
+        The set of names of these files.
+    '''
+    suffixes = set()
+    for filename in added:
+        parts = filename.split(os.sep)
+        suffixes.update(os.sep.join(parts[i:]) for i in range(1, len(parts)))
+
+    stale_ids = set(include_graph.ids[f]
+                    for f in removed if f in include_graph.ids)
+    if suffixes:
+        for node_id in include_graph.node_ids():
+            name = include_graph.names[node_id]
+            if not os.path.isabs(name) and os.path.normpath(name) in suffixes:
+                stale_ids.add(node_id)
+
+    stale = set()
+    if stale_ids:
+        for edge_id in include_graph.edge_ids():
+            if include_graph.targets[edge_id] in stale_ids:
+                source = include_graph.sources[edge_id]
+                stale.add(include_graph.names[source])
+    return stale
+
+
+class Watcher(threading.Thread):
+    '''
+    Polls the scanned directories for changes and patches the graph.
+
+    Polling (rather than e.g. inotify) keeps us free of dependencies and works
+    the same on every platform and file system, including network mounts.
+    With --compdb, the files followed from the translation units are polled
+    too, and files that changed files newly include are followed.
+    '''
+
+    def __init__(self, include_graph, args, on_change, interval, lock=None):
+        '''
+        Constructor.
+
+        Args:
+            include_graph: The (populated) graph to keep up to date
+            args: The arguments passed to the command line
+            on_change: A callback invoked with a `graph.Delta` after every
+                       batch of changes was applied to the graph
+            interval: The number of seconds to wait between polls
+            lock: A lock to hold while modifying the graph, if any
+        '''
+        super(Watcher, self).__init__(name='ig-watcher')
+        self.daemon = True
+        self.graph = include_graph
+        self.args = args
+        self.on_change = on_change
+        self.interval = interval
+        self.lock = lock or threading.Lock()
+        self.followed = {}
+        if args.compdb is not None:
+            self.followed = followed_files(include_graph, walk.sources(args))
+        self.files = snapshot(args, self.followed)
+        self.stopped = threading.Event()
+
+    def run(self):
+        '''Polls for changes until stopped.'''
+        log.info('Watching %d files for changes', len(self.files))
+        while not self.stopped.wait(self.interval):
+            start = time.time()
+            with self.lock:
+                delta = self.poll()
+            if not delta.is_empty:
+                log.debug('Applied changes in %.3fs', time.time() - start)
+                self.on_change(delta)
+
+    def poll(self):
+        '''
+        Compares the current state of the files with the last snapshot.
+
+        Returns:
+            A `graph.Delta` of all changes made to the graph.
+        '''
+        files = snapshot(self.args, self.followed)
+        changed = [f for f in files if self.files.get(f) != files[f]]
+        removed = [f for f in self.files if f not in files]
+
+        # New or deleted files may change how includes resolve, so files
+        # including them (or what could not be resolved before) are rescanned
+        added = [f for f in changed if f not in self.files]
+        if added or removed:
+            walk.resolver.invalidate(set(map(os.path.dirname, added + removed)))
+            stale = stale_includers(self.graph, added, removed)
+            stale.difference_update(changed)
+            changed.extend(sorted(f for f in stale if f in files))
+
+        delta = graph.Delta(self.graph)
+        for filename in removed:
+            log.debug('%s was removed', filename)
+            self.followed.pop(filename, None)
+            self.graph.remove(filename, delta)
+        # Grows while iterating, as files are followed
+        for filename in changed:
+            log.debug('%s changed', filename)
+            settings = files[filename][0]
+            try:
+                includes = walk.get_includes(filename,
+                                             settings.prefixes,
+                                             settings.preamble_only,
+                                             settings.quote_prefixes,
+                                             settings.macros)
+            except (IOError, OSError):
+                # Deleted in the meantime
+                del files[filename]
+                self.followed.pop(filename, None)
+                self.graph.remove(filename, delta)
+                continue
+            self.graph.update(filename, sorted(includes), delta)
+            self.graph.sizes[self.graph.ids[filename]] = files[filename][2]
+            if self.args.compdb is not None:
+                changed.extend(self.follow(includes, settings, files))
+
+        self.files = files
+
+        return delta
+
+    def follow(self, includes, settings, files):
+        '''
+        Starts watching the included files that were not scanned yet.
+
+        Args:
+            includes: The includes of a changed file
+            settings: The settings the changed file was scanned with
+            files: The current snapshot, extended in place
+
+        Returns:
+            The list of newly followed files, which need to be scanned.
+        '''
+        followed = []
+        for include in includes:
+            # Includes that could not be resolved are left as written
+            if include in files or not os.path.isabs(include):
+                continue
+            state = status(include, settings)
+            if state is not None and os.path.isfile(include):
+                log.debug('Following %s', include)
+                self.followed[include] = settings
+                files[include] = state
+                followed.append(include)
+        return followed
+
+    def stop(self):
+        '''Stops watching (after the current poll).'''
+        self.stopped.set()
@@ -49,7 +49,7 @@ setup(
         'Programming Language :: Python :: 3.5'
     ],
     keywords='visualization C++ tool',
-    packages=find_packages(exclude=['www']),
+    packages=find_packages(exclude=['www', 'benchmarks', 'tests']),
     include_package_data=True,
     package_data=dict(ig=[
         '../README.md',
@@ -58,5 +58,7 @@ setup(
         '../www/sigma/*'
     ]),
 
+    extras_require=dict(layout=['numpy'], brotli=['brotli']),
+
     entry_points=dict(console_scripts=['ig = ig.main:main'])
 )
@@ -0,0 +1,47 @@
+'''Fixtures shared by the tests.'''
+
+import os
+
+import pytest
+
+
+@pytest.fixture
+def root(tmp_path):
+    '''
+    Returns:
+        A fresh temporary directory, without symbolic links in its path (so
+        that it matches the names of scanned files).
+    '''
+    return os.path.realpath(str(tmp_path))
+
+
+@pytest.fixture
+def write(root):
+    '''
+    Returns:
+        A function that writes a file under `root` and returns its path.
+    '''
+    def write_file(path, contents='', touch=False):
+        '''
+        Writes a file, creating its directory if necessary.
+
+        Args:
+            path: The path of the file, relative to `root`
+            contents: The contents of the file
+            touch: Whether to move the modification time into the future, so
+                   that the change surely shows when polling
+
+        Returns:
+            The absolute path of the file.
+        '''
+        path = os.path.join(root, path)
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as source:
+            source.write(contents)
+        if touch:
+            later = os.stat(path).st_mtime + 10
+            os.utime(path, (later, later))
+        return path
+    return write_file
@@ -0,0 +1,99 @@
+'''Tests the programmatic interface.'''
+
+import os
+import subprocess
+
+import pytest
+
+import ig
+from ig import analysis, api, main
+
+
+@pytest.fixture
+def tree(root, write):
+    write(os.path.join('inc', 'a.hpp'))
+    write(os.path.join('src', 'main.cpp'), '#include <a.hpp>\n')
+    return root
+
+
+def test_scan(tree):
+    include_graph = ig.scan(tree, prefixes=[os.path.join(tree, 'inc')])
+    assert include_graph.node_count == 2
+    assert include_graph.edge_count == 1
+
+
+def test_scanner(tree):
+    scanner = api.Scanner()
+    for _ in range(2):
+        include_graph = scanner.scan(tree, prefixes=os.path.join(tree, 'inc'))
+        assert include_graph.edge_count == 1
+
+
+def test_unknown_option(tree):
+    with pytest.raises(TypeError):
+        ig.scan(tree, prefix='inc')
+
+
+def test_invalid_combinations(tree):
+    cache = os.path.join(tree, 'cache.db')
+    with pytest.raises(ValueError):
+        ig.scan(tree, rev='HEAD', cache=cache)
+    with pytest.raises(ValueError):
+        ig.scan(tree, rev='HEAD', jobs=2)
+    with pytest.raises(ValueError):
+        ig.scan(tree, rev='HEAD', jobs=0)
+    with pytest.raises(ValueError):
+        api.Scanner().scan(tree, rev='HEAD')
+    # The command line shares the checks
+    with pytest.raises(SystemExit):
+        main.parse_arguments([tree, '--rev', 'HEAD', '--cache', cache])
+
+
+def commit(tree, *paths):
+    try:
+        subprocess.check_call(['git', 'init', '-q', tree])
+        if paths:
+            subprocess.check_call(['git', 'add'] + list(paths), cwd=tree)
+        subprocess.check_call(['git', '-c', 'user.name=ig',
+                               '-c', 'user.email=ig@example.com',
+                               'commit', '-q', '--allow-empty', '-m', 'a'],
+                              cwd=tree)
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip('git is not available')
+
+
+def test_rev(tree):
+    commit(tree)
+    include_graph = ig.scan(tree, prefixes=[os.path.join(tree, 'inc')],
+                            rev='HEAD')
+    assert include_graph.is_empty
+
+
+def test_rev_sizes_are_those_of_the_revision(tree, write):
+    header = write(os.path.join('inc', 'a.hpp'), '#pragma once\n')
+    commit(tree, header, os.path.join(tree, 'src', 'main.cpp'))
+    write(header, '// Not committed\n')
+
+    prefixes = [os.path.join(tree, 'inc')]
+    include_graph = ig.scan(tree, prefixes=prefixes, rev='HEAD')
+    assert include_graph.sizes[include_graph.ids[header]] == 13
+    source = os.path.join(tree, 'src', 'main.cpp')
+    costs = dict((c['file'], c['bytes'])
+                 for c in analysis.costs(include_graph))
+    assert costs[source] == 13 + len('#include <a.hpp>\n')
+
+    include_graph = ig.scan(tree, prefixes=prefixes)
+    assert include_graph.sizes[include_graph.ids[header]] == 17
+
+
+def test_scans_see_added_headers(root, write):
+    source = write('main.cpp', '#include "a.hpp"\n')
+    include_graph = ig.scan(root)
+    assert 'a.hpp' in include_graph.ids
+
+    header = write('a.hpp')
+    include_graph = ig.scan(root)
+    edge_id = include_graph.edge(include_graph.ids[source],
+                                 include_graph.ids[header])
+    assert edge_id is not None
+    assert 'a.hpp' not in include_graph.ids
@@ -0,0 +1,56 @@
+'''Tests the scan cache.'''
+
+import os
+
+import pytest
+
+from ig import api, cache
+
+
+@pytest.fixture
+def database(root):
+    return os.path.join(root, 'cache', 'scan.db')
+
+
+def test_directives_round_trip(write, database):
+    source = write('main.cpp')
+    directives = [(True, 'a.hpp'), (False, 'vector'), (True, 'a.hpp')]
+    with cache.Cache(database) as scan_cache:
+        assert scan_cache.lookup(source, 'settings') is None
+        scan_cache.store(source, 'settings', directives)
+    with cache.Cache(database) as scan_cache:
+        assert scan_cache.lookup(source, 'settings') == directives
+        assert scan_cache.lookup(source, 'other settings') is None
+
+
+def test_changed_files_are_stale(write, database):
+    source = write('main.cpp')
+    with cache.Cache(database) as scan_cache:
+        scan_cache.lookup(source, 'settings')
+        scan_cache.store(source, 'settings', [])
+    write('main.cpp', '#include "a.hpp"\n')
+    with cache.Cache(database) as scan_cache:
+        assert scan_cache.lookup(source, 'settings') is None
+
+
+def test_touched_files_are_verified_by_hash(write, database):
+    source = write('main.cpp', '#include "a.hpp"\n')
+    with cache.Cache(database, verify_hash=True) as scan_cache:
+        scan_cache.lookup(source, 'settings')
+        scan_cache.store(source, 'settings', [(True, 'a.hpp')])
+    write('main.cpp', '#include "a.hpp"\n', touch=True)
+    with cache.Cache(database, verify_hash=True) as scan_cache:
+        assert scan_cache.lookup(source, 'settings') == [(True, 'a.hpp')]
+
+
+def test_headers_added_later_are_resolved(root, write, database):
+    source = write('main.cpp', '#include "gen.h"\n')
+    include_graph = api.scan(root, cache=database)
+    assert 'gen.h' in include_graph.ids
+
+    # The includer did not change, but where its include resolves to did
+    header = write('gen.h')
+    include_graph = api.scan(root, cache=database)
+    assert include_graph.edge(include_graph.ids[source],
+                              include_graph.ids[header]) is not None
+    assert 'gen.h' not in include_graph.ids
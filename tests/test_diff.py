@@ -0,0 +1,59 @@
+'''Tests comparing graphs with `ig diff`.'''
+
+import pytest
+
+from ig import api, diff, main
+
+
+def make_graph(edges):
+    include_graph = api.new_graph(api.make_options())
+    for source, targets in edges:
+        include_graph.add(source, targets)
+    return include_graph
+
+
+@pytest.fixture
+def graphs():
+    old = make_graph([('/old/a.cpp', ['/old/b.hpp']),
+                      ('/old/b.hpp', []),
+                      ('/old/c.hpp', [])])
+    new = make_graph([('/new/a.cpp', ['/new/b.hpp']),
+                      ('/new/b.hpp', ['/new/c.hpp']),
+                      ('/new/c.hpp', ['/new/b.hpp'])])
+    return old, ['/old'], new, ['/new']
+
+
+def test_compare(graphs):
+    result = diff.compare(*graphs)
+    assert result['addedEdges'] == [('b.hpp', 'c.hpp'), ('c.hpp', 'b.hpp')]
+    assert result['growth'][0]['file'] == 'a.cpp'
+    assert result['newCycleCount'] == 1
+
+
+@pytest.mark.parametrize('limit', [None, 0])
+def test_thresholds_ignore_limit(graphs, limit):
+    result = diff.compare(*graphs, limit=limit)
+    violations = diff.check(result,
+                            max_added_edges=1,
+                            max_growth=0,
+                            max_new_cycles=0)
+    assert len(violations) == 3
+    assert result['growthCount'] == 3
+    if limit == 0:
+        assert result['growth'] == []
+        assert result['addedEdges'] == []
+
+
+def test_thresholds_pass(graphs):
+    result = diff.compare(*graphs, limit=0)
+    assert diff.check(result, 2, 2, 1) == []
+
+
+def test_missing_paths_are_neither_files_nor_revisions(root, monkeypatch,
+                                                       capsys):
+    monkeypatch.chdir(root)
+    assert main.run_diff(['missing', root]) == 2
+    assert capsys.readouterr().out == ''
+    with pytest.raises(IOError) as error:
+        main.read_graph('missing', [])
+    assert 'No such file or revision' in str(error.value)
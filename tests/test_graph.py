@@ -0,0 +1,51 @@
+'''Tests the include graph.'''
+
+from ig import api, graph
+
+
+def make_graph():
+    return api.new_graph(api.make_options())
+
+
+def test_repeated_neighbors_are_weighted():
+    include_graph = make_graph()
+    include_graph.add('/a.cpp', ['/b.hpp', '/c.hpp', '/b.hpp'])
+    assert include_graph.edge_count == 2
+    b = include_graph.edge(include_graph.ids['/a.cpp'],
+                           include_graph.ids['/b.hpp'])
+    c = include_graph.edge(include_graph.ids['/a.cpp'],
+                           include_graph.ids['/c.hpp'])
+    assert include_graph.weights[b] == 2
+    assert include_graph.weights[c] == 1
+
+
+def test_update_changes_weights_in_place():
+    include_graph = make_graph()
+    include_graph.add('/a.cpp', ['/b.hpp'])
+    edge_id = include_graph.edge(include_graph.ids['/a.cpp'],
+                                 include_graph.ids['/b.hpp'])
+
+    delta = graph.Delta(include_graph)
+    include_graph.update('/a.cpp', ['/b.hpp', '/b.hpp'], delta)
+    assert include_graph.edge_count == 1
+    assert include_graph.edge(include_graph.ids['/a.cpp'],
+                              include_graph.ids['/b.hpp']) == edge_id
+    assert include_graph.weights[edge_id] == 2
+    assert not delta.is_empty
+
+
+def test_retagging_cycles_records_every_changed_member():
+    include_graph = make_graph()
+    include_graph.add('/a.hpp', ['/b.hpp'])
+    include_graph.add('/b.hpp', ['/c.hpp'])
+    include_graph.add('/c.hpp', ['/a.hpp'])
+    a, b, c = (include_graph.ids[n] for n in ('/a.hpp', '/b.hpp', '/c.hpp'))
+    include_graph.tag_cycles([[a, b, c]])
+
+    # Breaking the cycle at one file untags all of its members
+    delta = graph.Delta(include_graph)
+    include_graph.update('/c.hpp', [], delta)
+    assert b not in delta.nodes
+    include_graph.tag_cycles([], delta)
+    assert delta.nodes == set([a, b, c])
+    assert 'cycle' not in include_graph.node_json(b)
@@ -0,0 +1,82 @@
+'''Tests skipping ignored files and directories.'''
+
+import os
+
+import pytest
+
+from ig import ignore, walk
+
+
+def match(rules, root, path, is_directory=False):
+    return ignore.Rules(root, rules).match(os.path.join(root, path),
+                                           is_directory)
+
+
+def glob(root, rules=None, gitignore=True):
+    pattern = walk.compile_patterns(['*.hpp'])
+    return sorted(os.path.relpath(path, root)
+                  for path in walk.glob(root, pattern, rules, gitignore))
+
+
+@pytest.mark.parametrize('path, is_directory, expected', [
+    ('build', True, True),
+    ('build', False, True),
+    (os.path.join('src', 'build'), True, None),
+])
+def test_anchored(root, path, is_directory, expected):
+    assert match(['/build'], root, path, is_directory) is expected
+
+
+@pytest.mark.parametrize('path, is_directory, expected', [
+    ('out', True, True),
+    (os.path.join('a', 'out'), True, True),
+    ('out', False, None),
+])
+def test_directories_only(root, path, is_directory, expected):
+    assert match(['out/'], root, path, is_directory) is expected
+
+
+@pytest.mark.parametrize('path, expected', [
+    (os.path.join('gen', 'a.hpp'), True),
+    (os.path.join('a', 'b', 'gen', 'a.hpp'), True),
+    (os.path.join('gen', 'a.cpp'), None),
+    (os.path.join('gen', 'sub', 'a.hpp'), None),
+])
+def test_leading_double_star(root, path, expected):
+    assert match(['**/gen/*.hpp'], root, path) is expected
+
+
+@pytest.mark.parametrize('path, is_directory, expected', [
+    (os.path.join('vendor', 'a.hpp'), False, True),
+    (os.path.join('vendor', 'a', 'b'), True, True),
+    ('vendor', True, None),
+    (os.path.join('src', 'vendor', 'a.hpp'), False, None),
+])
+def test_trailing_double_star(root, path, is_directory, expected):
+    assert match(['vendor/**'], root, path, is_directory) is expected
+
+
+def test_negation_in_nested_files(write):
+    root = os.path.dirname(write('.gitignore', '*.gen.hpp\nskip/\n'))
+    write(os.path.join('sub', '.gitignore'), '!keep.gen.hpp\n')
+    for path in ('a.gen.hpp',
+                 'a.hpp',
+                 os.path.join('skip', 'a.hpp'),
+                 os.path.join('sub', 'keep.gen.hpp'),
+                 os.path.join('sub', 'other.gen.hpp')):
+        write(path)
+    assert glob(root) == ['a.hpp', os.path.join('sub', 'keep.gen.hpp')]
+    # Inner rules only apply under their directory
+    write(os.path.join('sub', '.gitignore'), '!a.gen.hpp\n', touch=True)
+    assert glob(root) == ['a.hpp']
+
+
+def test_excludes_take_precedence_over_gitignore(root, write):
+    write('.gitignore', 'ignored.hpp\n!excluded.hpp\n')
+    for path in ('excluded.hpp', 'ignored.hpp', 'kept.hpp'):
+        write(path)
+    excludes = ignore.Rules(root, ['excluded.hpp'])
+    assert glob(root, excludes) == ['kept.hpp']
+    assert glob(root, excludes, gitignore=False) == ['ignored.hpp',
+                                                     'kept.hpp']
+    assert glob(root) == ['excluded.hpp', 'kept.hpp']
@@ -0,0 +1,104 @@
+'''Tests evaluating preprocessor conditionals.'''
+
+import pytest
+
+from ig import preprocessor
+
+CONDITIONAL = b'''
+#ifdef FEATURE
+#include "feature.hpp"
+#else
+#include "fallback.hpp"
+#endif
+'''
+
+CHAIN = b'''
+#if VERSION == 1
+#include "one.hpp"
+#elif VERSION == 2
+#include "two.hpp"
+#elif defined(LEGACY)
+#include "legacy.hpp"
+#else
+#include "other.hpp"
+#endif
+'''
+
+NESTED = b'''
+#ifdef OUTER
+#  ifdef INNER
+#    include "both.hpp"
+#  else
+#    include "outer.hpp"
+#  endif
+#else
+#  ifdef INNER
+#    include "inner.hpp"
+#  endif
+#endif
+'''
+
+GUARDED = b'''
+#ifndef GUARDED_HPP
+#define GUARDED_HPP
+#include "guarded.hpp"
+#endif
+'''
+
+
+def includes(source, defines=(), undefines=()):
+    macros = preprocessor.make_macros(defines, undefines)
+    return [path for _, path in preprocessor.extract_includes(source, macros)]
+
+
+@pytest.mark.parametrize('defines, undefines, expected', [
+    (['FEATURE'], [], ['feature.hpp']),
+    (['FEATURE=0'], [], ['feature.hpp']),
+    ([], ['FEATURE'], ['fallback.hpp']),
+    ([], [], ['feature.hpp', 'fallback.hpp']),
+])
+def test_ifdef(defines, undefines, expected):
+    assert includes(CONDITIONAL, defines, undefines) == expected
+
+
+@pytest.mark.parametrize('defines, undefines, expected', [
+    (['VERSION=1'], [], ['one.hpp']),
+    (['VERSION=2'], [], ['two.hpp']),
+    (['VERSION=3', 'LEGACY'], [], ['legacy.hpp']),
+    (['VERSION=3'], ['LEGACY'], ['other.hpp']),
+    # Once a branch is known to be taken, the rest are skipped
+    ([], ['LEGACY'], ['one.hpp', 'two.hpp', 'other.hpp']),
+    (['LEGACY'], [], ['one.hpp', 'two.hpp', 'legacy.hpp']),
+])
+def test_elif_chain(defines, undefines, expected):
+    assert includes(CHAIN, defines, undefines) == expected
+
+
+@pytest.mark.parametrize('defines, undefines, expected', [
+    (['OUTER', 'INNER'], [], ['both.hpp']),
+    (['OUTER'], ['INNER'], ['outer.hpp']),
+    (['INNER'], ['OUTER'], ['inner.hpp']),
+    (['OUTER'], [], ['both.hpp', 'outer.hpp']),
+    # An unknown branch nested in a dead one is dead
+    ([], ['OUTER'], ['inner.hpp']),
+    ([], [], ['both.hpp', 'outer.hpp', 'inner.hpp']),
+])
+def test_nested(defines, undefines, expected):
+    assert includes(NESTED, defines, undefines) == expected
+
+
+@pytest.mark.parametrize('defines', [[], ['GUARDED_HPP']])
+def test_include_guard_is_taken(defines):
+    assert includes(GUARDED, defines) == ['guarded.hpp']
+
+
+def test_defines_in_the_file_apply_to_the_rest_of_it():
+    source = b'#define VERSION 2\n' + CHAIN
+    assert includes(source, undefines=['VERSION']) == ['two.hpp']
+    source = b'#undef FEATURE\n' + CONDITIONAL
+    assert includes(source, defines=['FEATURE']) == ['fallback.hpp']
+
+
+def test_conditions_that_cannot_be_parsed_are_unknown():
+    source = b'#if __has_include(<optional>)\n#include <optional>\n#endif\n'
+    assert includes(source) == ['optional']
@@ -0,0 +1,27 @@
+'''Tests writing the payload served to the visualization.'''
+
+import gzip
+import os
+
+from ig import serve
+
+
+def read(path, opener=open):
+    with opener(path, 'rb') as source:
+        return source.read()
+
+
+def test_compressed_copies_are_never_stale(root):
+    server = serve.Server(root)
+    path = os.path.join(root, 'graph.json')
+
+    server.write(dict(version=1), None)
+    assert read(path + '.gz', gzip.open) == read(path)
+
+    server.write(dict(version=2), None, compressed=False)
+    for _, suffix in serve.ENCODINGS:
+        assert not os.path.exists(path + suffix)
+
+    server.compress()
+    assert b'2' in read(path)
+    assert read(path + '.gz', gzip.open) == read(path)
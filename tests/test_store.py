@@ -0,0 +1,84 @@
+'''Tests saving and loading graphs.'''
+
+import os
+import struct
+
+import pytest
+
+from ig import api, graph, store
+
+
+def make_graph():
+    return api.new_graph(api.make_options())
+
+
+def contents(include_graph):
+    nodes = sorted((include_graph.names[n],
+                    include_graph.nodes[n].edges is not None,
+                    include_graph.in_degrees[n],
+                    include_graph.sizes[n],
+                    include_graph.xs[n],
+                    include_graph.ys[n])
+                   for n in include_graph.node_ids())
+    edges = sorted((include_graph.names[include_graph.sources[e]],
+                    include_graph.names[include_graph.targets[e]],
+                    include_graph.weights[e])
+                   for e in include_graph.edge_ids())
+    return nodes, edges
+
+
+@pytest.fixture
+def saved(root):
+    include_graph = make_graph()
+    # A cycle, a repeated include and an include that could not be resolved
+    include_graph.add('/a.hpp', ['/b.hpp', '/b.hpp', 'missing.hpp'])
+    include_graph.add('/b.hpp', ['/a.hpp'])
+    include_graph.add('/main.cpp', ['/a.hpp', '/c.hpp'])
+    # A hole left by a removed node
+    include_graph.add('/old.cpp', ['/a.hpp'])
+    include_graph.remove('/old.cpp', graph.Delta(include_graph))
+    for node_id, name in enumerate(include_graph.names):
+        include_graph.sizes[node_id] = len(name)
+
+    path = os.path.join(root, 'graph.igb')
+    store.save(include_graph, path, dict(directories=['/']))
+    return include_graph, path
+
+
+def test_round_trip(saved):
+    include_graph, path = saved
+    loaded = make_graph()
+    assert store.load(loaded, path) == dict(directories=['/'])
+    assert contents(loaded) == contents(include_graph)
+    assert loaded.node_count == 5
+    assert loaded.edge_count == 5
+
+    a, b = loaded.ids['/a.hpp'], loaded.ids['/b.hpp']
+    assert loaded.weights[loaded.edge(a, b)] == 2
+    assert loaded.nodes[loaded.ids['missing.hpp']].edges is None
+
+
+def overwrite(path, offset, data):
+    with open(path, 'r+b') as stream:
+        stream.seek(offset)
+        stream.write(data)
+
+
+def truncate(path, length):
+    with open(path, 'r+b') as stream:
+        stream.truncate(length)
+
+
+@pytest.mark.parametrize('corrupt, message', [
+    (lambda path: overwrite(path, 0, b'PNG\0'), 'not a graph file'),
+    (lambda path: overwrite(path, 4, struct.pack('<I', 99)), 'version 99'),
+    (lambda path: overwrite(path, 24, b'\xff'), 'corrupt metadata'),
+    (lambda path: truncate(path, 100), 'truncated'),
+    (lambda path: truncate(path, 0), 'empty'),
+])
+def test_corrupt_files_are_rejected(saved, corrupt, message):
+    _, path = saved
+    corrupt(path)
+    with pytest.raises(store.FormatError) as error:
+        store.load(make_graph(), path)
+    assert message in str(error.value)
@@ -0,0 +1,50 @@
+'''Tests scanning files for includes.'''
+
+import os
+
+import pytest
+
+from ig import api, walk
+
+
+@pytest.fixture
+def tree(write):
+    header = write('a.hpp')
+    source = write('main.cpp', '#include "a.hpp"\n#include "a.hpp"\n')
+    return source, header
+
+
+def weight(include_graph, source, target):
+    edge_id = include_graph.edge(include_graph.ids[source],
+                                 include_graph.ids[target])
+    return include_graph.weights[edge_id]
+
+
+def test_repeated_include_is_weighted(root, tree):
+    include_graph = api.scan(root)
+    assert include_graph.edge_count == 1
+    assert weight(include_graph, *tree) == 2
+
+
+def test_cache_keeps_multiplicity(root, tree):
+    cache = os.path.join(root, 'cache.db')
+    for _ in range(2):
+        include_graph = api.scan(root, patterns='*.cpp', cache=cache)
+        assert weight(include_graph, *tree) == 2
+
+
+class CaseInsensitiveFileSystem(walk.FileSystem):
+    def is_file(self, path):
+        directory, name = os.path.split(path)
+        return name.lower() in [e.lower() for e in os.listdir(directory)]
+
+
+def test_resolution_ignores_case_where_the_file_system_does(root, write):
+    write('Config.hpp')
+    resolver = walk.Resolver()
+    assert resolver.resolve('config.hpp', (root,)) == 'config.hpp'
+
+    resolver = walk.Resolver(CaseInsensitiveFileSystem())
+    path = os.path.join(root, 'config.hpp')
+    assert resolver.resolve('config.hpp', (root,)) == path
+    assert resolver.resolve('other.hpp', (root,)) == 'other.hpp'
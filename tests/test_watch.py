@@ -0,0 +1,109 @@
+'''Tests watching trees for changes.'''
+
+import json
+import os
+import threading
+import time
+
+from ig import api, main, serve, watch
+
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+
+
+def test_serving_keeps_relative_paths(root, write, monkeypatch):
+    write(os.path.join('inc', 'a.hpp'))
+    write(os.path.join('inc', 'b.hpp'))
+    write(os.path.join('src', 'main.cpp'), '#include <a.hpp>\n')
+    monkeypatch.chdir(root)
+
+    args = main.parse_arguments(['-I', 'inc', '.', '--watch'])
+    include_graph = api.build(args)
+    assert include_graph.node_count == 3
+    assert include_graph.edge_count == 1
+
+    watcher = watch.Watcher(include_graph, args, lambda delta: None, 1)
+    with serve.Server(None) as server:
+        server.write({}, include_graph)
+        thread = threading.Thread(target=server.run,
+                                  args=(False, 0, None, None, 'localhost'))
+        thread.daemon = True
+        thread.start()
+        while server.http_server is None:
+            time.sleep(0.01)
+        try:
+            assert os.getcwd() == root
+            assert watcher.poll().is_empty
+            assert include_graph.node_count == 3
+
+            write(os.path.join('src', 'main.cpp'),
+                  '#include <a.hpp>\n#include <b.hpp>\n',
+                  touch=True)
+            assert not watcher.poll().is_empty
+            assert include_graph.node_count == 3
+            assert include_graph.edge_count == 2
+
+            port = server.http_server.server_address[1]
+            url = 'http://localhost:{0}/graph.json'.format(port)
+            assert b'main.cpp' in urlopen(url).read()
+        finally:
+            server.http_server.shutdown()
+            thread.join()
+
+
+def test_followed_headers_are_watched(root, write):
+    include = os.path.join(root, 'inc')
+    write(os.path.join('inc', 'a.hpp'))
+    write(os.path.join('inc', 'b.hpp'))
+    write(os.path.join('inc', 'c.hpp'))
+    write('main.cpp', '#include <a.hpp>\n')
+    database = write('compile_commands.json', json.dumps([dict(
+        directory=root,
+        file='main.cpp',
+        arguments=['c++', '-Iinc', '-c', 'main.cpp'])]))
+
+    args = main.parse_arguments(['--compdb', database, '--watch'])
+    include_graph = api.build(args)
+    assert include_graph.edge_count == 1
+
+    watcher = watch.Watcher(include_graph, args, lambda delta: None, 1)
+    assert os.path.join(include, 'a.hpp') in watcher.files
+    assert watcher.poll().is_empty
+
+    # A header newly included by a followed header is followed too
+    write(os.path.join('inc', 'a.hpp'), '#include <b.hpp>\n', touch=True)
+    assert not watcher.poll().is_empty
+    assert include_graph.edge_count == 2
+
+    write(os.path.join('inc', 'b.hpp'), '#include <c.hpp>\n', touch=True)
+    assert not watcher.poll().is_empty
+    assert include_graph.edge_count == 3
+    assert watcher.poll().is_empty
+
+
+def test_headers_created_after_their_includers(root, write):
+    include = os.path.join(root, 'inc')
+    write('main.cpp', '#include <gen.hpp>\n')
+    args = main.parse_arguments(['-I', include, root, '--watch'])
+    include_graph = api.build(args)
+    main_id = include_graph.ids[os.path.join(root, 'main.cpp')]
+
+    def includes(name):
+        target = include_graph.ids[name]
+        return include_graph.edge(main_id, target) is not None
+
+    assert includes('gen.hpp')
+
+    watcher = watch.Watcher(include_graph, args, lambda delta: None, 1)
+    header = write(os.path.join('inc', 'gen.hpp'))
+    assert not watcher.poll().is_empty
+    assert includes(header)
+    assert 'gen.hpp' not in include_graph.ids
+
+    # Once it is gone again, the include is left unresolved
+    os.remove(header)
+    assert not watcher.poll().is_empty
+    assert includes('gen.hpp')
+    assert include_graph.edge_count == 1
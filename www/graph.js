@@ -2,6 +2,17 @@
 
 const $ = id => document.getElementById(id);
 
+// Nodes in include cycles are drawn in this color
+const cycleColor = 'rgb(220, 20, 60)';
+
+const layoutOptions = {
+  worker: true,
+  barnesHutOptimize: true,
+  adjustSizes: true,
+  slowDown: 20,
+  strongGravityMode: true
+};
+
 function createFilter(instance, settings) {
   // Initialize the Filter API
   const filter = new sigma.plugins.filter(instance);
@@ -22,6 +33,14 @@ function createFilter(instance, settings) {
       .apply();
   }
 
+  function applyCycleFilter(element) {
+    const onlyCycles = element.target.checked;
+    filter
+      .undo('cycles')
+      .nodesBy(node => !onlyCycles || node.cycle !== undefined, 'cycles')
+      .apply();
+  }
+
   function applyGroupFilter(element) {
     let group = element.target[element.target.selectedIndex].value;
     filter
@@ -35,6 +54,7 @@ function createFilter(instance, settings) {
   // for IE10+, that sucks
   $('min-degree').addEventListener('change', applyMinDegreeFilter);
   $('node-group').addEventListener('change', applyGroupFilter);
+  $('only-cycles').addEventListener('change', applyCycleFilter);
 
   let degree = settings.initialDegree;
   if (degree < 1) {
@@ -69,9 +89,245 @@ function visualizePane(graph, filter) {
   return maximumDegree;
 }
 
+function highlightCycle(node) {
+  if (node.cycle !== undefined) {
+    node.color = cycleColor;
+  }
+  return node;
+}
+
+function applyDelta(instance, delta) {
+  const graph = instance.graph;
+
+  delta.droppedEdges.forEach(id => {
+    if (graph.edges(id)) graph.dropEdge(id);
+  });
+  delta.droppedNodes.forEach(id => {
+    if (graph.nodes(id)) graph.dropNode(id);
+  });
+  delta.nodes.forEach(node => {
+    const existing = graph.nodes(node.id);
+    if (existing) {
+      // Keep the current position, but take over everything else.
+      ['size', 'color', 'label', 'group', 'cycle'].forEach(key => {
+        existing[key] = node[key];
+      });
+      highlightCycle(existing);
+    } else {
+      graph.addNode(highlightCycle(node));
+    }
+  });
+  delta.edges.forEach(edge => {
+    const existing = graph.edges(edge.id);
+    if (existing) {
+      existing.weight = edge.weight;
+    } else {
+      graph.addEdge(edge);
+    }
+  });
+
+  // The layout has to be restarted to pick up new nodes and edges.
+  if (instance.isForceAtlas2Running()) {
+    instance.killForceAtlas2();
+    instance.startForceAtlas2(layoutOptions);
+  }
+  instance.refresh();
+}
+
+function watch(instance) {
+  const source = new EventSource('events');
+  source.onmessage = event => applyDelta(instance, JSON.parse(event.data));
+}
+
+function fetchJSON(url, callback, onError) {
+  const request = new XMLHttpRequest();
+  request.open('GET', url);
+  request.onreadystatechange = () => {
+    if (request.readyState === XMLHttpRequest.DONE) {
+      if (request.status === 200) {
+        callback(JSON.parse(request.responseText));
+      } else {
+        console.error(url, request.status, request.responseText);
+        if (onError) onError();
+      }
+    }
+  };
+  request.send();
+}
+
+function restartLayout(instance, settings) {
+  if (instance.isForceAtlas2Running()) {
+    instance.killForceAtlas2();
+  }
+  if (!settings.layout) {
+    instance.startForceAtlas2(layoutOptions);
+  }
+  instance.refresh();
+}
+
+function mergeGraph(instance, graph) {
+  graph.nodes.forEach(node => {
+    if (!instance.graph.nodes(node.id)) {
+      instance.graph.addNode(highlightCycle(node));
+    }
+  });
+  graph.edges.forEach(edge => {
+    if (!instance.graph.edges(edge.id)) {
+      instance.graph.addEdge(edge);
+    }
+  });
+}
+
+function bindCycleToggle(instance) {
+  $('only-cycles').addEventListener('change', event => {
+    const onlyCycles = event.target.checked;
+    instance.graph.nodes().forEach(node => {
+      node.hidden = onlyCycles && node.cycle === undefined;
+    });
+    instance.refresh();
+  });
+}
+
+// Instead of filtering a graph loaded up front, asks the server for the nodes
+// matching the filters, and expands the neighborhood of nodes on click.
+function createQueries(instance, settings) {
+  let current = null;
+
+  function load(url) {
+    current = url;
+    fetchJSON(url, graph => {
+      if (url !== current) return;  // A newer query was made meanwhile.
+      instance.graph.clear();
+      mergeGraph(instance, graph);
+      restartLayout(instance, settings);
+    });
+  }
+
+  function query() {
+    const degree = $('min-degree').value;
+    const select = $('node-group');
+    const group = select[select.selectedIndex].value;
+    $('min-degree-val').textContent = degree;
+    if (group) {
+      load(`api/group?name=${encodeURIComponent(group)}&degree=${degree}`);
+    } else {
+      load(`api/top?degree=${degree}`);
+    }
+  }
+
+  fetchJSON('api/summary', summary => {
+    $('min-degree').max = summary.maxDegree;
+    $('max-degree-value').textContent = summary.maxDegree;
+
+    const nodeGroup = $('node-group');
+    summary.groups.forEach(group => {
+      let option = document.createElement('option');
+      option.text = group;
+      nodeGroup.add(option);
+    });
+
+    let degree = settings.initialDegree;
+    if (degree < 1) {
+      // Assume it's a fraction.
+      degree = Math.ceil(summary.maxDegree * degree);
+    }
+    $('min-degree').value = Math.min(summary.maxDegree, degree);
+    query();
+  });
+
+  // Only query once the slider is released, not for every step.
+  $('min-degree').addEventListener('input', event => {
+    $('min-degree-val').textContent = event.target.value;
+  });
+  $('min-degree').addEventListener('change', query);
+  $('node-group').addEventListener('change', query);
+  bindCycleToggle(instance);
+
+  instance.bind('clickNode', event => {
+    const id = encodeURIComponent(event.data.node.id);
+    fetchJSON(`api/neighborhood?node=${id}&depth=1`, graph => {
+      mergeGraph(instance, graph);
+      restartLayout(instance, settings);
+    });
+  });
+
+  // Called when the graph changed on the server.
+  return () => {
+    if (current) load(current);
+  };
+}
+
+// Shows the graph collapsed into clusters of directories. Clicking a cluster
+// expands it into its subdirectories and files, right-clicking a node collapses
+// the cluster it belongs to again.
+function createClusters(instance, settings) {
+  const expanded = new Set();
+  let last = null;
+
+  function load() {
+    const query = Array.from(expanded)
+      .map(cluster => `expand=${encodeURIComponent(cluster)}`)
+      .join('&');
+    fetchJSON(`api/clusters?${query}`, graph => {
+      // Keep nodes where they are, and put new ones where their cluster was.
+      const positions = {};
+      instance.graph.nodes().forEach(node => {
+        positions[node.id] = node;
+      });
+      graph.nodes.forEach(node => {
+        const old = positions[node.id];
+        const parent = positions[`cluster:${node.parent}`];
+        if (old) {
+          node.x = old.x;
+          node.y = old.y;
+        } else if (parent && !settings.layout) {
+          node.x = parent.x + Math.random() - 0.5;
+          node.y = parent.y + Math.random() - 0.5;
+        }
+      });
+      instance.graph.clear();
+      mergeGraph(instance, graph);
+      restartLayout(instance, settings);
+    }, () => {
+      // E.g. too many nodes: undo the last expansion.
+      expanded.delete(last);
+    });
+  }
+
+  instance.bind('clickNode', event => {
+    const cluster = event.data.node.cluster;
+    if (cluster !== undefined && !expanded.has(cluster)) {
+      expanded.add(cluster);
+      last = cluster;
+      load();
+    }
+  });
+  instance.bind('rightClickNode', event => {
+    const parent = event.data.node.parent;
+    if (expanded.has(parent)) {
+      expanded.delete(parent);
+      last = null;
+      load();
+    }
+  });
+  $('graph-container').addEventListener('contextmenu', event => {
+    event.preventDefault();
+  });
+
+  // Filters apply to files, which are only shown inside expanded clusters.
+  $('min-degree').disabled = true;
+  $('node-group').disabled = true;
+  bindCycleToggle(instance);
+
+  load();
+  return load;
+}
+
 function visualize(json) {
   console.log(json);
 
+  json.graph.nodes.forEach(highlightCycle);
+
   const instance = new sigma({
     graph: json.graph,
     renderer: {
@@ -83,15 +339,28 @@ function visualize(json) {
     }
   });
 
-  instance.startForceAtlas2({
-    worker: true,
-    barnesHutOptimize: true,
-    adjustSizes: true,
-    slowDown: 20,
-    strongGravityMode: true
-  });
+  // Cycles can only be filtered if the server tagged them.
+  $('cycles-pane').hidden = !json.settings.cycles;
 
-  createFilter(instance, json.settings);
+  // The server may have computed the layout for us already.
+  if (!json.settings.layout) {
+    instance.startForceAtlas2(layoutOptions);
+  }
+
+  if (json.settings.api) {
+    const reload = json.settings.clusters ?
+        createClusters(instance, json.settings) :
+        createQueries(instance, json.settings);
+    if (json.settings.watch) {
+      // Deltas may touch nodes we don't show, so just ask again.
+      new EventSource('events').onmessage = reload;
+    }
+  } else {
+    createFilter(instance, json.settings);
+    if (json.settings.watch) {
+      watch(instance);
+    }
+  }
 
   const drag = sigma.plugins.dragNodes(instance, instance.renderers[0]);
   drag.bind('startdrag', event => {